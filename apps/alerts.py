@@ -0,0 +1,220 @@
+import os
+import time
+
+# 温度低下アラートの解除幅（閾値 + この値まで戻ったら解除）
+TEMP_HYSTERESIS = float(os.getenv("TEMP_HYSTERESIS", "1.0"))
+# 状態が変わるまでに条件が続く必要のある時間（秒）
+ALERT_MIN_DWELL = float(os.getenv("ALERT_MIN_DWELL", "0"))
+# 温度変化率のアラート（℃/時，負の値で低下）と計算に使う期間（秒）
+TEMP_RATE_ALERT = float(os.getenv("TEMP_RATE_ALERT", "-3.0"))
+TEMP_RATE_WINDOW = float(os.getenv("TEMP_RATE_WINDOW", "1800"))
+# 湿度（%）
+HUMIDITY_HIGH = float(os.getenv("HUMIDITY_HIGH", "80"))
+HUMIDITY_LOW = float(os.getenv("HUMIDITY_LOW", "20"))
+HUMIDITY_HYSTERESIS = float(os.getenv("HUMIDITY_HYSTERESIS", "5"))
+# 電池残量（%）
+BATTERY_LOW = float(os.getenv("BATTERY_LOW", "20"))
+
+# 固定長のリングバッファ．期間外の古い値を捨てながら，最小二乗法の傾きをO(1)で求める
+class RingBuffer:
+    def __init__(self, capacity: int, window_seconds: float):
+        self.capacity = capacity
+        self.window = window_seconds
+        self.ts = [0.0] * capacity
+        self.values = [0.0] * capacity
+        self.head = 0   # 最も古い値の位置
+        self.size = 0
+        self.base = None
+        # Σt, Σv, Σt², Σtv（t は base からの経過時間）
+        self.st = self.sv = self.stt = self.stv = 0.0
+
+    def __len__(self):
+        return self.size
+
+    def _add(self, t: float, v: float, sign: int):
+        self.st += sign * t
+        self.sv += sign * v
+        self.stt += sign * t * t
+        self.stv += sign * t * v
+
+    def _pop_oldest(self):
+        self._add(self.ts[self.head], self.values[self.head], -1)
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
+
+    def push(self, ts: float, value: float):
+        if self.base is None:
+            self.base = ts
+        t = ts - self.base
+        # 経過時間が大きくなると累積和の桁落ちが増えるので，時々基準を取り直す
+        if t > self.window * 100:
+            self._rebase(ts)
+            t = 0.0
+        # 期間外・容量超過の値を捨てる
+        while self.size and (t - self.ts[self.head] > self.window or self.size == self.capacity):
+            self._pop_oldest()
+        i = (self.head + self.size) % self.capacity
+        self.ts[i] = t
+        self.values[i] = value
+        self.size += 1
+        self._add(t, value, 1)
+
+    def _rebase(self, ts: float):
+        shift = ts - self.base
+        self.base = ts
+        self.st = self.sv = self.stt = self.stv = 0.0
+        for k in range(self.size):
+            i = (self.head + k) % self.capacity
+            self.ts[i] -= shift
+            self._add(self.ts[i], self.values[i], 1)
+
+    def span(self) -> float:
+        if self.size < 2:
+            return 0.0
+        newest = (self.head + self.size - 1) % self.capacity
+        return self.ts[newest] - self.ts[self.head]
+
+    # 傾き（値/秒），2点未満ならNone
+    def slope(self):
+        n = self.size
+        if n < 2:
+            return None
+        denom = n * self.stt - self.st * self.st
+        if denom <= 1e-9:
+            return None
+        return (n * self.stv - self.st * self.sv) / denom
+
+# 閾値アラート（ヒステリシスと最小継続時間つき）
+class ThresholdRule:
+    def __init__(self, name: str, metric: str, threshold: float, below: bool = True,
+                 hysteresis: float = 0.0, dwell: float = 0.0,
+                 enter_message: str = None, exit_message: str = None, initial: bool = None):
+        self.name = name
+        self.metric = metric
+        self.threshold = threshold
+        self.below = below
+        self.hysteresis = hysteresis
+        self.dwell = dwell
+        self.enter_message = enter_message
+        self.exit_message = exit_message
+        self.active = initial       # Noneなら初回の値で決める
+        self.pending_since = None   # 状態が変わる条件を満たし始めた時刻
+
+    def _entered(self, value: float) -> bool:
+        return value <= self.threshold if self.below else value >= self.threshold
+
+    def _exited(self, value: float) -> bool:
+        if self.below:
+            return value >= self.threshold + self.hysteresis
+        return value <= self.threshold - self.hysteresis
+
+    # 次に状態が変わる値
+    def boundary(self) -> float:
+        if not self.active:
+            return self.threshold
+        return self.threshold + self.hysteresis if self.below else self.threshold - self.hysteresis
+
+    # 状態が変わったら "enter" / "exit" を返す
+    def evaluate(self, ts: float, value: float):
+        if self.active is None:
+            # 初回は現在の状態を記録するだけ
+            self.active = self._entered(value)
+            return None
+
+        changing = self._exited(value) if self.active else self._entered(value)
+        if not changing:
+            self.pending_since = None
+            return None
+        if self.pending_since is None:
+            self.pending_since = ts
+        if ts - self.pending_since < self.dwell:
+            return None
+
+        self.pending_since = None
+        self.active = not self.active
+        return "enter" if self.active else "exit"
+
+class AlertEngine:
+    def __init__(self, rules: list, window_seconds: float = TEMP_RATE_WINDOW, capacity: int = 64,
+                 min_rate_span: float = 600):
+        self.rules = rules
+        self.temperatures = RingBuffer(capacity, window_seconds)
+        # 変化率は少なくともこの期間（秒）のデータが揃ってから評価する
+        self.min_rate_span = min_rate_span
+
+    # 温度の変化率（℃/時）
+    def temperature_rate(self):
+        if self.temperatures.span() < self.min_rate_span:
+            return None
+        slope = self.temperatures.slope()
+        return None if slope is None else slope * 3600
+
+    # 測定値を評価して送信するメッセージのリストを返す
+    def evaluate(self, reading: dict, ts: float = None) -> list:
+        ts = time.time() if ts is None else ts
+        metrics = dict(reading)
+        temp = reading.get("temperature")
+        if isinstance(temp, (int, float)):
+            self.temperatures.push(ts, float(temp))
+            metrics["temperature_rate"] = self.temperature_rate()
+
+        messages = []
+        for rule in self.rules:
+            value = metrics.get(rule.metric)
+            if not isinstance(value, (int, float)):
+                continue
+            change = rule.evaluate(ts, value)
+            template = rule.enter_message if change == "enter" else rule.exit_message if change == "exit" else None
+            if template:
+                messages.append(template.format(**{k: v for k, v in metrics.items() if v is not None}))
+        return messages
+
+    # 閾値を変える（ルールの状態はそのまま）
+    def set_threshold(self, name: str, threshold: float, hysteresis: float = None):
+        for rule in self.rules:
+            if rule.name == name:
+                rule.threshold = threshold
+                if hysteresis is not None:
+                    rule.hysteresis = hysteresis
+                rule.pending_since = None
+
+    # 再起動時に引き継ぐ状態
+    def state(self) -> dict:
+        return {rule.name: rule.active for rule in self.rules}
+
+    def restore(self, state: dict):
+        for rule in self.rules:
+            if rule.name in state:
+                rule.active = state[rule.name]
+
+def build_default_engine(threshold_temp: float) -> AlertEngine:
+    return AlertEngine([
+        ThresholdRule(
+            "temperature_low", "temperature", threshold_temp, below=True,
+            hysteresis=TEMP_HYSTERESIS, dwell=ALERT_MIN_DWELL,
+            enter_message="⚠️現在の温度は{temperature}℃です。",
+            exit_message="現在の温度は{temperature}℃です。",
+        ),
+        ThresholdRule(
+            "temperature_falling", "temperature_rate", TEMP_RATE_ALERT, below=True,
+            hysteresis=abs(TEMP_RATE_ALERT) / 2, dwell=ALERT_MIN_DWELL,
+            enter_message="⚠️温度が急低下しています（{temperature_rate:+.1f}℃/時，現在{temperature}℃）。",
+            initial=False,
+        ),
+        ThresholdRule(
+            "humidity_high", "humidity", HUMIDITY_HIGH, below=False,
+            hysteresis=HUMIDITY_HYSTERESIS, dwell=ALERT_MIN_DWELL,
+            enter_message="💧湿度が高くなっています（{humidity}%）。",
+            exit_message="湿度が下がりました（{humidity}%）。",
+        ),
+        ThresholdRule(
+            "humidity_low", "humidity", HUMIDITY_LOW, below=True,
+            hysteresis=HUMIDITY_HYSTERESIS, dwell=ALERT_MIN_DWELL,
+            enter_message="💧湿度が低くなっています（{humidity}%）。",
+            exit_message="湿度が戻りました（{humidity}%）。",
+        ),
+        ThresholdRule(
+            "battery_low", "battery", BATTERY_LOW, below=True, hysteresis=5,
+            enter_message="🔋温湿度計の電池残量が少なくなっています（{battery}%）。",
+        ),
+    ])
@@ -3,7 +3,23 @@ import discord
 from discord.ext import tasks
 from discord import app_commands
 import asyncio
+import hashlib
+import io
+import json
+import logging
+import signal
+import time
 import gmail_detector
+from outbound import OutboundQueue, PRIORITY_ALERT
+from alerts import build_default_engine
+from polling import AdaptivePolling
+from log_pipeline import setup_logging, correlation_id
+from state_store import load_state, save_state
+from client_profile import client_options, resolve_channel
+from config import ConfigService
+from message_bus import BusServer, BusError
+from workers import WORKER_MODE, Supervisor, worker_names
+from interactions import interaction_handler, reply, format_latency
 # from reservation import init_reservations
 
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -11,110 +27,303 @@ TEMP_CHANNEL_ID = int(os.getenv("TEMP_CHANNEL_ID", "0"))
 GMAIL_CHANNEL_ID = int(os.getenv("GMAIL_CHANNEL_ID", "0"))
 TEST_CHANNEL_ID = int(os.getenv("TEST_CHANNEL_ID", "0"))
 
+# 温度の閾値（設定ファイルの alerts.threshold_temp で変えられる）
 THRESHOLD_TEMP = 5.0
 DISABLE_SWITCHBOT = os.getenv("DISABLE_SWITCHBOT", "0") == "1"
+# 停止時に送信待ちのメッセージを送り切るまで待つ秒数
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
 
 # SwitchBotがオンのとき
 if not DISABLE_SWITCHBOT:
     import switchbot
+    from meter_history import MeterHistory, HISTORY_RANGES, RANGE_LABELS
 
-intents = discord.Intents.default()
-intents.message_content = True
+logger = logging.getLogger("nlabot.bot")
+
+# 有効な機能（必要なintentの決定に使う）
+SUBSYSTEMS = ["gmail"]
+if not DISABLE_SWITCHBOT:
+    SUBSYSTEMS.append("switchbot")
+# SUBSYSTEMS.append("reservations")
+
+# コマンドの処理中のログにinteractionのIDを付ける
+class CommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        correlation_id.set(f"interaction:{interaction.id}")
+        return True
 
 class DiscordBot(discord.Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.tree = app_commands.CommandTree(self)
+        self.tree = CommandTree(self)
         self.gmail_detector_started = False
+        # 送信はすべてこのキューを経由する
+        self.outbound = OutboundQueue(self)
+        # 温湿度計のアラート判定
+        self.alert_engine = build_default_engine(THRESHOLD_TEMP)
+        # 取得間隔は測定値に応じて変える
+        self.polling = AdaptivePolling()
+        self.shutting_down = False
+
+        # 設定ファイルを監視し，変わった値を動いている処理に反映する
+        self.config = ConfigService()
+        self.config.subscribe(self.apply_config, "channels", "alerts", "polling")
+        self.config.subscribe(gmail_detector.apply_config, "gmail", "channels")
+
+        # 前回の停止時に保存した状態を引き継ぐ
+        self.saved_state = load_state()
+        self.alert_engine.restore(self.saved_state.get("alerts", {}))
+        self.polling.restore(self.saved_state.get("polling", {}))
+        gmail_detector.restore_state(self.saved_state.get("gmail", {}))
+
+        # メール監視・温湿度計・描画を別プロセスで動かす
+        if WORKER_MODE:
+            self.gmail_state = self.saved_state.get("gmail", {})
+            self.bus = BusServer()
+            self.bus.on("code", self.on_worker_code)
+            self.bus.on("gmail_state", self.on_worker_gmail_state)
+            self.bus.welcome["mail"] = lambda: {"state": self.gmail_state}
+            self.supervisor = Supervisor(worker_names(SUBSYSTEMS), self.bus.path)
 
         # SwitchBot有効時
         if not DISABLE_SWITCHBOT:
-            self.check_temperature_task = tasks.loop(minutes=3)(self.check_temperature)
+            # 温湿度の履歴（/history のグラフ用）
+            self.meter_history = MeterHistory()
+            self.check_temperature_task = tasks.loop(seconds=self.polling.min_interval)(self.check_temperature)
+            self.config.subscribe(switchbot.apply_config, "switchbot")
+
+    async def setup_hook(self):
+        # SIGTERM（docker stop）で送信待ちを送り切り，状態を保存してから終了する
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.create_task(self.shutdown()))
+            except (NotImplementedError, RuntimeError):
+                pass
+        self.config_task = asyncio.create_task(self.config.watch())
+        if WORKER_MODE:
+            await self.bus.start()
+            await self.supervisor.start()
 
     async def on_ready(self):
-        print(f"Logged in as {self.user} (ID: {self.user.id})")
+        logger.info("Logged in as %s (ID: %s)", self.user, self.user.id)
 
-        if not self.gmail_detector_started:
-            gmail_detector.start_gmail_detector(self, GMAIL_CHANNEL_ID)
+        if not self.gmail_detector_started and not WORKER_MODE:
+            gmail_detector.start_gmail_detector(
+                self, GMAIL_CHANNEL_ID, self.saved_state.get("gmail", {}).get("last_uid")
+            )
             self.gmail_detector_started = True
-            print("Gmail detector started.")
+            logger.info("Gmail detector started.")
 
         # SwitchBot有効時
         if not DISABLE_SWITCHBOT:
             if not self.check_temperature_task.is_running():
                  self.check_temperature_task.start()
 
-        # 予約機能
-        # await init_reservations(self)
+        # 予約機能（前回の予約表メッセージを使い続ける）
+        # await init_reservations(self, self.saved_state.get("board_message_id"))
 
-        # スラッシュコマンド同期
-        synced = await self.tree.sync()
-        print(f"Synced {len(synced)} commands globally.")
+        # スラッシュコマンド同期（前回から変わっていなければ省略）
+        if self.commands_hash() != self.saved_state.get("commands_hash"):
+            synced = await self.tree.sync()
+            self.saved_state["commands_hash"] = self.commands_hash()
+            logger.info("Synced %d commands globally.", len(synced))
 
         # テスト用チャンネルへの通知
-        channel_test = self.get_channel(TEST_CHANNEL_ID)
+        channel_test = await resolve_channel(self, TEST_CHANNEL_ID)
         if channel_test:
             await channel_test.send(
                 "再起動しました。"
             )
         else:
-            print("指定したチャンネルが見つかりませんでした。")
+            logger.warning("指定したチャンネルが見つかりませんでした。")
+
+    # 設定の再読み込み時に呼ばれる
+    def apply_config(self, config):
+        global TEMP_CHANNEL_ID, GMAIL_CHANNEL_ID, TEST_CHANNEL_ID, THRESHOLD_TEMP
+        TEMP_CHANNEL_ID = config.channels.temp
+        GMAIL_CHANNEL_ID = config.channels.gmail
+        TEST_CHANNEL_ID = config.channels.test
+
+        alerts = config.alerts
+        THRESHOLD_TEMP = alerts.threshold_temp
+        self.alert_engine.set_threshold("temperature_low", alerts.threshold_temp, alerts.temp_hysteresis)
+        self.alert_engine.set_threshold("humidity_high", alerts.humidity_high)
+        self.alert_engine.set_threshold("humidity_low", alerts.humidity_low)
+        self.alert_engine.set_threshold("battery_low", alerts.battery_low)
+
+        polling = config.polling
+        self.polling.min_interval = polling.min_seconds
+        self.polling.max_interval = polling.max_seconds
+        self.polling.daily_budget = polling.daily_budget
+        self.polling.burst = polling.burst
+
+    # 登録するコマンドの定義のハッシュ
+    def commands_hash(self) -> str:
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def snapshot_state(self) -> dict:
+        message = getattr(self, "reservation_message", None)
+        return {
+            "saved_at": time.time(),
+            "gmail": self.gmail_state if WORKER_MODE else gmail_detector.snapshot_state(),
+            "alerts": self.alert_engine.state(),
+            "polling": self.polling.state(),
+            "commands_hash": self.saved_state.get("commands_hash"),
+            "board_message_id": message.id if message else self.saved_state.get("board_message_id"),
+        }
+
+    async def shutdown(self):
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        logger.info("停止します。")
+
+        # 新しい処理を止める
+        self.config_task.cancel()
+        if not DISABLE_SWITCHBOT:
+            self.check_temperature_task.cancel()
+        if WORKER_MODE:
+            # メール監視ワーカーは終了前に処理済みのUIDを送ってくる
+            await self.supervisor.stop()
+            await self.bus.close()
+            gmail_detector.cancel_expiry_tasks()
+        elif not await asyncio.to_thread(gmail_detector.stop_gmail_detector):
+            logger.warning("Gmailの監視スレッドが時間内に終了しませんでした。")
+
+        # 送信待ちを送り切る
+        try:
+            await self.outbound.drain(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("送信待ちのメッセージが%d件残っています。", self.outbound.pending())
+
+        try:
+            save_state(self.snapshot_state())
+        except OSError as e:
+            logger.error("状態を保存できませんでした: %s", e)
+
+        # 接続とDBを閉じる
+        if hasattr(self, "reservation_notifier"):
+            from old_reservation import shutdown_reservations
+            await shutdown_reservations(self)
+        if not DISABLE_SWITCHBOT:
+            switchbot.close_client()
+            self.meter_history.close()
+        await self.close()
+
+    # ワーカーからの認証コード（送信が済むまで次の通知は読まない）
+    async def on_worker_code(self, msg: dict, blob: bytes):
+        await gmail_detector.send_discord_message(
+            self, GMAIL_CHANNEL_ID, msg["code"], msg.get("expires_at"), msg.get("cid")
+        )
+
+    async def on_worker_gmail_state(self, msg: dict, blob: bytes):
+        self.gmail_state = msg["state"]
+
+    # 温湿度計の値（ワーカーが使えなければこのプロセスで取得する）
+    async def read_meter(self) -> dict:
+        if WORKER_MODE:
+            try:
+                reply, _ = await self.bus.request("sensor", {"type": "meter_status"})
+                return reply["data"]
+            except BusError as e:
+                logger.warning("温湿度計ワーカーを使えません: %s", e)
+        # 再試行の待ち時間でイベントループを止めないようスレッドで呼ぶ
+        return await asyncio.to_thread(switchbot.get_meter_status)
+
+    # 履歴のグラフ（ワーカーが使えなければこのプロセスで描く）
+    async def render_history_chart(self, period: str) -> bytes:
+        if WORKER_MODE:
+            try:
+                _, png = await self.bus.request(
+                    "renderer", {"type": "history_chart", "device_id": switchbot.SWITCHBOT_DEVICE_ID, "period": period}
+                )
+                return png
+            except BusError as e:
+                logger.warning("描画ワーカーを使えません: %s", e)
+        # 描画はイベントループを止めないようスレッドで行う
+        return await asyncio.to_thread(self.meter_history.chart, switchbot.SWITCHBOT_DEVICE_ID, period)
+
+    # 予約の表（ワーカーが使えなければこのプロセスで描く）
+    async def render_table(self, table_data: list) -> io.BytesIO:
+        if WORKER_MODE:
+            try:
+                _, png = await self.bus.request("renderer", {"type": "table", "table": table_data})
+                return io.BytesIO(png)
+            except BusError as e:
+                logger.warning("描画ワーカーを使えません: %s", e)
+        from reservation_table import create_table_image
+        return await asyncio.to_thread(create_table_image, table_data)
 
     async def check_temperature(self):
         if DISABLE_SWITCHBOT:
             return
 
-        # switchbot をローカル参照
-        from switchbot import get_meter_status
-
-        meter_data = get_meter_status()
+        self.polling.record_call()
+        meter_data = await self.read_meter()
         if not meter_data:
             return
 
         temp = meter_data.get("temperature")
         if not isinstance(temp, (int, float)):
-            print("Invalid temperature:", temp)
+            logger.warning("Invalid temperature: %s", temp)
             return
 
-        new_state = "BELOW" if temp <= THRESHOLD_TEMP else "ABOVE"
+        await asyncio.to_thread(self.meter_history.record, switchbot.SWITCHBOT_DEVICE_ID, meter_data)
 
-        if getattr(self, "temp_state", None) is None:
-            self.temp_state = new_state
-            print(f"Switchbot動作チェック: temp_state={self.temp_state}, temp={temp}")
-            return
+        first = not hasattr(self, "temp_checked")
+        messages = self.alert_engine.evaluate(meter_data)
+        self.check_temperature_task.change_interval(
+            seconds=self.polling.next_interval(self.alert_engine, meter_data)
+        )
 
-        if new_state != self.temp_state:
-            channel = self.get_channel(TEMP_CHANNEL_ID)
-            if channel:
-                msg = (
-                    f"⚠️現在の温度は{temp}℃です。"
-                    if new_state == "BELOW"
-                    else f"現在の温度は{temp}℃です。"
-                )
-                await channel.send(msg)
-            self.temp_state = new_state
+        # 初回は動作チェックとして状態を記録する（前回の状態を引き継いでいれば変化は通知される）
+        if first:
+            self.temp_checked = True
+            logger.info("Switchbot動作チェック: alert_state=%s, temp=%s", self.alert_engine.state(), temp)
 
-bot = DiscordBot(intents=intents)
+        for msg in messages:
+            self.outbound.enqueue(TEMP_CHANNEL_ID, msg, priority=PRIORITY_ALERT)
+
+bot = DiscordBot(**client_options(SUBSYSTEMS))
 
 # SwitchBot有効時
 if not DISABLE_SWITCHBOT:
+    # SwitchBot APIの再試行で3秒を超えることがあるので先にdeferする
     @bot.tree.command(name="status", description="現在の温湿度とバッテリーを表示")
+    @interaction_handler(name="status", ephemeral=False)
     async def meterstatus_command(interaction: discord.Interaction):
-        from switchbot import get_meter_status
-
-        meter_data = get_meter_status()
+        bot.polling.record_call()
+        meter_data = await bot.read_meter()
         if not meter_data:
-            await interaction.response.send_message("温湿度計の取得に失敗しました。")
+            await reply(interaction, "温湿度計の取得に失敗しました。")
             return
 
         temp = meter_data.get("temperature")
         humi = meter_data.get("humidity")
         battery = meter_data.get("battery")
         msg = f"温度: {temp}℃\n湿度: {humi}%\nバッテリー: {battery}%"
-        await interaction.response.send_message(msg)
+        await reply(interaction, msg)
+
+    @bot.tree.command(name="history", description="温湿度の履歴をグラフで表示")
+    @app_commands.describe(period="表示する期間")
+    @app_commands.choices(period=[
+        app_commands.Choice(name=RANGE_LABELS[key], value=key) for key in HISTORY_RANGES
+    ])
+    @interaction_handler(name="history", ephemeral=False)
+    async def history_command(interaction: discord.Interaction, period: str = "24h"):
+        png = await bot.render_history_chart(period)
+        await reply(interaction, file=discord.File(io.BytesIO(png), filename=f"history_{period}.png"))
+
+@bot.tree.command(name="latency", description="コマンドやボタンの応答時間を表示")
+async def latency_command(interaction: discord.Interaction):
+    await interaction.response.send_message(format_latency(), ephemeral=True)
 
 if __name__ == "__main__":
+    setup_logging()
     if not BOT_TOKEN:
-        print("BOT_TOKEN not set.")
+        logger.error("BOT_TOKEN not set.")
     else:
-        bot.run(BOT_TOKEN)
\ No newline at end of file
+        # discord.pyのログも同じパイプラインに流す
+        bot.run(BOT_TOKEN, log_handler=None)
\ No newline at end of file
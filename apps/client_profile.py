@@ -0,0 +1,52 @@
+import os
+
+import discord
+
+# 必要な分だけintentとキャッシュを有効にする（0で従来どおり default + message_content）
+LEAN_CLIENT = os.getenv("LEAN_CLIENT", "1") == "1"
+
+# 機能ごとに必要なintent
+#   core: チャンネルのキャッシュ（get_channel）
+#   スラッシュコマンド・ボタン・モーダルはinteractionなのでintentは不要
+#   予約表の削除・再利用はhistory/fetch_messageで自分の投稿を読むだけなのでintentは不要
+SUBSYSTEM_INTENTS = {
+    "core": ("guilds",),
+    "gmail": (),
+    "switchbot": (),
+    "reservations": (),
+}
+
+def build_intents(subsystems) -> discord.Intents:
+    intents = discord.Intents.none()
+    for name in ("core", *subsystems):
+        for flag in SUBSYSTEM_INTENTS.get(name, ()):
+            setattr(intents, flag, True)
+    return intents
+
+# discord.Clientに渡す引数
+def client_options(subsystems, lean: bool = LEAN_CLIENT) -> dict:
+    if not lean:
+        intents = discord.Intents.default()
+        intents.message_content = True
+        return {"intents": intents}
+    return {
+        "intents": build_intents(subsystems),
+        # メッセージを読む機能はないのでキャッシュしない
+        "max_messages": None,
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+
+# キャッシュになければIDで取得する（取得したチャンネルは次回以降キャッシュから返す）
+_fetched_channels = {}
+
+async def resolve_channel(client: discord.Client, channel_id: int):
+    channel = client.get_channel(channel_id) or _fetched_channels.get(channel_id)
+    if channel is not None or not channel_id:
+        return channel
+    try:
+        channel = await client.fetch_channel(channel_id)
+    except discord.HTTPException:
+        return None
+    _fetched_channels[channel_id] = channel
+    return channel
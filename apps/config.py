@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import re
+import tomllib
+from types import SimpleNamespace
+
+logger = logging.getLogger("nlabot.config")
+
+# 実行中に読み直す設定ファイル（無ければ環境変数の値を使う）
+CONFIG_PATH = os.getenv("CONFIG_PATH", "config.toml")
+# 設定ファイルの更新を確認する間隔（秒）
+CONFIG_POLL_SECONDS = float(os.getenv("CONFIG_POLL_SECONDS", "5"))
+
+def _env(name: str, default, kind):
+    value = os.getenv(name) if name else None
+    if value is None or value == "":
+        return default
+    if kind is bool:
+        return value == "1"
+    if kind is list:
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return kind(value)
+
+# セクション -> キー -> (型, 環境変数, 既定値)
+SCHEMA = {
+    "channels": {
+        "temp": (int, "TEMP_CHANNEL_ID", 0),
+        "gmail": (int, "GMAIL_CHANNEL_ID", 0),
+        "test": (int, "TEST_CHANNEL_ID", 0),
+        "reservation_button": (int, "DISCORD_RSV_BUTTON_CH", 0),
+        "reservation_log": (int, "DISCORD_RSV_LOG_CH", 0),
+        "admin_user": (str, "ADMIN_USER_ID", "0"),
+    },
+    "gmail": {
+        "user": (str, "GMAIL_USER", ""),
+        "password": (str, "GMAIL_PASS", ""),
+        "subject_keywords": (list, "GMAIL_SUBJECT_KEYWORDS", ["bambu", "verification", "code"]),
+        "code_regex": (str, "GMAIL_CODE_REGEX", r"verification\s+code[^0-9]*?(\d{6})"),
+        "code_ttl": (int, "GMAIL_CODE_TTL", 600),
+        "mark_expired": (bool, "GMAIL_MARK_EXPIRED", False),
+    },
+    "switchbot": {
+        "token": (str, "SWITCHBOT_TOKEN", ""),
+        "secret": (str, "SWITCHBOT_SECRET", ""),
+        "device_id": (str, "SWITCHBOT_DEVICE_ID", ""),
+    },
+    "alerts": {
+        "threshold_temp": (float, "THRESHOLD_TEMP", 5.0),
+        "temp_hysteresis": (float, "TEMP_HYSTERESIS", 1.0),
+        "humidity_high": (float, "HUMIDITY_HIGH", 80.0),
+        "humidity_low": (float, "HUMIDITY_LOW", 20.0),
+        "battery_low": (float, "BATTERY_LOW", 20.0),
+    },
+    "polling": {
+        "min_seconds": (float, "POLL_MIN_SECONDS", 60.0),
+        "max_seconds": (float, "POLL_MAX_SECONDS", 900.0),
+        "daily_budget": (int, "POLL_DAILY_BUDGET", 300),
+        "burst": (int, "POLL_BURST", 60),
+    },
+}
+
+class ConfigError(ValueError):
+    pass
+
+# 読み込んだ設定（セクションごとに属性でアクセスする．読み込み後は変更しない）
+class Config:
+    def __init__(self, values: dict, code_pattern: re.Pattern):
+        self.values = values
+        for section, items in values.items():
+            setattr(self, section, SimpleNamespace(**items))
+        # 正規表現は読み込み時に一度だけコンパイルする
+        self.gmail.code_pattern = code_pattern
+
+    def section(self, name: str) -> dict:
+        return self.values[name]
+
+def _check_type(section: str, key: str, value, kind):
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if kind is list:
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ConfigError(f"{section}.{key} は文字列のリストにしてください。")
+        return value
+    if kind is int and isinstance(value, str) and section == "channels":
+        # チャンネルIDは文字列で書いてもよい
+        value = int(value) if value.isdigit() else value
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ConfigError(f"{section}.{key} の型が不正です（{kind.__name__}）。")
+    return value
+
+def _validate(values: dict):
+    alerts, polling = values["alerts"], values["polling"]
+    if alerts["humidity_low"] >= alerts["humidity_high"]:
+        raise ConfigError("alerts.humidity_low は alerts.humidity_high より小さくしてください。")
+    if alerts["temp_hysteresis"] < 0:
+        raise ConfigError("alerts.temp_hysteresis は0以上にしてください。")
+    if not 0 < polling["min_seconds"] <= polling["max_seconds"]:
+        raise ConfigError("polling.min_seconds は0より大きく polling.max_seconds 以下にしてください。")
+    if polling["daily_budget"] <= 0:
+        raise ConfigError("polling.daily_budget は1以上にしてください。")
+    if polling["burst"] <= 0:
+        raise ConfigError("polling.burst は1以上にしてください。")
+    if values["gmail"]["code_ttl"] <= 0:
+        raise ConfigError("gmail.code_ttl は1以上にしてください。")
+
+# 環境変数の値に設定ファイルの値を上書きして検証する
+# previous と同じ正規表現ならコンパイル済みのものを使い回す
+def build_config(data: dict, previous: Config = None) -> Config:
+    unknown = set(data) - set(SCHEMA)
+    if unknown:
+        raise ConfigError(f"不明なセクションがあります: {', '.join(sorted(unknown))}")
+    values = {}
+    for section, fields in SCHEMA.items():
+        given = data.get(section, {})
+        if not isinstance(given, dict):
+            raise ConfigError(f"{section} はテーブルにしてください。")
+        unknown = set(given) - set(fields)
+        if unknown:
+            raise ConfigError(f"{section} に不明なキーがあります: {', '.join(sorted(unknown))}")
+        values[section] = {
+            key: _check_type(section, key, given[key], kind) if key in given else _env(env, default, kind)
+            for key, (kind, env, default) in fields.items()
+        }
+    _validate(values)
+
+    pattern = values["gmail"]["code_regex"]
+    if previous is not None and previous.gmail.code_regex == pattern:
+        code_pattern = previous.gmail.code_pattern
+    else:
+        try:
+            code_pattern = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        except re.error as e:
+            raise ConfigError(f"gmail.code_regex をコンパイルできません: {e}")
+    return Config(values, code_pattern)
+
+def load_config(path: str = CONFIG_PATH, previous: Config = None) -> Config:
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except FileNotFoundError:
+        data = {}
+    except tomllib.TOMLDecodeError as e:
+        raise ConfigError(f"設定ファイルを読めません: {e}")
+    return build_config(data, previous)
+
+# 設定ファイルを監視し，変わったセクションの購読者に新しい設定を渡す
+class ConfigService:
+    def __init__(self, path: str = CONFIG_PATH, interval: float = CONFIG_POLL_SECONDS):
+        self.path = path
+        self.interval = interval
+        self._stamp = self._file_stamp()
+        self._subscribers = []  # (セクションの集合, callback)
+        try:
+            self.current = load_config(path)
+        except ConfigError as e:
+            logger.error("%s 環境変数の値で起動します。", e)
+            self.current = build_config({})
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    # callback(config) を登録し，すぐに現在の設定で一度呼ぶ
+    def subscribe(self, callback, *sections):
+        self._subscribers.append((set(sections), callback))
+        callback(self.current)
+
+    # ファイルが変わっていれば読み込んで検証する（変わっていない・不正ならNone）
+    def load_if_changed(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            return load_config(self.path, self.current)
+        except (ConfigError, OSError) as e:
+            logger.error("設定を読み直せませんでした（前の設定のまま動きます）: %s", e)
+            return None
+
+    # 新しい設定に差し替え，変わったセクションを購読している処理に通知する
+    def swap(self, new: Config) -> list:
+        old, self.current = self.current, new
+        changed = [name for name in SCHEMA if old.section(name) != new.section(name)]
+        if not changed:
+            return changed
+        logger.info("設定を更新しました: %s", ", ".join(changed))
+        for sections, callback in self._subscribers:
+            if sections & set(changed):
+                try:
+                    callback(new)
+                except Exception:
+                    logger.exception("設定の反映に失敗しました: %s", callback)
+        return changed
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            new = await asyncio.to_thread(self.load_if_changed)
+            if new is not None:
+                self.swap(new)
@@ -4,20 +4,97 @@ import time
 import threading
 import asyncio
 import email
+import logging
+from collections import OrderedDict
 from email.header import decode_header
+from email.utils import parsedate_to_datetime
 
 from imapclient import IMAPClient
 from bs4 import BeautifulSoup
 import discord
 
+from outbound import get_outbound, PRIORITY_CODE
+from log_pipeline import correlation, correlation_id
+
+logger = logging.getLogger("nlabot.gmail")
+
 GMAIL_USER = os.getenv("GMAIL_USER")
 GMAIL_PASS = os.getenv("GMAIL_PASS")
 
 TARGET_SUBJECT_KEYWORDS = ["bambu", "verification", "code"]
 CODE_REGEX = re.compile(r"verification\s+code[^0-9]*?(\d{6})", re.IGNORECASE | re.DOTALL)
 
+# 認証コードの有効期間（秒）と重複抑止キャッシュの上限件数
+CODE_TTL_SECONDS = int(os.getenv("GMAIL_CODE_TTL", "600"))
+CODE_CACHE_SIZE = int(os.getenv("GMAIL_CODE_CACHE_SIZE", "256"))
+# 有効期限切れのコードをDiscord上で取り消し線にする
+MARK_EXPIRED = os.getenv("GMAIL_MARK_EXPIRED", "0") == "1"
+
 # 前回処理済みのUIDを保持
 LAST_PROCESSED_UID = 0
+# 認証コードの転送先（設定の再読み込みで変わる）
+GMAIL_CHANNEL_ID = 0
+# 設定するとDiscordに送る代わりに code_sink(code, expires_at, cid) を呼ぶ（ワーカープロセス用）
+code_sink = None
+
+# 停止の指示（idle_loopは処理中のIMAPセッションを閉じてから抜ける）
+stop_event = threading.Event()
+_thread = None
+# 期限切れ表示の待ちタスク（参照を持っておかないとGCで消えることがある）
+_expiry_tasks = set()
+
+# 転送済みコードを(Message-ID, コード)で記録するキャッシュ（失効時刻と件数の上限つき）
+#   失効時刻は受信時刻 + CODE_TTL_SECONDS なので，ほぼ登録順に並ぶ．失効したものは先頭から捨てる
+class NotifiedCodeCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> 失効時刻(UNIX秒)，登録順
+        self._lock = threading.Lock()
+
+    # 未登録なら登録してTrue，登録済み(有効期限内)ならFalse
+    def add(self, key: tuple, expires_at: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._purge(now)
+            exp = self._entries.get(key)
+            if exp is not None and exp > now:
+                return False
+            # 順番が前後して残っていた失効済みのものは登録し直す
+            self._entries.pop(key, None)
+            self._entries[key] = expires_at
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    # 先頭から失効したものを捨て，失効していないものに当たったら止める
+    def _purge(self, now: float):
+        while self._entries:
+            key, exp = next(iter(self._entries.items()))
+            if exp > now:
+                break
+            del self._entries[key]
+
+    # 登録済み(有効期限内)ならTrue
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            exp = self._entries.get(key)
+            return exp is not None and exp > time.time()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # 再起動時に引き継ぐ [[Message-ID, コード, 失効時刻], ...]
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[*key, exp] for key, exp in self._entries.items()]
+
+    def restore(self, entries: list, now: float = None):
+        now = time.time() if now is None else now
+        for message_id, code, expires_at in entries:
+            if expires_at > now:
+                self.add((message_id, code), expires_at, now)
+
+notified_codes = NotifiedCodeCache(CODE_CACHE_SIZE)
 
 # 起動時に最新のメールUIDを取得し，LAST_PROCESSED_UIDを初期化
 def initialize_last_uid():
@@ -35,23 +112,66 @@ def initialize_last_uid():
             else:
                 pass
 
-    except Exception:
-        pass
+    except Exception as e:
+        logger.warning("最新のメールUIDを取得できませんでした: %s", e)
 
-def start_gmail_detector(discord_bot: discord.Client, gmail_channel_id: int):
-    # ループ前にUIDを初期化
-    initialize_last_uid()
-    
+def start_gmail_detector(discord_bot: discord.Client, gmail_channel_id: int, last_uid: int = None):
+    global LAST_PROCESSED_UID, GMAIL_CHANNEL_ID, _thread
+    GMAIL_CHANNEL_ID = gmail_channel_id
+    # 前回の停止時のUIDがあればそこから続け，停止中に届いたメールも処理する
+    if last_uid:
+        LAST_PROCESSED_UID = last_uid
+    else:
+        # ループ前にUIDを初期化
+        initialize_last_uid()
+
+    stop_event.clear()
     th = threading.Thread(
         target=idle_loop,
-        args=(discord_bot, gmail_channel_id),
+        args=(discord_bot,),
         daemon=True
     )
     th.start()
+    _thread = th
 
-def idle_loop(discord_bot: discord.Client, gmail_channel_id: int):
+# idle_loopを止めて終了を待つ
+def stop_gmail_detector(timeout: float = 10.0) -> bool:
+    stop_event.set()
+    cancel_expiry_tasks()
+    if _thread is None:
+        return True
+    _thread.join(timeout)
+    return not _thread.is_alive()
+
+# 期限切れ表示の待ちをやめる（to_threadから呼ばれるのでループに依頼する）
+def cancel_expiry_tasks():
+    for task in list(_expiry_tasks):
+        task.get_loop().call_soon_threadsafe(task.cancel)
+
+# 設定の再読み込み時に呼ばれる（動いているidle_loopは次の接続から新しい値を使う）
+def apply_config(config):
+    global GMAIL_USER, GMAIL_PASS, TARGET_SUBJECT_KEYWORDS, CODE_REGEX, CODE_TTL_SECONDS, MARK_EXPIRED
+    global GMAIL_CHANNEL_ID
+    gmail = config.gmail
+    GMAIL_USER = gmail.user or None
+    GMAIL_PASS = gmail.password or None
+    TARGET_SUBJECT_KEYWORDS = [kw.lower() for kw in gmail.subject_keywords]
+    CODE_REGEX = gmail.code_pattern
+    CODE_TTL_SECONDS = gmail.code_ttl
+    MARK_EXPIRED = gmail.mark_expired
+    if config.channels.gmail:
+        GMAIL_CHANNEL_ID = config.channels.gmail
+
+# 再起動時に引き継ぐ状態
+def snapshot_state() -> dict:
+    return {"last_uid": LAST_PROCESSED_UID, "notified_codes": notified_codes.snapshot()}
+
+def restore_state(state: dict):
+    notified_codes.restore(state.get("notified_codes", []))
+
+def idle_loop(discord_bot: discord.Client):
     global LAST_PROCESSED_UID
-    while True:
+    while not stop_event.is_set():
         try:
             with IMAPClient("imap.gmail.com", ssl=True, use_uid=True) as server:
                 # ログイン
@@ -62,11 +182,12 @@ def idle_loop(discord_bot: discord.Client, gmail_channel_id: int):
                 server.select_folder(target_folder)
 
                 # 新着メールの検出と処理
-                fetch_latest_and_notify(server, discord_bot, gmail_channel_id)
-        except Exception:
-            pass
+                fetch_latest_and_notify(server, discord_bot, GMAIL_CHANNEL_ID)
+        except Exception as e:
+            # ログイン失敗などは3秒ごとに繰り返すので，ログは間引かれる
+            logger.warning("IMAPの処理に失敗しました: %s", e)
 
-        time.sleep(3)
+        stop_event.wait(3)
 
 def fetch_latest_and_notify(server: IMAPClient, discord_bot: discord.Client, gmail_channel_id: int):
     global LAST_PROCESSED_UID
@@ -84,7 +205,9 @@ def fetch_latest_and_notify(server: IMAPClient, discord_bot: discord.Client, gma
         return
 
     # 通知処理の前に最新のUIDをグローバル変数に記録する
-    LAST_PROCESSED_UID = max(new_uids)
+    # （ワーカーではゲートウェイに送れてから進める）
+    if code_sink is None:
+        LAST_PROCESSED_UID = max(new_uids)
 
     # 最新10件のUIDを取得
     if len(new_uids) > 10:
@@ -92,32 +215,80 @@ def fetch_latest_and_notify(server: IMAPClient, discord_bot: discord.Client, gma
 
     # 新しい順に処理
     for uid in reversed(new_uids):
-        msg_info = server.fetch(uid, ['BODY[]']).get(uid)
-        if not msg_info or (b'BODY[]' not in msg_info):
-            continue
-
-        raw_email = msg_info[b'BODY[]']
-        msg = email.message_from_bytes(raw_email)
-
-        subject = decode_str(msg.get("Subject", ""))
-        subject_lower = subject.lower()
-        if all(kw in subject_lower for kw in TARGET_SUBJECT_KEYWORDS):
-            body_text = get_body_text(msg)
-            code = extract_code(body_text)
-            if code:
-                discord_bot.loop.call_soon_threadsafe(
-                    asyncio.create_task,
-                    send_discord_message(discord_bot, gmail_channel_id, code)
-                )
-                break
+        # このメールの処理中のログにUIDを付ける
+        with correlation(f"uid:{uid}"):
+            msg_info = server.fetch(uid, ['BODY[]']).get(uid)
+            if not msg_info or (b'BODY[]' not in msg_info):
+                continue
+
+            raw_email = msg_info[b'BODY[]']
+            msg = email.message_from_bytes(raw_email)
+
+            subject = decode_str(msg.get("Subject", ""))
+            subject_lower = subject.lower()
+            if all(kw in subject_lower for kw in TARGET_SUBJECT_KEYWORDS):
+                body_text = get_body_text(msg)
+                code = extract_code(body_text)
+                if code:
+                    # 有効期限切れのコードは転送しない
+                    sent_at = get_sent_timestamp(msg)
+                    expires_at = sent_at + CODE_TTL_SECONDS
+                    if expires_at <= time.time():
+                        logger.info("有効期限切れの認証コードのため転送しません。")
+                        break
+
+                    # 同じメール・同じコードの再送を抑止
+                    message_id = msg.get("Message-ID", "").strip() or f"uid:{uid}"
+                    key = (message_id, code)
+                    if key in notified_codes:
+                        logger.info("転送済みの認証コードです。")
+                        break
+
+                    logger.info("認証コードを転送します。")
+                    if code_sink is not None:
+                        # 送れてから記録する．送れなければ例外で抜け，UIDも進めないので次の接続で送り直す
+                        code_sink(code, expires_at, correlation_id.get())
+                        notified_codes.add(key, expires_at)
+                        break
+                    notified_codes.add(key, expires_at)
+                    discord_bot.loop.call_soon_threadsafe(
+                        asyncio.create_task,
+                        send_discord_message(discord_bot, gmail_channel_id, code, expires_at,
+                                             correlation_id.get())
+                    )
+                    break
 
     # 最新のUIDを記録
     LAST_PROCESSED_UID = max(new_uids)
 
-async def send_discord_message(discord_bot: discord.Client, channel_id: int, code: str):
-    channel = discord_bot.get_channel(channel_id)
-    if channel:
-        await channel.send(f"Bambu Lab Verification Code: **{code}**")
+async def send_discord_message(discord_bot: discord.Client, channel_id: int, code: str, expires_at: float = None,
+                               cid: str = None):
+    # タスクはイベントループ側で作られるので，メール処理スレッドの相関IDを引き継ぐ
+    if cid:
+        correlation_id.set(cid)
+    message = await get_outbound(discord_bot).send(
+        channel_id, f"Bambu Lab Verification Code: **{code}**", priority=PRIORITY_CODE
+    )
+    if message and MARK_EXPIRED and expires_at is not None:
+        task = asyncio.create_task(mark_code_expired(message, code, expires_at))
+        _expiry_tasks.add(task)
+        task.add_done_callback(_expiry_tasks.discard)
+    return message
+
+# 有効期限が来たら元のメッセージを期限切れ表示に編集
+async def mark_code_expired(message: discord.Message, code: str, expires_at: float):
+    await asyncio.sleep(max(0.0, expires_at - time.time()))
+    try:
+        await message.edit(content=f"~~Bambu Lab Verification Code: **{code}**~~ (期限切れ)")
+    except Exception as e:
+        logger.warning("期限切れ表示への編集に失敗しました: %s", e)
+
+# メールの送信時刻(UNIX秒)，Dateヘッダが無ければ現在時刻
+def get_sent_timestamp(msg: email.message.Message) -> float:
+    try:
+        return parsedate_to_datetime(msg.get("Date", "")).timestamp()
+    except Exception:
+        return time.time()
 
 def decode_str(s: str) -> str:
     parts = decode_header(s)
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+
+logger = logging.getLogger("nlabot.ical")
+
+# 予約のiCalendarフィード（0で無効）
+ICAL_PORT = int(os.getenv("ICAL_PORT", "0"))
+ICAL_HOST = os.getenv("ICAL_HOST", "0.0.0.0")
+# 設定すると ?token= が一致するときだけ返す
+ICAL_TOKEN = os.getenv("ICAL_TOKEN", "")
+# 何日前までの予約を含めるか
+ICAL_PAST_DAYS = int(os.getenv("ICAL_PAST_DAYS", "30"))
+
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE",
+    "TZID:Asia/Tokyo",
+    "BEGIN:STANDARD",
+    "DTSTART:19700101T000000",
+    "TZOFFSETFROM:+0900",
+    "TZOFFSETTO:+0900",
+    "TZNAME:JST",
+    "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+def escape_text(text: str) -> str:
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+# 75オクテットを超える行は折り返す（RFC 5545 3.1）
+def fold(line: str) -> str:
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts, current, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += ch
+        size += n
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+def _local(dt_str: str) -> str:
+    return datetime.fromisoformat(dt_str).strftime("%Y%m%dT%H%M%S")
+
+# 予約の行からカレンダーを組み立てる
+def build_calendar(rows: list, name: str, stamp: float) -> bytes:
+    dtstamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(stamp))
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//N-Lab//N-Labot reservations//JA",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(name)}",
+        "X-WR-TIMEZONE:Asia/Tokyo",
+        *VTIMEZONE,
+    ]
+    for row in rows:
+        reservation_id, _, group_name, room_type, start, end = row[:6]
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:reservation-{reservation_id}@n-labot",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART;TZID=Asia/Tokyo:{_local(start)}",
+            f"DTEND;TZID=Asia/Tokyo:{_local(end)}",
+            f"SUMMARY:{escape_text(f'{group_name}（{room_type}）')}",
+            f"LOCATION:{escape_text(room_type)}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+# 予約の書き込みごとに版を上げ，変化がなければ304を返す
+class CalendarFeed:
+    def __init__(self, manager, host: str = ICAL_HOST, port: int = ICAL_PORT, token: str = ICAL_TOKEN):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.token = token
+        self.version = 0
+        # 再起動で版が0に戻っても前回のETagと衝突しないようにする
+        self.epoch = time.time_ns()
+        # Last-Modifiedは秒単位
+        self.modified = int(time.time())
+        self.cache = {}  # 部屋（None はすべて） -> (版, 本文)
+        self.runner = None
+        manager.add_write_hook(self.on_write)
+
+    def on_write(self, old_row, new_row):
+        self.version += 1
+        self.modified = int(time.time())
+
+    def etag(self, room) -> str:
+        key = hashlib.sha1(f"{self.epoch}:{self.version}:{room or ''}".encode()).hexdigest()[:16]
+        return f'"{key}"'
+
+    def not_modified(self, request: web.Request, etag: str) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def body(self, room) -> bytes:
+        cached = self.cache.get(room)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        start = (datetime.now() - timedelta(days=ICAL_PAST_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+        rows = self.manager.index.range(start, "9999-12-31 23:59:59", room_type=room)
+        data = build_calendar(rows, f"N-Lab 予約（{room or 'すべての部屋'}）", self.modified)
+        self.cache[room] = (self.version, data)
+        return data
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.token and request.query.get("token") != self.token:
+            raise web.HTTPForbidden()
+        room = request.match_info.get("room")
+        etag = self.etag(room)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(self.modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self.not_modified(request, etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=self.body(room), headers=headers,
+                            content_type="text/calendar", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/calendar.ics", self.handle)
+        app.router.add_get("/calendar/{room}.ics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info("予約のカレンダーを配信します: http://%s:%d/calendar.ics", self.host, self.port)
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
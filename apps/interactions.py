@@ -0,0 +1,115 @@
+import bisect
+import functools
+import logging
+import os
+import time
+
+import discord
+
+logger = logging.getLogger("nlabot.interactions")
+
+# 応答（defer含む）までにこれ以上かかったら警告する（Discordの期限は3秒）
+INTERACTION_ACK_WARN_MS = float(os.getenv("INTERACTION_ACK_WARN_MS", "2000"))
+
+# ヒストグラムの区切り（ms）．最後の区切りを超えたものは最後の枠に数える
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 3000, 5000, 10000, 30000)
+
+class LatencyHistogram:
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    # p% の値が入る枠の上限（最後の枠は最大値）
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(self.bounds[i]) if i < len(self.bounds) else self.max
+        return self.max
+
+# ハンドラ名 -> {"ack": 応答までの時間, "done": 処理が終わるまでの時間}
+latency = {}
+
+def observe(name: str, kind: str, ms: float):
+    hists = latency.setdefault(name, {"ack": LatencyHistogram(), "done": LatencyHistogram()})
+    hists[kind].observe(ms)
+
+# interactionが作られて（ユーザーが操作して）からの経過時間（ms）
+def elapsed_ms(interaction: discord.Interaction) -> float:
+    return max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000)
+
+def format_latency() -> str:
+    if not latency:
+        return "まだ記録がありません。"
+    lines = ["ハンドラ: 件数 応答p50/p99 完了p50/p99 (ms)"]
+    for name, hists in sorted(latency.items()):
+        ack, done = hists["ack"], hists["done"]
+        lines.append(
+            f"{name}: {done.count}件 "
+            f"{ack.percentile(50):.0f}/{ack.percentile(99):.0f} "
+            f"{done.percentile(50):.0f}/{done.percentile(99):.0f}"
+        )
+    return "```\n" + "\n".join(lines) + "\n```"
+
+# まだ応答していなければdeferし，応答までの時間を記録する
+async def acknowledge(interaction: discord.Interaction, name: str, ephemeral: bool = True, thinking: bool = True):
+    if interaction.response.is_done():
+        return
+    await interaction.response.defer(ephemeral=ephemeral, thinking=thinking)
+    ms = elapsed_ms(interaction)
+    observe(name, "ack", ms)
+    interaction.extras["ack_recorded"] = True
+    if ms > INTERACTION_ACK_WARN_MS:
+        logger.warning("応答までに%.0fmsかかりました: %s", ms, name)
+
+# 応答済み（defer済み）ならfollowup，まだならそのまま応答する
+async def reply(interaction: discord.Interaction, content: str = None, **kwargs):
+    if interaction.response.is_done():
+        return await interaction.followup.send(content, **kwargs)
+    await interaction.response.send_message(content, **kwargs)
+
+# コマンド・ボタン・Modalのハンドラを包む
+#   defer=True: 本体を呼ぶ前にdeferする（本体の応答は reply() で送る）
+#   defer=False: Modalを開くなどdeferできない処理用．必要な経路で acknowledge() を呼ぶ
+#   どちらも応答と完了までの時間を記録し，本体の例外はユーザーに知らせる
+def interaction_handler(name: str = None, defer: bool = True, ephemeral: bool = True, thinking: bool = True):
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # selfやボタンが前後に付くので引数からinteractionを探す（ベンチの代役も受け付ける）
+            interaction = next((a for a in args if hasattr(a, "response") and hasattr(a, "followup")), None)
+            if interaction is None:
+                return await func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                if defer:
+                    await acknowledge(interaction, label, ephemeral=ephemeral, thinking=thinking)
+                await func(*args, **kwargs)
+            except Exception as e:
+                logger.exception("インタラクションの処理に失敗しました: %s", label)
+                try:
+                    await reply(interaction, f"エラーが発生: {e}", ephemeral=True)
+                except discord.HTTPException:
+                    pass
+            finally:
+                done = elapsed_ms(interaction)
+                # deferしなかったハンドラは完了時に応答したものとみなす
+                if interaction.response.is_done() and not interaction.extras.get("ack_recorded"):
+                    observe(label, "ack", done)
+                observe(label, "done", done)
+                logger.debug("%s: %.0fms（本体 %.0fms）", label, done, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
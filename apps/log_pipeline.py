@@ -0,0 +1,149 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "json"（1行1レコード）または "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# 指定するとファイルにも書き出す（サイズでローテーション）
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+# 同じ警告・エラーを出す最短間隔（秒）
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "60"))
+
+# interactionやメールのUIDなど，処理の単位を示すID
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+@contextmanager
+def correlation(value: str):
+    token = correlation_id.set(value)
+    try:
+        yield
+    finally:
+        correlation_id.reset(token)
+
+# LogRecordの標準の属性（これ以外はextraとしてJSONに含める）
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "correlation_id", "suppressed"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "correlation_id", None):
+            text += f" [{record.correlation_id}]"
+        if getattr(record, "suppressed", 0):
+            text += f" (同じログを{record.suppressed}件省略)"
+        return text
+
+# 送り出す側のスレッドで相関IDを記録する（キューの先では別スレッドになるため）
+class CorrelationFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = correlation_id.get()
+        return True
+
+# 同じ場所からの警告・エラーはinterval秒に1回だけ通し，省略した件数を添える
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval: float = LOG_RATE_LIMIT, level: int = logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.last = {}  # (logger, level, msg) -> (最後に通した時刻, 省略件数)
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.suppressed = 0
+        if record.levelno < self.level or self.interval <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            last, suppressed = self.last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self.last[key] = (last, suppressed + 1)
+                return False
+            self.last[key] = (now, 0)
+        record.suppressed = suppressed
+        return True
+
+# 標準のQueueHandlerはメッセージと例外を1つの文字列にまとめてしまうので，例外は別に残す
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener = None
+
+# ルートロガーはキューに積むだけにし，書き出しはQueueListenerのスレッドで行う
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, log_file: str = LOG_FILE):
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+# キューに残ったログを書き出して止める
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
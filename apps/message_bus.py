@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+
+from log_pipeline import correlation_id
+
+logger = logging.getLogger("nlabot.bus")
+
+# ゲートウェイとワーカーをつなぐUnixソケット
+BUS_SOCKET = os.getenv("BUS_SOCKET", "/tmp/nlabot-bus.sock")
+# 接続ごとの送信待ちの上限（超えると送る側が待たされる）
+BUS_QUEUE_SIZE = int(os.getenv("BUS_QUEUE_SIZE", "64"))
+# 要求への応答を待つ秒数
+BUS_REQUEST_TIMEOUT = float(os.getenv("BUS_REQUEST_TIMEOUT", "30"))
+MAX_FRAME_BYTES = 32 * 1024 * 1024
+
+# フレーム: ヘッダ長・データ長（4バイトずつ，ビッグエンディアン）＋JSONヘッダ＋バイナリ（画像など）
+_LENGTHS = struct.Struct(">II")
+
+class BusError(Exception):
+    pass
+
+# 接続しているワーカーがいない・接続が切れた
+class WorkerUnavailable(BusError):
+    pass
+
+# ワーカー側で処理に失敗した
+class RemoteError(BusError):
+    pass
+
+def encode_frame(msg: dict, blob: bytes = b"") -> bytes:
+    header = json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _LENGTHS.pack(len(header), len(blob)) + header + blob
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple:
+    header_len, blob_len = _LENGTHS.unpack(await reader.readexactly(_LENGTHS.size))
+    if header_len + blob_len > MAX_FRAME_BYTES:
+        raise BusError(f"フレームが大きすぎます ({header_len + blob_len} bytes)")
+    msg = json.loads(await reader.readexactly(header_len))
+    blob = await reader.readexactly(blob_len) if blob_len else b""
+    return msg, blob
+
+# 1本の接続．handler(conn, msg, blob) は通知ならNone，要求なら (応答, バイナリ) を返す
+#   通知（id なし）は届いた順に1件ずつ処理する（処理が詰まると読み取りも止まり，相手の送信が待たされる）
+#   要求（id あり）は max_inflight 件まで並行に処理する
+class Connection:
+    def __init__(self, reader, writer, handler, max_inflight: int = 4, queue_size: int = BUS_QUEUE_SIZE):
+        self.reader = reader
+        self.writer = writer
+        self.handler = handler
+        self.name = None
+        self.outbox = asyncio.Queue(queue_size)
+        self.pending = {}  # id -> 応答を待つFuture
+        self.closed = asyncio.Event()
+        self._ids = itertools.count(1)
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._tasks = set()
+
+    def start(self):
+        for coro in (self._read_loop(), self._write_loop()):
+            task = asyncio.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    # 送信待ちが上限に達していれば空くまで待つ
+    async def send(self, msg: dict, blob: bytes = b""):
+        if self.closed.is_set():
+            raise WorkerUnavailable(f"接続が切れています ({self.name})")
+        await self.outbox.put(encode_frame(msg, blob))
+
+    async def request(self, msg: dict, blob: bytes = b"", timeout: float = BUS_REQUEST_TIMEOUT) -> tuple:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self.send({**msg, "id": request_id, "cid": correlation_id.get()}, blob)
+            reply, data = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+        if "error" in reply:
+            raise RemoteError(reply["error"])
+        return reply, data
+
+    async def _write_loop(self):
+        try:
+            while True:
+                frame = await self.outbox.get()
+                self.writer.write(frame)
+                # ソケットのバッファが埋まっていれば相手が読むまで待つ
+                await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            logger.info("送信できません (%s): %s", self.name, e)
+            self.close()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                msg, blob = await read_frame(self.reader)
+                if "re" in msg:
+                    future = self.pending.get(msg["re"])
+                    if future is not None and not future.done():
+                        future.set_result((msg, blob))
+                elif "id" in msg:
+                    await self._slots.acquire()
+                    task = asyncio.create_task(self._answer(msg, blob))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                else:
+                    await self._handle(msg, blob)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        except (BusError, ValueError) as e:
+            logger.error("不正なフレームを受信しました (%s): %s", self.name, e)
+        finally:
+            self.close()
+
+    async def _handle(self, msg: dict, blob: bytes):
+        try:
+            return await self.handler(self, msg, blob)
+        except Exception:
+            logger.exception("メッセージの処理に失敗しました (%s): %s", self.name, msg.get("type"))
+
+    async def _answer(self, msg: dict, blob: bytes):
+        correlation_id.set(msg.get("cid"))
+        try:
+            reply, data = await self.handler(self, msg, blob) or ({}, b"")
+        except Exception as e:
+            logger.exception("要求の処理に失敗しました (%s): %s", self.name, msg.get("type"))
+            reply, data = {"error": f"{type(e).__name__}: {e}"}, b""
+        finally:
+            self._slots.release()
+        try:
+            await self.send({**reply, "re": msg["id"]}, data)
+        except WorkerUnavailable:
+            pass
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(WorkerUnavailable(f"接続が切れました ({self.name})"))
+        for task in list(self._tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.writer.close()
+
+# ゲートウェイ側: ワーカーからの接続を受け付け，通知を種類ごとのハンドラに渡す
+class BusServer:
+    def __init__(self, path: str = BUS_SOCKET):
+        self.path = path
+        self.handlers = {}  # 種類 -> async handler(msg, blob)
+        self.welcome = {}   # ワーカー名 -> 接続時に渡す内容を返す関数
+        self.workers = {}   # ワーカー名 -> [Connection]
+        self.server = None
+
+    def on(self, msg_type: str, handler):
+        self.handlers[msg_type] = handler
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._accept, self.path)
+        os.chmod(self.path, 0o600)
+
+    async def _accept(self, reader, writer):
+        conn = Connection(reader, writer, self._dispatch)
+        conn.start()
+        await conn.closed.wait()
+        if conn.name in self.workers and conn in self.workers[conn.name]:
+            self.workers[conn.name].remove(conn)
+            logger.info("ワーカーが切断しました: %s", conn.name)
+
+    async def _dispatch(self, conn: Connection, msg: dict, blob: bytes):
+        if msg.get("type") == "hello":
+            conn.name = msg["worker"]
+            self.workers.setdefault(conn.name, []).append(conn)
+            logger.info("ワーカーが接続しました: %s (pid=%s)", conn.name, msg.get("pid"))
+            welcome = self.welcome.get(conn.name)
+            return {"type": "welcome", **(welcome() if welcome else {})}, b""
+        handler = self.handlers.get(msg.get("type"))
+        if handler is None:
+            raise BusError(f"未知のメッセージです: {msg.get('type')}")
+        return await handler(msg, blob)
+
+    def connected(self, name: str) -> bool:
+        return bool(self.workers.get(name))
+
+    # 応答待ちの少ないワーカーに送る
+    async def request(self, name: str, msg: dict, blob: bytes = b"", timeout: float = BUS_REQUEST_TIMEOUT) -> tuple:
+        conns = self.workers.get(name)
+        if not conns:
+            raise WorkerUnavailable(f"ワーカーが接続していません ({name})")
+        conn = min(conns, key=lambda c: len(c.pending))
+        return await conn.request(msg, blob, timeout)
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for conns in self.workers.values():
+            for conn in list(conns):
+                conn.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+# ワーカー側: ゲートウェイに接続して名乗る．(接続, welcomeの内容) を返す
+async def connect(name: str, handler, path: str = BUS_SOCKET, max_inflight: int = 4,
+                  attempts: int = 30) -> tuple:
+    for attempt in range(attempts):
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            await asyncio.sleep(min(0.2 * 2 ** attempt, 5.0))
+    else:
+        raise WorkerUnavailable(f"ゲートウェイに接続できません ({path})")
+    conn = Connection(reader, writer, handler, max_inflight=max_inflight)
+    conn.name = name
+    conn.start()
+    welcome, _ = await conn.request({"type": "hello", "worker": name, "pid": os.getpid()})
+    return conn, welcome
@@ -0,0 +1,159 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from reservation_table import get_font, regular_font_path
+
+METER_DB_PATH = os.getenv("METER_DB_PATH", "meter_history.db")
+# 測定値を残す日数
+METER_RETENTION_DAYS = int(os.getenv("METER_RETENTION_DAYS", "35"))
+
+# グラフの表示期間（秒）
+HISTORY_RANGES = {
+    "24h": 24 * 3600,
+    "7d": 7 * 24 * 3600,
+    "30d": 30 * 24 * 3600,
+}
+RANGE_LABELS = {"24h": "24時間", "7d": "7日間", "30d": "30日間"}
+# グラフの横幅（px）．測定値はこの数の区間にまとめてから描画する
+CHART_WIDTH = 800
+CHART_HEIGHT = 480
+CHART_CACHE_SIZE = 32
+
+# 区間ごとの平均・最小・最大を求める（tsは昇順）
+def downsample(ts: np.ndarray, values: np.ndarray, start: float, end: float, width: int) -> tuple:
+    valid = ~np.isnan(values)
+    ts, values = ts[valid], values[valid]
+    if ts.size == 0:
+        return np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+    buckets = ((ts - start) * width // (end - start)).astype(np.int64)
+    np.clip(buckets, 0, width - 1, out=buckets)
+
+    # tsが昇順なので同じ区間の値は連続している
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, values.size])
+    means = np.add.reduceat(values, starts) / counts
+    mins = np.minimum.reduceat(values, starts)
+    maxs = np.maximum.reduceat(values, starts)
+    centers = start + (buckets[starts] + 0.5) * (end - start) / width
+    return centers, means, mins, maxs
+
+class MeterHistory:
+    def __init__(self, db_path: str = METER_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS meter_readings (
+                device_id TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                temperature REAL,
+                humidity REAL,
+                battery REAL,
+                PRIMARY KEY (device_id, ts)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+        # (device_id, 期間, 区間番号) -> PNG
+        self.charts = OrderedDict()
+        self.last_pruned = 0.0
+
+    def record(self, device_id: str, reading: dict, ts: float = None):
+        ts = int(time.time() if ts is None else ts)
+        values = [reading.get(k) for k in ("temperature", "humidity", "battery")]
+        values = [v if isinstance(v, (int, float)) else None for v in values]
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO meter_readings (device_id, ts, temperature, humidity, battery)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (device_id, ts, *values))
+            # 古い測定値は1日に1回まとめて消す
+            if ts - self.last_pruned > 24 * 3600:
+                self.conn.execute("DELETE FROM meter_readings WHERE ts < ?",
+                                  (ts - METER_RETENTION_DAYS * 24 * 3600,))
+                self.last_pruned = ts
+            self.conn.commit()
+
+    def record_many(self, device_id: str, rows):
+        with self.lock:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO meter_readings (device_id, ts, temperature, humidity, battery)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ((device_id, int(ts), t, h, b) for ts, t, h, b in rows))
+            self.conn.commit()
+
+    # [start, end) の測定値を列ごとの配列で返す（値がない所はNaN）
+    def load(self, device_id: str, start: float, end: float) -> dict:
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT ts, temperature, humidity FROM meter_readings
+                WHERE device_id = ? AND ts >= ? AND ts < ?
+                ORDER BY ts
+            ''', (device_id, int(start), int(end))).fetchall()
+        data = np.array(rows, dtype=float).reshape(-1, 3)
+        return {"ts": data[:, 0], "temperature": data[:, 1], "humidity": data[:, 2]}
+
+    # グラフのPNG．同じ区間内の呼び出しはキャッシュを返す
+    def chart(self, device_id: str, range_name: str, now: float = None) -> bytes:
+        span = HISTORY_RANGES[range_name]
+        bucket_seconds = span / CHART_WIDTH
+        now = time.time() if now is None else now
+        bucket = int(now // bucket_seconds)
+        key = (device_id, range_name, bucket)
+        with self.lock:
+            if key in self.charts:
+                self.charts.move_to_end(key)
+                return self.charts[key]
+
+        end = (bucket + 1) * bucket_seconds
+        start = end - span
+        png = render_chart(self.load(device_id, start, end), start, end, range_name)
+        with self.lock:
+            self.charts[key] = png
+            while len(self.charts) > CHART_CACHE_SIZE:
+                self.charts.popitem(last=False)
+        return png
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def render_chart(data: dict, start: float, end: float, range_name: str,
+                 width: int = CHART_WIDTH, height: int = CHART_HEIGHT) -> bytes:
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+    import pytz
+
+    font = get_font(regular_font_path, 10)
+    jst = pytz.timezone("Asia/Tokyo")
+    # matplotlibの日付は1970-01-01からの日数
+    to_days = 1 / 86400
+
+    fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+    ax_temp, ax_humi = fig.subplots(2, 1, sharex=True)
+    for ax, key, color, label in (
+        (ax_temp, "temperature", "tab:red", "温度 (℃)"),
+        (ax_humi, "humidity", "tab:blue", "湿度 (%)"),
+    ):
+        x, mean, lo, hi = downsample(data["ts"], data[key], start, end, width)
+        x = x * to_days
+        ax.fill_between(x, lo, hi, color=color, alpha=0.2, linewidth=0)
+        ax.plot(x, mean, color=color, linewidth=1)
+        ax.set_ylabel(label, fontproperties=font)
+        ax.grid(True, alpha=0.3)
+
+    locator = AutoDateLocator(tz=jst)
+    ax_humi.xaxis.set_major_locator(locator)
+    ax_humi.xaxis.set_major_formatter(ConciseDateFormatter(locator, tz=jst))
+    ax_humi.set_xlim(start * to_days, end * to_days)
+    ax_temp.set_title(f"直近{RANGE_LABELS[range_name]}の温湿度", fontproperties=font)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
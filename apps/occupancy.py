@@ -0,0 +1,165 @@
+import os
+from datetime import date, datetime, timedelta
+
+# 1日を15分ごとの96枠に分け，部屋・日ごとに使われている枠をビットで持つ（ビット i が i*15分〜）
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+HOUR_MASK = (1 << SLOTS_PER_HOUR) - 1
+
+# 利用率の分母にする時間帯（"HH:MM-HH:MM"）
+USAGE_OPEN_HOURS = os.getenv("USAGE_OPEN_HOURS", "08:00-22:00")
+
+# [start_slot, end_slot) のビット
+def slot_mask(start_slot: int, end_slot: int) -> int:
+    if end_slot <= start_slot:
+        return 0
+    return ((1 << (end_slot - start_slot)) - 1) << start_slot
+
+def _slot(hhmm: str) -> int:
+    h, m = hhmm.strip().split(":")
+    return (int(h) * 60 + int(m)) // SLOT_MINUTES
+
+def parse_open_hours(text: str) -> int:
+    start, end = text.split("-")
+    end_slot = SLOTS_PER_DAY if end.strip() in ("24:00", "00:00") else _slot(end)
+    return slot_mask(_slot(start), end_slot)
+
+OPEN_MASK = parse_open_hours(USAGE_OPEN_HOURS)
+
+# 予約 [start, end) が使う (日付, ビット) のリスト（日をまたぐ予約は日ごとに分ける）
+# 一部でもかかる枠は使用中とみなす
+def reservation_masks(start: str, end: str) -> list:
+    sdt = datetime.fromisoformat(start)
+    edt = datetime.fromisoformat(end)
+    masks = []
+    day = sdt.date()
+    while True:
+        day_start = datetime(day.year, day.month, day.day)
+        lo = max(sdt, day_start) - day_start
+        hi = min(edt, day_start + timedelta(days=1)) - day_start
+        if hi <= lo:
+            break
+        first = int(lo.total_seconds()) // (SLOT_MINUTES * 60)
+        last = -(-int(hi.total_seconds()) // (SLOT_MINUTES * 60))
+        masks.append((day, slot_mask(first, last)))
+        day += timedelta(days=1)
+    return masks
+
+def slot_label(slot: int) -> str:
+    minutes = slot * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# 連続して立っているビットの区間 [(開始枠, 終了枠), ...]
+def runs(bits: int) -> list:
+    result = []
+    offset = 0
+    while bits:
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip
+        offset += skip
+        length = ((bits + 1) & ~bits).bit_length() - 1
+        result.append((offset, offset + length))
+        bits >>= length
+        offset += length
+    return result
+
+# 部屋・日ごとの使用枠の索引．ReservationManagerの書き込みフックで更新する
+# 同じ枠に重なる予約もありうるので，予約ごとのビットを持ち，日ごとのORをキャッシュする
+class OccupancyIndex:
+    def __init__(self, open_mask: int = OPEN_MASK):
+        self.open_mask = open_mask
+        self.by_reservation = {}  # id -> [(部屋, 日付, ビット), ...]
+        self.members = {}         # (部屋, 日付) -> {id: ビット}
+        self.days = {}            # (部屋, 日付) -> 使用中のビット
+
+    def load(self, rows):
+        self.by_reservation.clear()
+        self.members.clear()
+        self.days.clear()
+        for row in rows:
+            self._insert(row)
+
+    # 書き込みフック: 追加(None, new)・更新(old, new)・削除(old, None)
+    def apply(self, old_row, new_row):
+        if old_row is not None:
+            self._remove(old_row[0])
+        if new_row is not None:
+            self._insert(new_row)
+
+    def _insert(self, row):
+        reservation_id, room, start, end = row[0], row[3], row[4], row[5]
+        self._remove(reservation_id)
+        entries = [(room, day, mask) for day, mask in reservation_masks(start, end)]
+        self.by_reservation[reservation_id] = entries
+        for room, day, mask in entries:
+            self.members.setdefault((room, day), {})[reservation_id] = mask
+            self.days[(room, day)] = self.days.get((room, day), 0) | mask
+
+    def _remove(self, reservation_id):
+        for room, day, _ in self.by_reservation.pop(reservation_id, ()):
+            key = (room, day)
+            members = self.members.get(key)
+            if members is None:
+                continue
+            members.pop(reservation_id, None)
+            if members:
+                bits = 0
+                for mask in members.values():
+                    bits |= mask
+                self.days[key] = bits
+            else:
+                del self.members[key]
+                del self.days[key]
+
+    def rooms(self) -> list:
+        return sorted({room for room, _ in self.days})
+
+    def bits(self, room: str, day: date) -> int:
+        return self.days.get((room, day), 0)
+
+    # [start, start+days) の利用率: (使用枠数, 営業時間内の枠数)
+    def utilization(self, room: str, start: date, days: int) -> tuple:
+        used = 0
+        for i in range(days):
+            used += (self.bits(room, start + timedelta(days=i)) & self.open_mask).bit_count()
+        return used, self.open_mask.bit_count() * days
+
+    # 時間帯ごとの使用枠数（24要素）
+    def hourly(self, room: str, start: date, days: int) -> list:
+        counts = [0] * 24
+        for i in range(days):
+            bits = self.bits(room, start + timedelta(days=i))
+            hour = 0
+            while bits:
+                counts[hour] += (bits & HOUR_MASK).bit_count()
+                bits >>= SLOTS_PER_HOUR
+                hour += 1
+        return counts
+
+    # 営業時間内で minutes 分以上続けて空いている区間
+    def free_slots(self, room: str, day: date, minutes: int) -> list:
+        need = -(-minutes // SLOT_MINUTES)
+        free = ~self.bits(room, day) & self.open_mask
+        return [(lo, hi) for lo, hi in runs(free) if hi - lo >= need]
+
+# /usage の本文
+def format_usage(index: OccupancyIndex, rooms: list, start: date, days: int, top: int = 3) -> str:
+    end = start + timedelta(days=days - 1)
+    lines = [f"**部屋の利用状況** {start.month}/{start.day}〜{end.month}/{end.day}"]
+    for room in rooms:
+        used, total = index.utilization(room, start, days)
+        rate = used / total * 100 if total else 0.0
+        hourly = index.hourly(room, start, days)
+        peaks = sorted((h for h in range(24) if hourly[h]), key=lambda h: -hourly[h])[:top]
+        peak_text = "，".join(f"{h}時台" for h in sorted(peaks)) or "なし"
+        lines.append(f"{room}: {rate:.1f}%（{used * SLOT_MINUTES / 60:.1f}時間）　混む時間帯: {peak_text}")
+    if len(lines) == 1:
+        lines.append("予約がありません。")
+    return "\n".join(lines)
+
+def format_free_slots(room: str, day: date, slots: list) -> str:
+    header = f"**{room}の空き時間** {day.month}/{day.day}"
+    if not slots:
+        return header + "\n空いている時間帯はありません。"
+    return header + "\n" + "\n".join(f"{slot_label(lo)} - {slot_label(hi)}" for lo, hi in slots)
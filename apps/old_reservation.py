@@ -3,125 +3,207 @@ load_dotenv()
 
 import os
 import sqlite3
-from pathlib import Path
 from datetime import datetime, timedelta
 import io
 import asyncio
+import logging
 
 import pytz
 from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib.table import Table
-from matplotlib.font_manager import FontProperties
 
 import discord
 from discord import app_commands
 from discord.ui import Modal, TextInput, View, Select, Button
-from discord.ext import tasks
+
+from outbound import get_outbound, PRIORITY_LOG, PRIORITY_DIGEST
+from client_profile import resolve_channel
+from reservation_table import (
+    TABLE_HEADER,
+    format_date, format_time_range,
+    create_table_image, create_table_images,
+    BoardTiles,
+)
+from reservation_index import ReservationIndex, display_row
+from reservation_export import (
+    ExportFilter, EXPORT_MAX_BYTES, PREVIEW_PAGE_SIZE,
+    export_reservations, fetch_page, format_page,
+)
+from reservation_import import IMPORT_MAX_ERRORS, decode_csv, parse_csv, find_overlaps
+from occupancy import OccupancyIndex, format_usage, format_free_slots
+from ical_feed import CalendarFeed, ICAL_PORT
+from scheduler import Scheduler, ScheduledJob, daily_at, weekly_at, every
+from interactions import interaction_handler, acknowledge, reply
+from reminders import (
+    ReminderQueue, REMINDER_MINUTES, REMINDER_DM, NOTIFIED_DIGEST, NOTIFIED_REMINDER, format_reminder,
+)
+
+logger = logging.getLogger("nlabot.reservation")
 
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID", "0")
 BUTTON_CH_ID  = int(os.getenv("DISCORD_RSV_BUTTON_CH", "0"))
 LOG_CH_ID     = int(os.getenv("DISCORD_RSV_LOG_CH", "0"))
 TEST_CHANNEL_ID = int(os.getenv("TEST_CHANNEL_ID", "0"))
 
-regular_font_path = Path(__file__).resolve().parents[1] / "fonts" / "NotoSansCJKjp-Regular.ttf"
-bold_font_path    = Path(__file__).resolve().parents[1] / "fonts" / "NotoSansCJKjp-Bold.ttf"
-
 JST = pytz.timezone("Asia/Tokyo")
 
 DEBUG_MODE = False
 
+# 予約表の週ごとのタイル
+board_tiles = BoardTiles()
+
 # 起動時
-async def init_reservations(bot: discord.Client):
+async def init_reservations(bot: discord.Client, board_message_id: int = None):
     """
     Bot起動時に呼ばれる:
       - コマンドを登録
       - 予約通知タスク開始
       - 過去メッセージ削除
       - 予約表メッセージ新規投稿 (以降は同じメッセージを編集)
+    board_message_id があれば前回の予約表メッセージを削除せずに使い続ける．
     """
     register_reservation_commands(bot.tree, bot)
 
-    # 当日予約通知タスク
-    ReservationNotifier(bot).start()
+    # チャンネルと管理者は設定の再読み込みで差し替える
+    if getattr(bot, "config", None):
+        bot.config.subscribe(lambda config: apply_config(bot, config), "channels")
+
+    # ログ画像はキュー側でまとめて描画する（描画ワーカーがあればそちらで描く）
+    get_outbound(bot).table_renderer = getattr(bot, "render_table", create_table_image)
 
-    # 週間スケジュール通知タスク
-    bot.loop.create_task(weekly_schedule_notifications(bot))
+    # 当日・週間の予約通知タスク
+    bot.reservation_notifier = ReservationNotifier(bot)
+    bot.reservation_notifier.start()
+
+    # 開始前のリマインド
+    if REMINDER_MINUTES > 0:
+        bot.reminder_queue = ReminderQueue(reservation_manager, lambda row: send_reminder(bot, row))
+        bot.reminder_queue.start()
 
     # 予約の自動削除タスク
-    bot.loop.create_task(cleanup_expired_reservations(bot))
+    bot.reservation_cleanup_task = bot.loop.create_task(cleanup_expired_reservations(bot))
+
+    # iCalendarフィード
+    if ICAL_PORT and getattr(bot, "calendar_feed", None) is None:
+        bot.calendar_feed = CalendarFeed(reservation_manager)
+        try:
+            await bot.calendar_feed.start()
+        except OSError as e:
+            logger.error("カレンダーの配信を開始できません: %s", e)
 
-    channel = bot.get_channel(BUTTON_CH_ID)
-    if channel:
+    # 予約表メッセージを保持
+    bot.reservation_message = None
+
+    channel = await resolve_channel(bot, BUTTON_CH_ID)
+    if channel and board_message_id:
+        try:
+            bot.reservation_message = await channel.fetch_message(board_message_id)
+        except discord.HTTPException as e:
+            logger.info("前回の予約表メッセージを使えません: %s", e)
+
+    if channel and bot.reservation_message is None:
         try:
             async for message in channel.history(limit=10):
                 if message.author.id == bot.user.id:
                     await message.delete()
         except Exception as e:
-            print("予約表の削除に失敗しました:", e)
+            logger.warning("予約表の削除に失敗しました: %s", e)
 
     control_view = ReservationControlView()
     bot.control_view = control_view
     bot.add_view(control_view)
 
-    # 予約表メッセージを保持
-    bot.reservation_message = None
-
     # 今月以降の予約を表示
     await update_reservation_message(bot, control_view)
 
+# 設定の再読み込み時に呼ばれる
+def apply_config(bot: discord.Client, config):
+    global ADMIN_USER_ID, BUTTON_CH_ID, LOG_CH_ID, TEST_CHANNEL_ID
+    channels = config.channels
+    ADMIN_USER_ID = channels.admin_user
+    BUTTON_CH_ID = channels.reservation_button
+    LOG_CH_ID = channels.reservation_log
+    TEST_CHANNEL_ID = channels.test
+    notifier = getattr(bot, "reservation_notifier", None)
+    if notifier:
+        notifier.channel_id = LOG_CH_ID
+
+# 停止時: 通知・リマインド・削除タスクとカレンダーの配信を止めてDBを閉じる
+async def shutdown_reservations(bot: discord.Client):
+    notifier = getattr(bot, "reservation_notifier", None)
+    if notifier:
+        notifier.stop()
+    task = getattr(bot, "reservation_cleanup_task", None)
+    if task:
+        task.cancel()
+    reminders = getattr(bot, "reminder_queue", None)
+    if reminders:
+        reminders.stop()
+    feed = getattr(bot, "calendar_feed", None)
+    if feed:
+        await feed.stop()
+    reservation_manager.close()
+
 # 予約表の更新
 async def update_reservation_message(bot: discord.Client, control_view: discord.ui.View):
-    channel = bot.get_channel(BUTTON_CH_ID)
+    channel = await resolve_channel(bot, BUTTON_CH_ID)
     if channel is None:
-        print("ボタン表示用チャンネルが見つかりません。")
+        logger.warning("ボタン表示用チャンネルが見つかりません。")
         return
 
     now = datetime.now()
     start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     end_of_time = datetime(9999,12,31,23,59,59)
-    reservations = reservation_manager.get_reservations_in_range(start_of_month, end_of_time)
-
-    table_data = [["団体名", "日付 (曜日)", "部屋", "時間"]]
-    weekdays = {0:" (月) ",1:" (火) ",2:" (水) ",3:" (木) ",4:" (金) ",5:" (土) ",6:" (日) "}
-
-    for res in reservations:
-        group = res[2]
-        room  = res[3]
 
-        # strptimeでパース
-        start_dt_jst = datetime.strptime(res[4], "%Y-%m-%d %H:%M:%S")
-        end_dt_jst   = datetime.strptime(res[5], "%Y-%m-%d %H:%M:%S")
+    # 表示用に整形済みの行を週ごとに取得し，変更のあった週のタイルだけ描き直す
+    week_rows = reservation_manager.get_board_rows(start_of_month, end_of_time)
+    pages, shown = await asyncio.to_thread(board_tiles.render_pages, week_rows)
 
-        date_str = f"{start_dt_jst.month}月{start_dt_jst.day}日" + weekdays[start_dt_jst.weekday()]
-        time_str = f"{start_dt_jst.strftime('%H:%M')} - {end_dt_jst.strftime('%H:%M')}"
-        table_data.append([group, date_str, room, time_str])
-
-    img_buf = create_table_image_matplotlib(table_data, font_size=14)
-    file = discord.File(fp=img_buf, filename="current_month.png")
+    content = "**ℹ️ 予約一覧**"
+    if shown < len(week_rows):
+        content += f"\n（全{len(week_rows)}件のうち先頭{shown}件のみ表示）"
 
     if getattr(bot, "reservation_message", None):
+        # 内容の変わっていないページは既存の添付をそのまま使う
+        existing = {a.filename: a for a in bot.reservation_message.attachments}
+        attachments = [
+            existing.get(filename) or discord.File(fp=io.BytesIO(data), filename=filename)
+            for filename, data in pages
+        ]
         try:
-            await bot.reservation_message.edit(
-                content="**ℹ️ 予約一覧**",
-                attachments=[file],
+            bot.reservation_message = await bot.reservation_message.edit(
+                content=content,
+                attachments=attachments,
                 view=control_view
             )
         except Exception as e:
-            print("reservation_message 編集失敗:", e)
+            logger.warning("reservation_message 編集失敗: %s", e)
     else:
+        files = [discord.File(fp=io.BytesIO(data), filename=filename) for filename, data in pages]
         bot.reservation_message = await channel.send(
-            "**ℹ️ 予約一覧**",
-            file=file,
+            content,
+            files=files,
             view=control_view
         )
 
 # 予約の取得・管理
+# 読み出しはメモリ上の索引から行い，書き込みはDBに反映したうえで索引とフックに通知する
 class ReservationManager:
     def __init__(self, db_path="reservations.db"):
+        self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.create_table()
 
+        # 書き込みフック: hook(old_row, new_row)
+        self._write_hooks = []
+        rows = self._select_all()
+        self.index = ReservationIndex()
+        self.index.load(rows)
+        self.add_write_hook(self.index.apply)
+        # 部屋・日ごとの使用枠（/usage，/free 用）
+        self.occupancy = OccupancyIndex()
+        self.occupancy.load(rows)
+        self.add_write_hook(self.occupancy.apply)
+
     def create_table(self):
         c = self.conn.cursor()
         c.execute('''
@@ -136,80 +218,165 @@ class ReservationManager:
                 notified INTEGER DEFAULT 0
             )
         ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_start ON reservations (start_datetime)")
         self.conn.commit()
 
+    def _select_all(self):
+        c = self.conn.cursor()
+        c.execute('''
+            SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
+            FROM reservations
+        ''')
+        return c.fetchall()
+
+    def add_write_hook(self, hook):
+        self._write_hooks.append(hook)
+
+    def _notify(self, old_row, new_row):
+        for hook in self._write_hooks:
+            try:
+                hook(old_row, new_row)
+            except Exception as e:
+                logger.exception("書き込みフックでエラー: %s", e)
+
     # "YYYY-MM-DD HH:MM:SS"形式でDBへ保存
     def add_reservation(self, user_id, group_name, room_type, start_datetime, end_datetime):
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         c = self.conn.cursor()
         c.execute('''
             INSERT INTO reservations (user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified)
             VALUES (?, ?, ?, ?, ?, ?, 0)
-        ''', (user_id, group_name, room_type, start_datetime, end_datetime, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        ''', (user_id, group_name, room_type, start_datetime, end_datetime, created_at))
         self.conn.commit()
+        self._notify(None, (c.lastrowid, user_id, group_name, room_type, start_datetime, end_datetime, created_at, 0))
         return c.lastrowid
 
+    # まとめて追加する（1トランザクション）．rows は (user_id, 団体名, 部屋, 開始, 終了)，追加した行を返す
+    def add_reservations_bulk(self, rows: list) -> list:
+        if not rows:
+            return []
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn:
+            c = self.conn.cursor()
+            last_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM reservations").fetchone()[0]
+            c.executemany('''
+                INSERT INTO reservations (user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', [(*row, created_at) for row in rows])
+            added = c.execute('''
+                SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
+                FROM reservations WHERE id > ? ORDER BY id
+            ''', (last_id,)).fetchall()
+        for row in added:
+            self._notify(None, row)
+        return added
+
     # JSTのstart_dt，end_dtを"YYYY-MM-DD HH:MM:SS"に変換して検索
     def get_reservations_in_range(self, start_dt: datetime, end_dt: datetime):
-        c = self.conn.cursor()
         start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
         end_str   = end_dt.strftime("%Y-%m-%d %H:%M:%S")
-        c.execute('''
-            SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
-            FROM reservations
-            WHERE datetime(start_datetime) >= ? AND datetime(start_datetime) < ?
-            ORDER BY start_datetime ASC
-        ''', (start_str, end_str))
-        return c.fetchall()
+        return self.index.range(start_str, end_str)
+
+    # 表の行 [団体名, "1月10日 (金) ", 部屋, "14:00 - 16:00"]
+    def get_table_rows_in_range(self, start_dt: datetime, end_dt: datetime) -> list:
+        return [list(row) for _, row in self.get_board_rows(start_dt, end_dt)]
+
+    # 予約表用: (週の月曜日 "YYYY-MM-DD", 表の行) のリスト
+    def get_board_rows(self, start_dt: datetime, end_dt: datetime) -> list:
+        return [
+            display_row(res[2], res[3], res[4], res[5])
+            for res in self.get_reservations_in_range(start_dt, end_dt)
+        ]
 
     def get_reservation_by_id(self, reservation_id):
-        c = self.conn.cursor()
-        c.execute('''
-            SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
-            FROM reservations
-            WHERE id = ?
-        ''', (reservation_id,))
-        return c.fetchone()
+        return self.index.get(reservation_id)
 
     def delete_reservation(self, reservation_id):
+        old_row = self.index.get(reservation_id)
         c = self.conn.cursor()
         c.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
         self.conn.commit()
+        if old_row is not None:
+            self._notify(old_row, None)
 
+    # 開始時刻が変わったらリマインドを送り直す
     def update_reservation(self, reservation_id, group_name, room_type, start_datetime, end_datetime):
+        old_row = self.index.get(reservation_id)
         c = self.conn.cursor()
         c.execute('''
             UPDATE reservations
-            SET group_name = ?, room_type = ?, start_datetime = ?, end_datetime = ?
+            SET group_name = ?, room_type = ?, start_datetime = ?, end_datetime = ?,
+                notified = CASE WHEN start_datetime = ? THEN notified ELSE notified & ~? END
             WHERE id = ?
-        ''', (group_name, room_type, start_datetime, end_datetime, reservation_id))
+        ''', (group_name, room_type, start_datetime, end_datetime,
+              start_datetime, NOTIFIED_REMINDER, reservation_id))
         self.conn.commit()
+        if old_row is not None:
+            notified = old_row[7] if old_row[4] == start_datetime else old_row[7] & ~NOTIFIED_REMINDER
+            new_row = old_row[:2] + (group_name, room_type, start_datetime, end_datetime, old_row[6], notified)
+            self._notify(old_row, new_row)
 
     def mark_notified(self, reservation_id):
+        old_row = self.index.get(reservation_id)
+        c = self.conn.cursor()
+        c.execute("UPDATE reservations SET notified = notified | ? WHERE id = ?", (NOTIFIED_DIGEST, reservation_id))
+        self.conn.commit()
+        if old_row is not None:
+            self._notify(old_row, old_row[:7] + (old_row[7] | NOTIFIED_DIGEST,))
+
+    # リマインドを送る権利を取る．まだ送っていなければ印を付けて行を返す（送信済みならNone）
+    def claim_reminder(self, reservation_id):
+        old_row = self.index.get(reservation_id)
+        c = self.conn.cursor()
+        c.execute(
+            "UPDATE reservations SET notified = notified | ? WHERE id = ? AND (notified & ?) = 0",
+            (NOTIFIED_REMINDER, reservation_id, NOTIFIED_REMINDER),
+        )
+        self.conn.commit()
+        if c.rowcount != 1 or old_row is None:
+            return None
+        new_row = old_row[:7] + (old_row[7] | NOTIFIED_REMINDER,)
+        self._notify(old_row, new_row)
+        return new_row
+
+    # 終了時刻を過ぎた予約をまとめて削除し，削除した件数を返す
+    def delete_expired(self, now: datetime) -> int:
+        expired = self.index.expired(now.strftime("%Y-%m-%d %H:%M:%S"))
+        if not expired:
+            return 0
+        c = self.conn.cursor()
+        c.executemany("DELETE FROM reservations WHERE id = ?", [(row[0],) for row in expired])
+        self.conn.commit()
+        for row in expired:
+            self._notify(row, None)
+        return len(expired)
+
+    def delete_all(self):
+        rows = list(self.index.rows.values())
         c = self.conn.cursor()
-        c.execute("UPDATE reservations SET notified = 1 WHERE id = ?", (reservation_id,))
+        c.execute("DELETE FROM reservations")
         self.conn.commit()
+        for row in rows:
+            self._notify(row, None)
+
+    # 未確定の書き込みを反映して閉じる
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    # [start_dt, end_dt) と重なる予約
+    def get_overlapping_reservations(self, start_dt: datetime, end_dt: datetime, room_type: str = None):
+        return self.index.overlapping(
+            start_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            room_type
+        )
 
-    # 予約の取得（DBのstart_datetimeから現在でフィルタ）
+    # 予約の取得（start_datetimeが現在以降）
     def get_future_reservations(self, user_id: str = None):
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        c = self.conn.cursor()
-        if user_id:
-            c.execute('''
-                SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
-                FROM reservations
-                WHERE datetime(start_datetime) >= ?
-                  AND user_id = ?
-                ORDER BY start_datetime ASC
-            ''', (now_str, user_id))
-        else:
-            c.execute('''
-                SELECT id, user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified
-                FROM reservations
-                WHERE datetime(start_datetime) >= ?
-                ORDER BY start_datetime ASC
-            ''', (now_str,))
-        return c.fetchall()
-    
+        return self.index.range(now_str, "9999-12-31 23:59:59", user_id=user_id or None)
+
     # 当日の予約の取得
     def get_reservations_for_date(self, date_):
         start_dt = datetime(date_.year, date_.month, date_.day, 0, 0, 0)
@@ -218,54 +385,13 @@ class ReservationManager:
 
 reservation_manager = ReservationManager()
 
-# テーブルイメージ
-def create_table_image_matplotlib(table_data, font_size=14, cell_padding=10,
-                                  regular_font_path=regular_font_path,
-                                  bold_font_path=bold_font_path):
-    n_rows = len(table_data)
-    n_cols = len(table_data[0])
-    cell_width = 150
-    cell_height= 30
-    width  = n_cols * cell_width + cell_padding*2
-    height = n_rows * cell_height + cell_padding*2
-
-    regular_font = FontProperties(fname=regular_font_path, size=font_size)
-    bold_font    = FontProperties(fname=bold_font_path,    size=font_size)
-
-    fig, ax = plt.subplots(figsize=(width/100, height/100), dpi=100)
-    ax.set_axis_off()
-    table = Table(ax, bbox=[0, 0, 1, 1])
-    for i, row in enumerate(table_data):
-        for j, cell_text in enumerate(row):
-            if i != 0 and j==0 and len(cell_text) > 10:
-                cell_font = FontProperties(fname=bold_font_path, size=font_size-2)
-            else:
-                cell_font = bold_font if (i==0 or j==0) else regular_font
-            cell = table.add_cell(i, j, width=cell_width, height=cell_height,
-                                  text=cell_text, loc="center")
-            cell.get_text().set_fontproperties(cell_font)
-            cell.get_text().set_ha("center")
-            cell.get_text().set_va("center")
-
-    for i in range(n_rows):
-        table.add_cell(i, -1, width=0, height=cell_height)
-    for j in range(n_cols):
-        table.add_cell(-1, j, width=cell_width, height=0)
-
-    ax.add_table(table)
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)
-    buf.seek(0)
-    return buf
-
-# ログの更新
+# ログの更新（連続したログは1枚の表にまとめて送信）
 async def update_log_message(client: discord.Client, header_text: str, table_data: list):
-    img_buf = create_table_image_matplotlib(table_data, font_size=14)
-    file = discord.File(fp=img_buf, filename="log_table.png")
-    log_channel = client.get_channel(LOG_CH_ID)
-    if log_channel:
-        await log_channel.send(content=header_text, file=file)
+    get_outbound(client).enqueue(
+        LOG_CH_ID, header_text,
+        table=table_data, filename="log_table.png",
+        priority=PRIORITY_LOG, coalesce=True
+    )
 
 # 団体名の選択
 class OrganizationSelectView(View):
@@ -351,6 +477,8 @@ class ReservationModal(Modal):
         else:
             pass
 
+    # 書き込み・ログ画像・予約一覧の更新で3秒を超えることがあるので先にdeferする
+    @interaction_handler()
     async def on_submit(self, interaction: discord.Interaction):
         try:
             # 編集モード
@@ -376,7 +504,7 @@ class ReservationModal(Modal):
 
                 # バリデーション
                 if start_dt_naive >= end_dt_naive:
-                    await interaction.response.send_message("開始時刻は終了時刻より前にしてください。", ephemeral=True)
+                    await reply(interaction, "開始時刻は終了時刻より前にしてください。", ephemeral=True)
                     return
 
                 start_jst_str = start_dt_naive.strftime("%Y-%m-%d %H:%M:%S")
@@ -393,22 +521,18 @@ class ReservationModal(Modal):
                 )
 
                 # ログ用
-                weekdays = {0:"(月)",1:"(火)",2:"(水)",3:"(木)",4:"(金)",5:"(土)",6:"(日)"}
-                w = weekdays[start_dt_naive.weekday()]
-                date_disp = f"{start_dt_naive.month}月{start_dt_naive.day}日 {w}"
-                time_disp = f"{start_time_str} - {end_time_str}"
                 table_data = [
-                    ["団体名","日付","部屋","時間"],
-                    [group, date_disp, room, time_disp]
+                    TABLE_HEADER,
+                    [group, format_date(start_dt_naive), room, format_time_range(start_dt_naive, end_dt_naive)]
                 ]
 
+                await reply(interaction, "予約を更新しました。", ephemeral=True)
+
                 # ログchに画像投稿
                 await update_log_message(interaction.client, "✏️ 予約を変更しました", table_data)
 
                 # 予約一覧の再生成
                 await update_reservation_message(interaction.client, interaction.client.control_view)
-
-                await interaction.response.send_message("予約を更新しました。", ephemeral=True)
                 self.stop()
                 return
 
@@ -442,7 +566,7 @@ class ReservationModal(Modal):
 
                 # バリデーション
                 if start_dt_naive >= end_dt_naive:
-                    await interaction.response.send_message("開始時刻は終了時刻より前にしてください。", ephemeral=True)
+                    await reply(interaction, "開始時刻は終了時刻より前にしてください。", ephemeral=True)
                     return
                 start_jst_str = start_dt_naive.strftime("%Y-%m-%d %H:%M:%S")
                 end_jst_str   = end_dt_naive.strftime("%Y-%m-%d %H:%M:%S")
@@ -457,26 +581,21 @@ class ReservationModal(Modal):
                 )
 
                 # ログ用
-                weekdays = {0:" (月) ",1:" (火) ",2:" (水) ",3:" (木) ",4:" (金) ",5:" (土) ",6:" (日) "}
-                w = weekdays[start_dt_naive.weekday()]
-                date_disp = f"{start_dt_naive.month}月{start_dt_naive.day}日" + w
-                time_disp = f"{start_time_str} - {end_time_str}"
-
                 table_data = [
-                    ["団体名","日付 (曜日)","部屋","時間"],
-                    [group, date_disp, room, time_disp]
+                    TABLE_HEADER,
+                    [group, format_date(start_dt_naive), room, format_time_range(start_dt_naive, end_dt_naive)]
                 ]
 
+                await reply(interaction, "予約を追加しました。", ephemeral=True)
+
                 await update_log_message(interaction.client, "✅ 予約を追加しました", table_data)
 
                 # 予約一覧の再生成
                 await update_reservation_message(interaction.client, interaction.client.control_view)
-
-                await interaction.response.send_message("予約を追加しました。", ephemeral=True)
                 self.stop()
 
         except Exception as e:
-            await interaction.response.send_message(f"エラーが発生: {e}", ephemeral=True)
+            await reply(interaction, f"エラーが発生: {e}", ephemeral=True)
             return
 
 # その他団体
@@ -515,6 +634,7 @@ class ReservationModalOther(discord.ui.Modal, title="部屋の予約（団体名
             )
         )
 
+    @interaction_handler()
     async def on_submit(self, interaction: discord.Interaction):
         try:
             year = datetime.now().year
@@ -529,27 +649,18 @@ class ReservationModalOther(discord.ui.Modal, title="部屋の予約（団体名
             end_dt   = datetime.strptime(f"{date_str} {end_time_str}",   "%Y-%m-%d %H:%M")
 
             if start_dt >= end_dt:
-                await interaction.response.send_message("開始時刻は終了時刻より前です。", ephemeral=True)
+                await reply(interaction, "開始時刻は終了時刻より前です。", ephemeral=True)
                 return
             if start_dt < datetime.now():
-                await interaction.response.send_message("過去の日時には予約できません。", ephemeral=True)
+                await reply(interaction, "過去の日時には予約できません。", ephemeral=True)
                 return
 
-            c = reservation_manager.conn.cursor()
-            c.execute("""
-                SELECT id FROM reservations
-                WHERE datetime(replace(start_datetime, 'T', ' ')) < ?
-                  AND datetime(replace(end_datetime, 'T', ' ')) > ?
-            """, (
-                end_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                start_dt.strftime("%Y-%m-%d %H:%M:%S")
-            ))
-            if c.fetchall():
-                await interaction.response.send_message("その時間帯には既に予約があります。", ephemeral=True)
+            if reservation_manager.get_overlapping_reservations(start_dt, end_dt):
+                await reply(interaction, "その時間帯には既に予約があります。", ephemeral=True)
                 return
 
         except Exception as e:
-            await interaction.response.send_message(f"入力形式エラー: {e}", ephemeral=True)
+            await reply(interaction, f"入力形式エラー: {e}", ephemeral=True)
             return
 
         reservation_manager.add_reservation(
@@ -560,17 +671,12 @@ class ReservationModalOther(discord.ui.Modal, title="部屋の予約（団体名
             end_datetime=end_dt.strftime("%Y-%m-%d %H:%M:%S")
         )
 
-        weekdays = {0:" (月) ", 1:" (火) ", 2:" (水) ", 3:" (木) ", 4:" (金) ", 5:" (土) ", 6:" (日) "}
-        date_disp = f"{start_dt.month}月{start_dt.day}日" + weekdays[start_dt.weekday()]
-        time_disp = f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
-
         table_data = [
-            ["団体名", "日付 (曜日)", "部屋", "時間"],
-            [group, date_disp, self.room_type, time_disp]
+            TABLE_HEADER,
+            [group, format_date(start_dt), self.room_type, format_time_range(start_dt, end_dt)]
         ]
+        await reply(interaction, "予約を追加しました。", ephemeral=True)
         await update_log_message(interaction.client, "✅ 予約を追加しました", table_data)
-
-        await interaction.response.send_message("予約を追加しました。", ephemeral=True)
         await update_reservation_message(interaction.client, interaction.client.control_view)
 
 # 予約一覧表示・編集・削除
@@ -608,6 +714,8 @@ class ModifyReservationView(View):
         self.select.callback = self.select_callback
         self.add_item(self.select)
 
+    # 編集はModalを開くのでdeferできない．削除の経路だけdeferする
+    @interaction_handler(defer=False)
     async def select_callback(self, interaction: discord.Interaction):
         if self.select.values[0] == "none":
             await interaction.response.send_message("予約がありません。", ephemeral=True)
@@ -635,30 +743,25 @@ class ModifyReservationView(View):
             self.stop()
 
         elif self.mode == "delete":
+            await acknowledge(interaction, "ModifyReservationView.select_callback")
             start_dt = datetime.fromisoformat(res_data[4])
             end_dt   = datetime.fromisoformat(res_data[5])
-            weekdays = {0:"(月)",1:"(火)",2:"(水)",3:"(木)",4:"(金)",5:"(土)",6:"(日)"}
-            w = weekdays[start_dt.weekday()]
 
             table_data = [
-                ["団体名","日付","部屋","時間"],
-                [res_data[2],
-                 f"{start_dt.month}月{start_dt.day}日 {w}",
-                 res_data[3],
-                 f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
-                ]
+                TABLE_HEADER,
+                [res_data[2], format_date(start_dt), res_data[3], format_time_range(start_dt, end_dt)]
             ]
 
+            reservation_manager.delete_reservation(self.reservation_id)
+            await reply(interaction, "予約を削除しました。", ephemeral=True)
+
             # ❌ ログ投稿
             await update_log_message(interaction.client, "❌ 予約を取消しました", table_data)
 
-            reservation_manager.delete_reservation(self.reservation_id)
-            await interaction.response.send_message("予約を削除しました。", ephemeral=True)
-
             try:
                 await self.message_ref.edit(view=None)
             except Exception as e:
-                print(e)
+                logger.warning("選択メニューの削除に失敗しました: %s", e)
 
             # 表を更新
             await update_reservation_message(
@@ -675,11 +778,13 @@ class ReservationControlView(View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="予約", style=discord.ButtonStyle.primary, custom_id="btn_reserve")
+    @interaction_handler(defer=False)
     async def reserve_button(self, interaction: discord.Interaction, button: Button):
         org_view = OrganizationSelectView()
         await interaction.response.send_message("団体名を選択してください。", view=org_view, ephemeral=True)
     
     @discord.ui.button(label="編集", style=discord.ButtonStyle.secondary, custom_id="btn_edit")
+    @interaction_handler(defer=False)
     async def edit_button(self, interaction: discord.Interaction, button: Button):
         # 管理者かどうか判定
         is_admin = (str(interaction.user.id) == str(ADMIN_USER_ID))
@@ -710,6 +815,7 @@ class ReservationControlView(View):
         await interaction.response.send_message("編集する予約を選択してください。", view=view, ephemeral=True)
 
     @discord.ui.button(label="削除", style=discord.ButtonStyle.danger, custom_id="btn_delete")
+    @interaction_handler(defer=False)
     async def delete_button(self, interaction: discord.Interaction, button: Button):
         is_admin = (str(interaction.user.id) == str(ADMIN_USER_ID))
         if not is_admin:
@@ -737,109 +843,95 @@ class ReservationControlView(View):
 
         await interaction.response.send_message("削除する予約を選択してください。", view=view, ephemeral=True)
 
-# 当日スケジュールの通知，および自動削除
+# 当日・週間スケジュールの通知（毎朝6:00，毎週月曜6:00 JST）
 class ReservationNotifier:
     def __init__(self, bot: discord.Client):
         self.bot = bot
         self.channel_id = LOG_CH_ID
-        self.task = tasks.loop()(self.daily_notifications)
+        self.scheduler = Scheduler(reservation_manager.conn)
+
+        # デバッグモード: 60秒・90秒ごと
+        self.scheduler.add(ScheduledJob(
+            "daily_digest",
+            every(60) if DEBUG_MODE else daily_at(6),
+            self.post_daily,
+            prepare=self.prepare_daily
+        ))
+        self.scheduler.add(ScheduledJob(
+            "weekly_digest",
+            every(90) if DEBUG_MODE else weekly_at(0, 6),
+            self.post_weekly,
+            prepare=self.prepare_weekly
+        ))
 
     def start(self):
-        self.task.start()
-
-    async def daily_notifications(self):
-        while True:
-            now = datetime.now()
-            if DEBUG_MODE:
-                # デバッグモード: 90秒ごと
-                target_time = now
-                await asyncio.sleep(60)
-            else:
-                # リアルモード: 毎朝6:00に実行
-                target_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
-                if now > target_time:
-                    target_time += timedelta(days=1)
-                wait_seconds = (target_time - now).total_seconds()
-                await asyncio.sleep(wait_seconds)
-
-            # 今日の日付
-            now_jst = datetime.now()
-            today_jst = now_jst.date()
-            start_of_day = datetime(today_jst.year, today_jst.month, today_jst.day, 0, 0, 0)
-            end_of_day   = start_of_day + timedelta(days=1)
-
-            # DBから当日分を取得
-            reservations_today = reservation_manager.get_reservations_in_range(start_of_day, end_of_day)
-
-            channel = self.bot.get_channel(self.channel_id)
-            if channel and reservations_today:
-                weekdays = {0:" (月) ",1:" (火) ",2:" (水) ",3:" (木) ",4:" (金) ",5:" (土) ",6:" (日) "}
-                table_data = [["団体名", "日付 (曜日)", "部屋", "時間"]]
-
-                for res in reservations_today:
-                    group = res[2]
-                    room  = res[3]
-                    sdt = datetime.strptime(res[4], "%Y-%m-%d %H:%M:%S")
-                    edt = datetime.strptime(res[5], "%Y-%m-%d %H:%M:%S")
-
-                    date_str = f"{sdt.month}月{sdt.day}日" + weekdays[sdt.weekday()]
-                    time_str = f"{sdt.strftime('%H:%M')} - {edt.strftime('%H:%M')}"
-                    table_data.append([group, date_str, room, time_str])
-
-                img_buf = create_table_image_matplotlib(table_data, font_size=14)
-                file = discord.File(fp=img_buf, filename="today_reservations.png")
-                await channel.send("**ℹ️ 本日の予約一覧**", file=file)
-
-                for res in reservations_today:
-                    reservation_manager.mark_notified(res[0])
-
-# 一週間分の予約一覧
-async def weekly_schedule_notifications(bot: discord.Client):
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        now = datetime.now()
-
-        if DEBUG_MODE:
-            # デバッグモード: 90秒ごとに実行
-            next_monday = now
-            await asyncio.sleep(90)
-        else:
-            # リアルモード: 毎週月曜6:00に実行
-            if now.weekday() == 0 and now.hour < 6:
-                next_monday = now.replace(hour=6, minute=0, second=0, microsecond=0)
-            else:
-                days_until_monday = (7 - now.weekday()) % 7
-                if days_until_monday == 0:
-                    days_until_monday = 7
-                next_monday = (now + timedelta(days=days_until_monday)).replace(
-                    hour=6, minute=0, second=0, microsecond=0
-                )
-            wait_seconds = (next_monday - now).total_seconds()
-            await asyncio.sleep(wait_seconds)
-        
-        start_of_week = next_monday.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_week   = start_of_week + timedelta(days=7)
-
-        reservations_week = reservation_manager.get_reservations_in_range(start_of_week, end_of_week)
-        channel = bot.get_channel(LOG_CH_ID)
-
-        if channel and reservations_week:
-            table_data = [["団体名", "日付 (曜日)", "部屋", "時間"]]
-            weekdays = {0: " (月) ", 1: " (火) ", 2: " (水) ",
-                        3: " (木) ", 4: " (金) ", 5: " (土) ", 6: " (日) "}
-
-            for res in reservations_week:
-                group = res[2]
-                room  = res[3]
-                sdt = datetime.strptime(res[4], "%Y-%m-%d %H:%M:%S")
-                edt = datetime.strptime(res[5], "%Y-%m-%d %H:%M:%S")
-                date_str = f"{sdt.month}月{sdt.day}日" + weekdays[sdt.weekday()]
-                time_str = f"{sdt.strftime('%H:%M')} - {edt.strftime('%H:%M')}"
-                table_data.append([group, date_str, room, time_str])
-
-            img_buf = create_table_image_matplotlib(table_data, font_size=14)
-            file = discord.File(fp=img_buf, filename="weekly_reservations.png")
-            await channel.send("**ℹ️ 今週の予約一覧**", file=file)
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+
+    @staticmethod
+    def _day_range(due: datetime):
+        start = due.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        return start, start + timedelta(days=1)
+
+    @staticmethod
+    def _week_range(due: datetime):
+        start = due.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        return start, start + timedelta(days=7)
+
+    # 表の行と描画済みPNGを用意する
+    async def _render(self, start: datetime, end: datetime):
+        rows = reservation_manager.get_table_rows_in_range(start, end)
+        if not rows:
+            return rows, []
+        img_bufs = await asyncio.to_thread(create_table_images, [TABLE_HEADER] + rows, font_size=14)
+        return rows, [buf.getvalue() for buf in img_bufs]
+
+    # 事前に描画した画像は，予約に変更が無ければそのまま使う
+    async def _post(self, start: datetime, end: datetime, prepared, content: str, filename: str) -> bool:
+        rows = reservation_manager.get_table_rows_in_range(start, end)
+        if not rows:
+            return False
+        if prepared is None or prepared[0] != rows:
+            prepared = await self._render(start, end)
+        files = [
+            discord.File(fp=io.BytesIO(data), filename=f"{filename}_{i + 1}.png")
+            for i, data in enumerate(prepared[1])
+        ]
+        await get_outbound(self.bot).send(self.channel_id, content, files=files, priority=PRIORITY_DIGEST)
+        return True
+
+    async def prepare_daily(self, due: datetime):
+        return await self._render(*self._day_range(due))
+
+    async def post_daily(self, due: datetime, prepared):
+        start, end = self._day_range(due)
+        if await self._post(start, end, prepared, "**ℹ️ 本日の予約一覧**", "today_reservations"):
+            for res in reservation_manager.get_reservations_in_range(start, end):
+                reservation_manager.mark_notified(res[0])
+
+    async def prepare_weekly(self, due: datetime):
+        return await self._render(*self._week_range(due))
+
+    async def post_weekly(self, due: datetime, prepared):
+        start, end = self._week_range(due)
+        await self._post(start, end, prepared, "**ℹ️ 今週の予約一覧**", "weekly_reservations")
+
+# 予約ログchに送り，REMINDER_DM=1なら予約したユーザーにもDMする
+async def send_reminder(bot: discord.Client, row):
+    text = format_reminder(row)
+    outbound = get_outbound(bot)
+    outbound.enqueue(LOG_CH_ID, text, priority=PRIORITY_LOG)
+    if not REMINDER_DM:
+        return
+    try:
+        user = bot.get_user(int(row[1])) or await bot.fetch_user(int(row[1]))
+        dm = await user.create_dm()
+    except (ValueError, discord.HTTPException) as e:
+        logger.warning("リマインドのDMを送れません (%s): %s", row[1], e)
+        return
+    outbound.enqueue(dm.id, text, priority=PRIORITY_LOG)
 
 async def cleanup_expired_reservations(bot: discord.Client):
     await asyncio.sleep(5)
@@ -851,33 +943,23 @@ async def cleanup_expired_reservations(bot: discord.Client):
     while True:
         now_jst = datetime.now()
 
-        # 全予約を取得
-        c = reservation_manager.conn.cursor()
-        c.execute("SELECT id, end_datetime FROM reservations")
-        rows = c.fetchall()
+        # 終了時刻を過ぎたら削除
+        deleted = reservation_manager.delete_expired(now_jst)
 
-        # end_datetimeをパース
-        for row in rows:
-            res_id = row[0]
-            end_str = row[1]
-            end_dt = datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")  # JST naive
-
-            # 終了時刻を過ぎたら削除
-            if end_dt <= now_jst:
-                c2 = reservation_manager.conn.cursor()
-                c2.execute("DELETE FROM reservations WHERE id = ?", (res_id,))
-                reservation_manager.conn.commit()
-
-        # 予約表を更新
-        if getattr(bot, "control_view", None):
+        # 削除があったときだけ予約表を更新
+        if deleted and getattr(bot, "control_view", None):
             await update_reservation_message(bot, bot.control_view)
 
         await asyncio.sleep(interval)
 
-# コマンドの登録 （dump_db, reset_db）
+# コマンドの登録 （dump_db, reset_db, export, import, usage, free）
 def register_reservation_commands(tree: app_commands.CommandTree, bot: discord.Client):
     tree.add_command(dump_db_command)
     tree.add_command(reset_db_command)
+    tree.add_command(export_command)
+    tree.add_command(import_command)
+    tree.add_command(usage_command)
+    tree.add_command(free_command)
 
 @app_commands.command(name="dump_db", description="デバッグ用: DBの内容を出力する")
 async def dump_db_command(interaction: discord.Interaction):
@@ -888,9 +970,7 @@ async def dump_db_command(interaction: discord.Interaction):
         await interaction.response.send_message("DBには予約が登録されていません。", ephemeral=True)
         return
 
-    output = "DB:\n"
-    for row in rows:
-        output += f"{row}\n"
+    output = "DB:\n" + "".join(f"{row}\n" for row in rows)
 
     # 2000文字を超えるならファイル
     if len(output) > 1900:
@@ -907,7 +987,162 @@ async def reset_db_command(interaction: discord.Interaction):
         await interaction.response.send_message("このコマンドは管理者のみが実行できます。", ephemeral=True)
         return
 
-    c = reservation_manager.conn.cursor()
-    c.execute("DELETE FROM reservations")
-    reservation_manager.conn.commit()
+    reservation_manager.delete_all()
     await interaction.response.send_message("DBの全予約を削除しました。", ephemeral=True)
+
+# エクスポートのプレビュー（前後のページをDBから読み直す）
+class ExportPreviewView(View):
+    def __init__(self, filters: ExportFilter, first_page: list):
+        super().__init__(timeout=300)
+        self.filters = filters
+        self.page = first_page
+        # 各ページの直前のキー（先頭ページはNone）
+        self.starts = [None]
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.prev_button.disabled = len(self.starts) <= 1
+        self.next_button.disabled = len(self.page) < PREVIEW_PAGE_SIZE
+
+    def content(self) -> str:
+        return f"プレビュー（{len(self.starts)}ページ目）\n{format_page(self.page)}"
+
+    # 読み込めたときだけページの位置を進める（失敗したら今のページのまま）
+    async def show(self, interaction: discord.Interaction, starts: list):
+        self.page = await asyncio.to_thread(fetch_page, reservation_manager.db_path, self.filters, starts[-1])
+        self.starts = starts
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+    @discord.ui.button(label="前へ", style=discord.ButtonStyle.secondary)
+    @interaction_handler(name="export_page", defer=False)
+    async def prev_button(self, interaction: discord.Interaction, button: Button):
+        await self.show(interaction, self.starts[:-1])
+
+    @discord.ui.button(label="次へ", style=discord.ButtonStyle.secondary)
+    @interaction_handler(name="export_page", defer=False)
+    async def next_button(self, interaction: discord.Interaction, button: Button):
+        last = self.page[-1]
+        await self.show(interaction, self.starts + [(last[4], last[0])])
+
+# 管理者のみ
+@app_commands.command(name="export", description="予約をCSVまたはJSON Linesで書き出す")
+@app_commands.describe(
+    fmt="出力形式", start="開始日 (YYYY-MM-DD)", end="終了日 (YYYY-MM-DD)",
+    room="部屋", user="予約したユーザー",
+)
+@app_commands.choices(fmt=[
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSON Lines", value="jsonl"),
+])
+@interaction_handler(name="export")
+async def export_command(interaction: discord.Interaction, fmt: str = "csv", start: str = None,
+                         end: str = None, room: str = None, user: discord.User = None):
+    if str(interaction.user.id) != str(ADMIN_USER_ID):
+        await reply(interaction, "このコマンドは管理者のみが実行できます。", ephemeral=True)
+        return
+    try:
+        filters = ExportFilter(start, end, room, user.id if user else None)
+    except ValueError:
+        await reply(interaction, "日付は YYYY-MM-DD の形式で入力してください。", ephemeral=True)
+        return
+
+    # 読み出しと書き出しはスレッドで行い，イベントループを止めない
+    buf, count = await asyncio.to_thread(export_reservations, reservation_manager.db_path, fmt, filters)
+    try:
+        size = buf.seek(0, io.SEEK_END)
+        buf.seek(0)
+        if size > EXPORT_MAX_BYTES:
+            await reply(
+                interaction, f"出力が大きすぎます（{size // 1024} KiB）。条件を絞ってください。", ephemeral=True
+            )
+            return
+        first_page = await asyncio.to_thread(fetch_page, reservation_manager.db_path, filters)
+        view = ExportPreviewView(filters, first_page)
+        await reply(
+            interaction, f"{count}件の予約を書き出しました（{filters.describe()}）。\n{view.content()}",
+            file=discord.File(fp=buf, filename=f"reservations.{fmt}"),
+            view=view, ephemeral=True,
+        )
+    finally:
+        buf.close()
+
+# 管理者のみ
+# CSVの予約をまとめて取り込む（1件でも問題があれば何も追加しない）
+@app_commands.command(name="import", description="CSVの予約をまとめて取り込む")
+@app_commands.describe(file="団体名・部屋・日付・開始・終了の列を持つCSV")
+@interaction_handler(name="import")
+async def import_command(interaction: discord.Interaction, file: discord.Attachment):
+    if str(interaction.user.id) != str(ADMIN_USER_ID):
+        await reply(interaction, "このコマンドは管理者のみが実行できます。", ephemeral=True)
+        return
+
+    try:
+        text = decode_csv(await file.read())
+        rows, errors = await asyncio.to_thread(parse_csv, text)
+    except ValueError as e:
+        await reply(interaction, f"CSVを読み込めません: {e}", ephemeral=True)
+        return
+
+    # 重なりの確認から追加までは await を挟まず，途中で他の予約が入らないようにする
+    errors += find_overlaps(rows, reservation_manager.get_overlapping_reservations)
+    if errors:
+        message = f"{len(errors)}件のエラーがあるため取り込みませんでした。\n" + "\n".join(errors[:IMPORT_MAX_ERRORS])
+        if len(errors) > IMPORT_MAX_ERRORS:
+            message += f"\n…ほか{len(errors) - IMPORT_MAX_ERRORS}件"
+        await reply(interaction, message[:1900], ephemeral=True)
+        return
+    if not rows:
+        await reply(interaction, "取り込む予約がありません。", ephemeral=True)
+        return
+
+    user_id = str(interaction.user.id)
+    added = reservation_manager.add_reservations_bulk([
+        (user_id, row.group_name, row.room_type,
+         row.start_dt.strftime("%Y-%m-%d %H:%M:%S"), row.end_dt.strftime("%Y-%m-%d %H:%M:%S"))
+        for row in sorted(rows, key=lambda r: r.start_dt)
+    ])
+    logger.info("CSVから%d件の予約を取り込みました: %s", len(added), file.filename)
+
+    # ログは1回，予約表の更新も1回だけ
+    table_data = [TABLE_HEADER] + [list(display_row(*row[2:6])[1]) for row in added]
+    img_bufs = await asyncio.to_thread(create_table_images, table_data)
+    files = [
+        discord.File(fp=io.BytesIO(buf.getvalue()), filename=f"import_{i + 1}.png")
+        for i, buf in enumerate(img_bufs)
+    ]
+    await get_outbound(interaction.client).send(
+        LOG_CH_ID, f"✅ CSVから{len(added)}件の予約を追加しました", files=files, priority=PRIORITY_LOG
+    )
+    await reply(interaction, f"{len(added)}件の予約を取り込みました。", ephemeral=True)
+    await update_reservation_message(interaction.client, interaction.client.control_view)
+
+@app_commands.command(name="usage", description="部屋の利用率と混む時間帯を表示")
+@app_commands.describe(period="集計する期間", room="部屋（省略時はすべて）")
+@app_commands.choices(period=[
+    app_commands.Choice(name="今週", value="week"),
+    app_commands.Choice(name="今月", value="month"),
+])
+async def usage_command(interaction: discord.Interaction, period: str = "week", room: str = None):
+    today = datetime.now().date()
+    if period == "month":
+        start = today.replace(day=1)
+        days = ((start + timedelta(days=32)).replace(day=1) - start).days
+    else:
+        start = today - timedelta(days=today.weekday())
+        days = 7
+    occupancy = reservation_manager.occupancy
+    rooms = [room] if room else occupancy.rooms()
+    await interaction.response.send_message(format_usage(occupancy, rooms, start, days), ephemeral=True)
+
+@app_commands.command(name="free", description="指定した日の空き時間を探す")
+@app_commands.describe(date="日付 (MM/DD)", minutes="必要な時間（分）", room="部屋")
+async def free_command(interaction: discord.Interaction, date: str, minutes: int = 60, room: str = "大部屋"):
+    try:
+        month_str, day_str = date.split("/")
+        day = datetime(datetime.now().year, int(month_str), int(day_str)).date()
+    except ValueError:
+        await interaction.response.send_message("日付は MM/DD の形式で入力してください。", ephemeral=True)
+        return
+    slots = reservation_manager.occupancy.free_slots(room, day, max(minutes, 1))
+    await interaction.response.send_message(format_free_slots(room, day, slots), ephemeral=True)
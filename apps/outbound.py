@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+import discord
+
+from client_profile import resolve_channel
+
+logger = logging.getLogger("nlabot.outbound")
+
+# 送信の優先度（小さいほど先に送る）
+PRIORITY_CODE   = 0  # 認証コード
+PRIORITY_ALERT  = 1  # 温度アラート
+PRIORITY_LOG    = 2  # 予約ログ
+PRIORITY_DIGEST = 3  # 日次・週次の予約一覧
+
+# チャンネル単位のレートリミット（Discordはおおよそ5件/5秒）
+CHANNEL_BUCKET_SIZE   = 5
+CHANNEL_BUCKET_PERIOD = 5.0
+# 全体のレートリミット（50件/秒）
+GLOBAL_BUCKET_SIZE    = 50
+GLOBAL_BUCKET_PERIOD  = 1.0
+
+MAX_CONTENT_LENGTH = 2000
+MAX_COALESCED_ROWS = 40
+
+# トークンバケット
+class RateBucket:
+    def __init__(self, size: int, period: float):
+        self.size = size
+        self.rate = size / period
+        self.tokens = float(size)
+        self.updated = time.monotonic()
+        # 429を受けたときの解除時刻
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.size, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # 送信可能になるまでの待ち時間（秒）
+    def delay(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class OutboundItem:
+    __slots__ = ("priority", "content", "file", "table", "filename", "coalesce", "kwargs", "future")
+
+    def __init__(self, priority, content, file, table, filename, coalesce, kwargs, future):
+        self.priority = priority
+        self.content  = content
+        self.file     = file
+        self.table    = table
+        self.filename = filename
+        self.coalesce = coalesce
+        self.kwargs   = kwargs
+        self.future   = future
+
+    # 同じメッセージにまとめられるか
+    def can_merge(self, other: "OutboundItem") -> bool:
+        if not (self.coalesce and other.coalesce):
+            return False
+        if self.priority != other.priority or self.file or other.file or self.kwargs or other.kwargs:
+            return False
+        if (self.table is None) != (other.table is None):
+            return False
+        # 表は1枚の画像になるので，見出し（追加・変更・取消など）とヘッダ行が同じものだけまとめる
+        # （レーンはチャンネルごとなので，キーは実質 (チャンネル, 見出し, ヘッダ行)）
+        if self.table is not None and (self.content != other.content or self.table[0] != other.table[0]):
+            return False
+        return True
+
+# チャンネルごとの優先度付きレーン
+class ChannelLane:
+    def __init__(self):
+        self.heap = []
+        self.event = asyncio.Event()
+        self.bucket = RateBucket(CHANNEL_BUCKET_SIZE, CHANNEL_BUCKET_PERIOD)
+        self.worker = None
+        self.busy = False
+
+# 送信キュー
+class OutboundQueue:
+    def __init__(self, client: discord.Client, table_renderer=None):
+        self.client = client
+        # table_data -> PNGのBytesIO（コルーチン関数でもよい）
+        self.table_renderer = table_renderer
+        self.lanes = {}
+        self.global_bucket = RateBucket(GLOBAL_BUCKET_SIZE, GLOBAL_BUCKET_PERIOD)
+        self._seq = itertools.count()
+
+    # キューに積んでFutureを返す（結果は送信したMessage，失敗時None）
+    def enqueue(self, channel_id: int, content: str = None, *, file: discord.File = None,
+                table: list = None, filename: str = "table.png",
+                priority: int = PRIORITY_LOG, coalesce: bool = False, **kwargs) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        item = OutboundItem(priority, content, file, table, filename, coalesce, kwargs, future)
+
+        lane = self.lanes.get(channel_id)
+        if lane is None:
+            lane = self.lanes[channel_id] = ChannelLane()
+        if lane.worker is None or lane.worker.done():
+            lane.worker = loop.create_task(self._worker(channel_id, lane))
+
+        heapq.heappush(lane.heap, (priority, next(self._seq), item))
+        lane.event.set()
+        return future
+
+    # キューに積んで送信完了まで待つ
+    async def send(self, channel_id: int, content: str = None, **kwargs):
+        return await self.enqueue(channel_id, content, **kwargs)
+
+    # 未送信のメッセージが無くなるまで待つ
+    async def drain(self, timeout: float = None):
+        async def _wait():
+            while any(lane.heap or lane.busy for lane in self.lanes.values()):
+                await asyncio.sleep(0.1)
+        await asyncio.wait_for(_wait(), timeout)
+
+    def pending(self) -> int:
+        return sum(len(lane.heap) for lane in self.lanes.values())
+
+    # 先頭から，まとめて送れるものを取り出す
+    def _pop_batch(self, lane: ChannelLane) -> list:
+        _, _, first = heapq.heappop(lane.heap)
+        batch = [first]
+        length = len(first.content or "")
+        rows = len(first.table) - 1 if first.table else 0
+        while lane.heap:
+            nxt = lane.heap[0][2]
+            if not first.can_merge(nxt):
+                break
+            next_length = length + len(nxt.content or "") + 1
+            next_rows = rows + (len(nxt.table) - 1 if nxt.table else 0)
+            if next_length > MAX_CONTENT_LENGTH or next_rows > MAX_COALESCED_ROWS:
+                break
+            heapq.heappop(lane.heap)
+            batch.append(nxt)
+            length, rows = next_length, next_rows
+        return batch
+
+    def _requeue(self, lane: ChannelLane, batch: list):
+        for item in batch:
+            if item.file:
+                item.file.reset()
+            heapq.heappush(lane.heap, (item.priority, next(self._seq), item))
+
+    # バッチを1通のメッセージにまとめる
+    async def _build(self, batch: list):
+        first = batch[0]
+        contents = []
+        for item in batch:
+            if item.content and item.content not in contents:
+                contents.append(item.content)
+        content = "\n".join(contents) or None
+
+        file = first.file
+        if first.table is not None:
+            table_data = [first.table[0]]
+            for item in batch:
+                table_data.extend(item.table[1:])
+            if self.table_renderer is None:
+                raise RuntimeError("table_renderer が設定されていません。")
+            if asyncio.iscoroutinefunction(self.table_renderer):
+                img_buf = await self.table_renderer(table_data)
+            else:
+                img_buf = await asyncio.to_thread(self.table_renderer, table_data)
+            file = discord.File(fp=img_buf, filename=first.filename)
+        return content, file, first.kwargs
+
+    async def _resolve_channel(self, channel_id: int):
+        channel = await resolve_channel(self.client, channel_id)
+        if channel is None:
+            raise RuntimeError(f"チャンネルが見つかりません (channel={channel_id})")
+        return channel
+
+    async def _worker(self, channel_id: int, lane: ChannelLane):
+        while True:
+            if not lane.heap:
+                lane.event.clear()
+                await lane.event.wait()
+                continue
+
+            # レートリミットの空きを待つ
+            wait = max(lane.bucket.delay(), self.global_bucket.delay())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            batch = self._pop_batch(lane)
+            lane.busy = True
+            try:
+                lane.bucket.consume()
+                self.global_bucket.consume()
+                content, file, kwargs = await self._build(batch)
+                channel = await self._resolve_channel(channel_id)
+                message = await channel.send(content=content, file=file, **kwargs)
+                result = message
+            except discord.RateLimited as e:
+                # 429: バケットを止めて再送
+                lane.bucket.block(e.retry_after)
+                self._requeue(lane, batch)
+                continue
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    lane.bucket.block(CHANNEL_BUCKET_PERIOD)
+                    self._requeue(lane, batch)
+                    continue
+                logger.warning("送信に失敗しました (channel=%s): %s", channel_id, e)
+                result = None
+            except Exception as e:
+                logger.exception("送信に失敗しました (channel=%s): %s", channel_id, e)
+                result = None
+            finally:
+                lane.busy = False
+
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(result)
+
+# クライアントに紐づく送信キューを取得
+def get_outbound(client: discord.Client) -> OutboundQueue:
+    queue = getattr(client, "outbound", None)
+    if queue is None:
+        queue = client.outbound = OutboundQueue(client)
+    return queue
@@ -0,0 +1,108 @@
+import os
+from datetime import timedelta
+
+from scheduler import now_jst
+
+# 温湿度計の取得間隔（秒）の下限と上限
+POLL_MIN_SECONDS = float(os.getenv("POLL_MIN_SECONDS", "60"))
+POLL_MAX_SECONDS = float(os.getenv("POLL_MAX_SECONDS", "900"))
+# 1日（JST）あたりのSwitchBot API呼び出し回数の上限
+POLL_DAILY_BUDGET = int(os.getenv("POLL_DAILY_BUDGET", "300"))
+# 間隔を延ばしている間に貯めておける呼び出し回数（閾値に近づいたときにまとめて使う）
+POLL_BURST = int(os.getenv("POLL_BURST", "60"))
+# 閾値までの差（℃）がこれ以上なら最長の間隔にする
+POLL_FAR_MARGIN = float(os.getenv("POLL_FAR_MARGIN", "5.0"))
+# 閾値に達するまでに最低この回数は測定する
+POLL_SAMPLES_BEFORE_BOUNDARY = 3
+
+# 温度が閾値から遠く安定しているときは間隔を延ばし，近づく・急変するときは縮める
+#   呼び出し回数はトークンバケットで制限する．トークンは1日の予算を均した速さ
+#   （daily_budget/86400 回/秒）で burst 個まで貯まり，間隔を延ばしていた分を閾値付近で使える．
+#   1日の呼び出し回数は別に daily_budget 回で打ち切る
+class AdaptivePolling:
+    def __init__(self, min_interval: float = POLL_MIN_SECONDS, max_interval: float = POLL_MAX_SECONDS,
+                 daily_budget: int = POLL_DAILY_BUDGET, far_margin: float = POLL_FAR_MARGIN,
+                 burst: int = POLL_BURST):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.daily_budget = daily_budget
+        self.far_margin = far_margin
+        self.burst = burst
+        self.day = None
+        self.calls_today = 0
+        self.tokens = float(burst)
+        self.refilled_at = now_jst().timestamp()
+
+    # 前回からの経過時間分のトークンを足す
+    def _refill(self) -> float:
+        now = now_jst().timestamp()
+        rate = self.daily_budget / 86400
+        self.tokens = min(float(self.burst), self.tokens + max(0.0, now - self.refilled_at) * rate)
+        self.refilled_at = now
+        return rate
+
+    # API呼び出しを記録する（/statusからの呼び出しも含める）
+    def record_call(self):
+        today = now_jst().date()
+        if today != self.day:
+            self.day = today
+            self.calls_today = 0
+        self.calls_today += 1
+        self._refill()
+        # /status の分は負になりうる（その分だけ次の取得を遅らせる）
+        self.tokens -= 1
+
+    # 再起動しても同じ日の予算と貯めたトークンを引き継ぐ
+    def state(self) -> dict:
+        return {"day": self.day.isoformat() if self.day else None, "calls_today": self.calls_today,
+                "tokens": self.tokens, "refilled_at": self.refilled_at}
+
+    def restore(self, state: dict):
+        if state.get("day") == now_jst().date().isoformat():
+            self.day = now_jst().date()
+            self.calls_today = state.get("calls_today", 0)
+        if "tokens" in state and "refilled_at" in state:
+            self.tokens = min(float(self.burst), state["tokens"])
+            self.refilled_at = state["refilled_at"]
+
+    # 予算を守るための最短間隔（トークンが1つ貯まるまでの時間）
+    def budget_floor(self) -> float:
+        now = now_jst()
+        if now.date() == self.day and self.calls_today >= self.daily_budget:
+            # 1日の上限に達したら日付が変わるまで待つ
+            midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            return (midnight - now).total_seconds() + 1
+        rate = self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / rate
+
+    # 最も近い温度の境界までの差（℃）と，そこに向かう速さ（℃/秒，離れていく場合は0）
+    def _nearest_boundary(self, engine, temp: float) -> tuple:
+        rate = engine.temperature_rate()
+        rate = 0.0 if rate is None else rate / 3600
+        best = (float("inf"), 0.0)
+        for rule in engine.rules:
+            if rule.metric != "temperature" or rule.active is None:
+                continue
+            boundary = rule.boundary()
+            distance = abs(temp - boundary)
+            approaching = rate if boundary > temp else -rate
+            best = min(best, (distance, max(0.0, approaching)))
+        return best
+
+    # 次の取得までの秒数
+    def next_interval(self, engine, reading: dict) -> float:
+        interval = self.max_interval
+        temp = reading.get("temperature") if reading else None
+        if isinstance(temp, (int, float)):
+            distance, speed = self._nearest_boundary(engine, float(temp))
+            if distance != float("inf"):
+                interval = self.max_interval * min(1.0, distance / self.far_margin)
+            if speed > 0:
+                interval = min(interval, distance / speed / POLL_SAMPLES_BEFORE_BOUNDARY)
+            # 急低下アラートの発報中は細かく見る
+            if any(rule.metric == "temperature_rate" and rule.active for rule in engine.rules):
+                interval = self.min_interval
+        interval = max(self.min_interval, min(self.max_interval, interval))
+        return max(interval, self.budget_floor())
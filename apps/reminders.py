@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("nlabot.reminders")
+
+# 予約の開始何分前に知らせるか（0で無効）
+REMINDER_MINUTES = int(os.getenv("REMINDER_MINUTES", "15"))
+# 1で予約したユーザーにもDMで知らせる
+REMINDER_DM = os.getenv("REMINDER_DM", "0") == "1"
+
+# reservations.notified のビット
+NOTIFIED_DIGEST = 1    # 当日の予約一覧に載せた
+NOTIFIED_REMINDER = 2  # 開始前のリマインドを送った
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 開始時刻の近い順に並べたヒープから，時刻が来た予約のリマインドを送る
+#   ヒープの要素は (送る時刻, 予約ID, 開始時刻)．変更・削除された予約の要素は残し，
+#   取り出したときに self.pending と比べて捨てる
+class ReminderQueue:
+    def __init__(self, manager, send, minutes: int = REMINDER_MINUTES):
+        self.manager = manager
+        self.send = send  # async send(予約の行)
+        self.lead = timedelta(minutes=minutes)
+        self.heap = []
+        self.pending = {}  # 予約ID -> 開始時刻（未送信のもの）
+        self.wakeup = asyncio.Event()
+        self.task = None
+        manager.add_write_hook(self.on_write)
+
+    # 起動時に一度だけ，これから始まる未送信の予約を読み込む
+    def load(self, now: datetime = None):
+        now_str = (now or datetime.now()).strftime(DATETIME_FORMAT)
+        rows = self.manager.conn.execute(
+            "SELECT id, start_datetime FROM reservations WHERE start_datetime > ? AND (notified & ?) = 0",
+            (now_str, NOTIFIED_REMINDER),
+        ).fetchall()
+        self.pending = dict(rows)
+        self.heap = [(self._due(start), reservation_id, start) for reservation_id, start in rows]
+        heapq.heapify(self.heap)
+        self.wakeup.set()
+
+    def _due(self, start: str) -> datetime:
+        return datetime.strptime(start, DATETIME_FORMAT) - self.lead
+
+    def on_write(self, old_row, new_row):
+        if new_row is None or new_row[7] & NOTIFIED_REMINDER:
+            self.pending.pop((old_row or new_row)[0], None)
+            return
+        reservation_id, start = new_row[0], new_row[4]
+        if self.pending.get(reservation_id) == start:
+            return
+        self.pending[reservation_id] = start
+        heapq.heappush(self.heap, (self._due(start), reservation_id, start))
+        # 先頭が変わったときだけ待ち時間を計算し直す
+        if self.heap[0][1] == reservation_id:
+            self.wakeup.set()
+
+    # 変更・削除で古くなった要素を先頭から捨てる
+    def _peek(self):
+        while self.heap:
+            due, reservation_id, start = self.heap[0]
+            if self.pending.get(reservation_id) == start:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    # 時刻が来たものを取り出す（開始時刻を過ぎたものは送らない）
+    def pop_due(self, now: datetime) -> list:
+        now_str = now.strftime(DATETIME_FORMAT)
+        due = []
+        while (head := self._peek()) and head[0] <= now:
+            _, reservation_id, start = heapq.heappop(self.heap)
+            del self.pending[reservation_id]
+            if start > now_str:
+                due.append(reservation_id)
+        return due
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            for reservation_id in self.pop_due(datetime.now()):
+                # 他の経路で送っていないときだけ送る
+                row = self.manager.claim_reminder(reservation_id)
+                if row is None:
+                    continue
+                try:
+                    await self.send(row)
+                except Exception:
+                    logger.exception("リマインドを送れませんでした: %s", reservation_id)
+            head = self._peek()
+            timeout = None if head is None else max((head[0] - datetime.now()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.load()
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+# 直前に入った予約もあるので残り時間は送るときに計算する
+def format_reminder(row, now: datetime = None) -> str:
+    start = datetime.strptime(row[4], DATETIME_FORMAT)
+    end = datetime.strptime(row[5], DATETIME_FORMAT)
+    minutes = max(1, round((start - (now or datetime.now())).total_seconds() / 60))
+    return (f"⏰ {minutes}分後に予約があります: {row[2]}（{row[3]}） "
+            f"{start.strftime('%m/%d %H:%M')} - {end.strftime('%H:%M')}")
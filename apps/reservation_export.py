@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
+
+EXPORT_COLUMNS = (
+    "id", "user_id", "group_name", "room_type",
+    "start_datetime", "end_datetime", "created_at", "notified",
+)
+# DBから一度に読む行数
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+# これを超えたら出力をメモリではなく一時ファイルに置く（バイト）
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(1024 * 1024)))
+# Discordに添付できる大きさ（バイト）
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", str(10 * 1024 * 1024)))
+PREVIEW_PAGE_SIZE = 15
+
+# 絞り込み条件（日付は "YYYY-MM-DD"，end はその日を含む）
+class ExportFilter:
+    def __init__(self, start: str = None, end: str = None, room_type: str = None, user_id: str = None):
+        self.start = datetime.strptime(start, "%Y-%m-%d") if start else None
+        self.end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1) if end else None
+        self.room_type = room_type
+        self.user_id = str(user_id) if user_id is not None else None
+
+    def where(self) -> tuple:
+        clauses, params = [], []
+        if self.start:
+            clauses.append("start_datetime >= ?")
+            params.append(self.start.strftime("%Y-%m-%d %H:%M:%S"))
+        if self.end:
+            clauses.append("start_datetime < ?")
+            params.append(self.end.strftime("%Y-%m-%d %H:%M:%S"))
+        if self.room_type:
+            clauses.append("room_type = ?")
+            params.append(self.room_type)
+        if self.user_id:
+            clauses.append("user_id = ?")
+            params.append(self.user_id)
+        return clauses, params
+
+    def describe(self) -> str:
+        parts = []
+        if self.start or self.end:
+            start = self.start.strftime("%Y-%m-%d") if self.start else ""
+            end = (self.end - timedelta(days=1)).strftime("%Y-%m-%d") if self.end else ""
+            parts.append(f"期間: {start}〜{end}")
+        if self.room_type:
+            parts.append(f"部屋: {self.room_type}")
+        if self.user_id:
+            parts.append(f"ユーザー: <@{self.user_id}>")
+        return "，".join(parts) or "条件なし"
+
+# 書き込み用の接続とは別に読み取り専用で開く（エクスポート中も予約の書き込みを妨げない）
+def _connect(db_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+
+def iter_chunks(db_path: str, filters: ExportFilter, chunk_size: int = EXPORT_CHUNK_SIZE):
+    clauses, params = filters.where()
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM reservations"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_datetime, id"
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+# CSVまたはJSON Linesで書き出す．(先頭に戻したファイル, 行数) を返す
+def export_reservations(db_path: str, fmt: str, filters: ExportFilter,
+                        chunk_size: int = EXPORT_CHUNK_SIZE) -> tuple:
+    buf = SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode="w+b")
+    # CSVはExcelで開けるようBOMを付ける
+    text = io.TextIOWrapper(buf, encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_chunks(db_path, filters, chunk_size):
+            writer.writerows(rows)
+            count += len(rows)
+    else:
+        for rows in iter_chunks(db_path, filters, chunk_size):
+            text.write("".join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+            ))
+            count += len(rows)
+    text.flush()
+    text.detach()
+    buf.seek(0)
+    return buf, count
+
+# プレビューの1ページ．after は前のページの最後の (開始日時, id)
+def fetch_page(db_path: str, filters: ExportFilter, after: tuple = None,
+               page_size: int = PREVIEW_PAGE_SIZE) -> list:
+    clauses, params = filters.where()
+    if after:
+        clauses.append("(start_datetime > ? OR (start_datetime = ? AND id > ?))")
+        params.extend([after[0], after[0], after[1]])
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM reservations"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_datetime, id LIMIT ?"
+    conn = _connect(db_path)
+    try:
+        return conn.execute(sql, [*params, page_size]).fetchall()
+    finally:
+        conn.close()
+
+def format_page(rows: list) -> str:
+    lines = [f"{r[0]:>5} {r[4][:16]}-{r[5][11:16]} {r[3]} {r[2]}" for r in rows]
+    return "```\n" + ("\n".join(lines) or "該当する予約はありません。") + "\n```"
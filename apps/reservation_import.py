@@ -0,0 +1,123 @@
+import csv
+import io
+import os
+from collections import namedtuple
+from datetime import datetime
+
+# 一度に取り込める行数
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "2000"))
+# エラーとして表示する最大件数
+IMPORT_MAX_ERRORS = 20
+
+# CSVの列名（日本語・英語どちらでもよい）
+COLUMN_ALIASES = {
+    "group_name": ("団体名", "group_name", "group"),
+    "room_type": ("部屋", "room_type", "room"),
+    "date": ("日付", "date"),
+    "start": ("開始", "開始時刻", "start", "start_time"),
+    "end": ("終了", "終了時刻", "end", "end_time"),
+}
+REQUIRED_COLUMNS = tuple(COLUMN_ALIASES)
+
+# 取り込む予約．line はCSVの行番号（エラー表示用）
+ImportRow = namedtuple("ImportRow", "group_name room_type start_dt end_dt line")
+
+def decode_csv(data: bytes) -> str:
+    # Excelから保存したCSVはShift_JIS（cp932）のことが多い
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("CSVの文字コードを判別できません（UTF-8 または Shift_JIS で保存してください）。")
+
+# "YYYY-MM-DD" / "YYYY/MM/DD" / "M/D"（年は default_year）
+def parse_date(text: str, default_year: int):
+    parts = text.strip().replace("-", "/").split("/")
+    try:
+        if len(parts) == 2:
+            return datetime(default_year, int(parts[0]), int(parts[1]))
+        if len(parts) == 3:
+            return datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+    except ValueError:
+        pass
+    raise ValueError(f"日付の形式が不正です（YYYY/MM/DD または M/D）: {text}")
+
+def parse_time(day: datetime, text: str) -> datetime:
+    try:
+        t = datetime.strptime(text.strip(), "%H:%M")
+    except ValueError:
+        raise ValueError(f"時刻の形式が不正です（HH:MM）: {text}")
+    return day.replace(hour=t.hour, minute=t.minute)
+
+def _column_map(header: list) -> dict:
+    normalized = [h.strip().lower() for h in header]
+    mapping = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in normalized:
+                mapping[key] = normalized.index(alias.lower())
+                break
+    missing = [COLUMN_ALIASES[k][0] for k in REQUIRED_COLUMNS if k not in mapping]
+    if missing:
+        raise ValueError(f"必要な列がありません: {', '.join(missing)}")
+    return mapping
+
+# CSVを読み，(取り込める行, エラーのリスト) を返す
+def parse_csv(text: str, now: datetime = None) -> tuple:
+    now = now or datetime.now()
+    reader = csv.reader(io.StringIO(text))
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise ValueError("CSVが空です。")
+    columns = _column_map(header)
+
+    rows, errors = [], []
+    for line, record in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in record):
+            continue
+        if len(rows) + len(errors) >= IMPORT_MAX_ROWS:
+            errors.append(f"{IMPORT_MAX_ROWS}行を超える分は読み込みません。")
+            break
+        try:
+            values = {key: record[i].strip() for key, i in columns.items()}
+        except IndexError:
+            errors.append(f"{line}行目: 列が足りません。")
+            continue
+        try:
+            day = parse_date(values["date"], now.year)
+            start_dt = parse_time(day, values["start"])
+            end_dt = parse_time(day, values["end"])
+        except ValueError as e:
+            errors.append(f"{line}行目: {e}")
+            continue
+        if not values["group_name"] or not values["room_type"]:
+            errors.append(f"{line}行目: 団体名と部屋は必須です。")
+        elif start_dt >= end_dt:
+            errors.append(f"{line}行目: 開始時刻は終了時刻より前にしてください。")
+        elif start_dt < now:
+            errors.append(f"{line}行目: 過去の日時には予約できません。")
+        else:
+            rows.append(ImportRow(values["group_name"], values["room_type"], start_dt, end_dt, line))
+    return rows, errors
+
+# 部屋ごとに，CSV内での重なりと既存の予約との重なりを調べる
+# find_existing(start_dt, end_dt, room_type) は重なる既存の予約を返す
+def find_overlaps(rows: list, find_existing) -> list:
+    errors = []
+    by_room = {}
+    for row in rows:
+        by_room.setdefault(row.room_type, []).append(row)
+    for room_rows in by_room.values():
+        room_rows.sort(key=lambda r: (r.start_dt, r.end_dt))
+        # 開始順に並べ，それまでの最も遅い終了時刻と比べる
+        latest = None
+        for row in room_rows:
+            if latest is not None and row.start_dt < latest.end_dt:
+                errors.append(f"{row.line}行目: {latest.line}行目と時間が重なっています（{row.room_type}）。")
+            if latest is None or row.end_dt > latest.end_dt:
+                latest = row
+            if find_existing(row.start_dt, row.end_dt, row.room_type):
+                errors.append(f"{row.line}行目: 既存の予約と時間が重なっています（{row.room_type}）。")
+    return errors
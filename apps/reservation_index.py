@@ -0,0 +1,124 @@
+import math
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from reservation_table import WEEKDAYS
+
+# 行の列番号（reservationsテーブルのSELECT順）
+ID, USER_ID, GROUP_NAME, ROOM_TYPE, START, END, CREATED_AT, NOTIFIED = range(8)
+
+# 予約の表示用の行と週の月曜日 ("YYYY-MM-DD", [団体名, 日付, 部屋, 時間])
+@lru_cache(maxsize=4096)
+def display_row(group_name: str, room_type: str, start: str, end: str) -> tuple:
+    sdt = datetime.fromisoformat(start)
+    edt = datetime.fromisoformat(end)
+    week = (sdt - timedelta(days=sdt.weekday())).strftime("%Y-%m-%d")
+    row = (
+        group_name,
+        f"{sdt.month}月{sdt.day}日 ({WEEKDAYS[sdt.weekday()]}) ",
+        room_type,
+        f"{sdt.strftime('%H:%M')} - {edt.strftime('%H:%M')}",
+    )
+    return week, row
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _duration(row: tuple) -> int:
+    seconds = (datetime.fromisoformat(row[END]) - datetime.fromisoformat(row[START])).total_seconds()
+    return max(0, int(math.ceil(seconds)))
+
+# 予約のメモリ上の索引（開始日時順，ユーザー別，部屋別，終了日時順）
+class ReservationIndex:
+    def __init__(self):
+        self.rows = {}       # id -> 行
+        self.order = []      # (開始日時, id) の昇順
+        self.by_user = {}    # user_id -> (開始日時, id) の昇順
+        self.by_room = {}    # room_type -> (開始日時, id) の昇順
+        self.by_end = []     # (終了日時, id) の昇順
+        self.durations = []  # 予約の長さ（秒）の昇順．重なりを探す範囲の下限に使う
+
+    def load(self, rows):
+        self.clear()
+        for row in rows:
+            self._insert(tuple(row))
+
+    def clear(self):
+        self.rows.clear()
+        self.order.clear()
+        self.by_user.clear()
+        self.by_room.clear()
+        self.by_end.clear()
+        self.durations.clear()
+
+    def get(self, reservation_id):
+        return self.rows.get(reservation_id)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ReservationManagerの書き込みフック: 追加(None, new)・更新(old, new)・削除(old, None)
+    def apply(self, old_row, new_row):
+        if old_row is not None:
+            self._remove(old_row)
+        if new_row is not None:
+            self._insert(tuple(new_row))
+
+    def _insert(self, row: tuple):
+        if row[ID] in self.rows:
+            self._remove(self.rows[row[ID]])
+        key = (row[START], row[ID])
+        self.rows[row[ID]] = row
+        insort(self.order, key)
+        insort(self.by_user.setdefault(str(row[USER_ID]), []), key)
+        insort(self.by_room.setdefault(row[ROOM_TYPE], []), key)
+        insort(self.by_end, (row[END], row[ID]))
+        insort(self.durations, _duration(row))
+
+    def _remove(self, row: tuple):
+        current = self.rows.pop(row[ID], None)
+        if current is None:
+            return
+        key = (current[START], current[ID])
+        for keys in (self.order, self.by_user.get(str(current[USER_ID])), self.by_room.get(current[ROOM_TYPE])):
+            if keys:
+                i = bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+        for values, value in ((self.by_end, (current[END], current[ID])), (self.durations, _duration(current))):
+            i = bisect_left(values, value)
+            if i < len(values) and values[i] == value:
+                del values[i]
+
+    # start <= 開始日時 < end の予約（文字列 "YYYY-MM-DD HH:MM:SS" で比較）
+    def range(self, start: str, end: str, user_id: str = None, room_type: str = None) -> list:
+        if user_id is not None:
+            keys = self.by_user.get(str(user_id), [])
+        elif room_type is not None:
+            keys = self.by_room.get(room_type, [])
+        else:
+            keys = self.order
+        lo = bisect_left(keys, (start, 0))
+        hi = bisect_left(keys, (end, 0))
+        rows = [self.rows[i] for _, i in keys[lo:hi]]
+        if user_id is not None and room_type is not None:
+            rows = [r for r in rows if r[ROOM_TYPE] == room_type]
+        return rows
+
+    # [start, end) と時間が重なる予約
+    #   重なる予約は start - (最長の予約の長さ) より後に始まるので，その間だけを調べる
+    def overlapping(self, start: str, end: str, room_type: str = None) -> list:
+        keys = self.by_room.get(room_type, []) if room_type is not None else self.order
+        if not keys:
+            return []
+        earliest = datetime.fromisoformat(start) - timedelta(seconds=self.durations[-1])
+        lo = bisect_right(keys, (earliest.strftime(DATETIME_FORMAT), math.inf))
+        hi = bisect_left(keys, (end, 0))
+        return [self.rows[i] for _, i in keys[lo:hi] if self.rows[i][END] > start]
+
+    # 終了日時が now 以前の予約（開始日時順）
+    def expired(self, now: str) -> list:
+        hi = bisect_right(self.by_end, (now, math.inf))
+        rows = [self.rows[i] for _, i in self.by_end[:hi]]
+        rows.sort(key=lambda r: (r[START], r[ID]))
+        return rows
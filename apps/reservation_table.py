@@ -0,0 +1,247 @@
+import os
+import io
+import hashlib
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+regular_font_path = Path(__file__).resolve().parents[1] / "fonts" / "NotoSansCJKjp-Regular.ttf"
+bold_font_path    = Path(__file__).resolve().parents[1] / "fonts" / "NotoSansCJKjp-Bold.ttf"
+
+TABLE_HEADER = ["団体名", "日付 (曜日)", "部屋", "時間"]
+WEEKDAYS = ("月", "火", "水", "木", "金", "土", "日")
+
+# 表の描画バックエンド: "matplotlib" または "pillow"
+TABLE_RENDERER = os.getenv("TABLE_RENDERER", "matplotlib")
+
+# 1枚の画像に載せる行数（Discordの添付は1メッセージ10枚まで）
+ROWS_PER_PAGE = 50
+MAX_PAGES = 10
+
+# 表示用の日付 "1月10日 (金) "
+def format_date(dt) -> str:
+    return f"{dt.month}月{dt.day}日 ({WEEKDAYS[dt.weekday()]}) "
+
+# 表示用の時間 "14:00 - 16:00"
+def format_time_range(start_dt, end_dt) -> str:
+    return f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
+
+# FontPropertiesはフォントファイルの読み込みを伴うのでプロセス内で使い回す
+@lru_cache(maxsize=None)
+def get_font(path, size: int):
+    from matplotlib.font_manager import FontProperties
+    return FontProperties(fname=path, size=size)
+
+# Pillow用のフォント（サイズはpx）
+@lru_cache(maxsize=None)
+def get_pil_font(path, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(str(path), size)
+
+# 文字列の描画サイズ (left, top, right, bottom) をフォントごとにキャッシュ
+@lru_cache(maxsize=4096)
+def get_text_bbox(path, size: int, text: str) -> tuple:
+    return get_pil_font(path, size).getbbox(text)
+
+# 設定されたバックエンドで表を描画
+def create_table_image(table_data, **kwargs):
+    if TABLE_RENDERER == "pillow":
+        return create_table_image_pillow(table_data, **kwargs)
+    return create_table_image_matplotlib(table_data, **kwargs)
+
+# テーブルイメージ
+def create_table_image_matplotlib(table_data, font_size=14, cell_padding=10,
+                                  regular_font_path=regular_font_path,
+                                  bold_font_path=bold_font_path):
+    # Pillowバックエンド利用時はmatplotlibを読み込まない
+    from matplotlib.figure import Figure
+    from matplotlib.table import Table
+
+    n_rows = len(table_data)
+    n_cols = len(table_data[0])
+    cell_width = 150
+    cell_height= 30
+    width  = n_cols * cell_width + cell_padding*2
+    height = n_rows * cell_height + cell_padding*2
+
+    regular_font = get_font(regular_font_path, font_size)
+    bold_font    = get_font(bold_font_path,    font_size)
+    small_font   = get_font(bold_font_path,    font_size-2)
+
+    # pyplotのグローバル状態を使わないのでスレッドから呼べる
+    fig = Figure(figsize=(width/100, height/100), dpi=100)
+    ax = fig.subplots()
+    ax.set_axis_off()
+    table = Table(ax, bbox=[0, 0, 1, 1])
+    for i, row in enumerate(table_data):
+        for j, cell_text in enumerate(row):
+            if i != 0 and j==0 and len(cell_text) > 10:
+                cell_font = small_font
+            else:
+                cell_font = bold_font if (i==0 or j==0) else regular_font
+            cell = table.add_cell(i, j, width=cell_width, height=cell_height,
+                                  text=cell_text, loc="center")
+            cell.get_text().set_fontproperties(cell_font)
+            cell.get_text().set_ha("center")
+            cell.get_text().set_va("center")
+
+    for i in range(n_rows):
+        table.add_cell(i, -1, width=0, height=cell_height)
+    for j in range(n_cols):
+        table.add_cell(-1, j, width=cell_width, height=0)
+
+    ax.add_table(table)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    buf.seek(0)
+    return buf
+
+# Pillow版のセルの寸法（文字の描画サイズから決める）
+#   幅: 全角 CELL_TEXT_CHARS 文字分（団体名がこれより長いと小さい文字で描く）＋左右の余白
+#   高さ: 字面の高さ（"国Ag" の上端から下端）＋上下の余白
+CELL_TEXT_CHARS = 10
+CELL_PAD_X = 8  # 文字と縦罫線の間（px）
+CELL_PAD_Y = 6  # 文字と横罫線の間（px）
+
+def pil_cell_size(path, size: int) -> tuple:
+    x0, _, x1, _ = get_text_bbox(path, size, "国" * CELL_TEXT_CHARS)
+    _, y0, _, y1 = get_text_bbox(path, size, "国Ag")
+    return x1 - x0 + CELL_PAD_X * 2, y1 - y0 + CELL_PAD_Y * 2
+
+# ImageDrawで直接描画する軽量版（create_table_image_matplotlibと同じ引数，font_sizeはpx）
+# セルの寸法は文字の大きさだけで決まるので，予約表の週ごとのタイルを縦に並べても列が揃う
+def create_table_image_pillow(table_data, font_size=14, cell_padding=10,
+                              regular_font_path=regular_font_path,
+                              bold_font_path=bold_font_path):
+    n_rows = len(table_data)
+    n_cols = len(table_data[0])
+    cell_width, cell_height = pil_cell_size(bold_font_path, font_size)
+    width  = n_cols * cell_width + cell_padding*2
+    height = n_rows * cell_height + cell_padding*2
+
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+
+    # 罫線
+    left, top = cell_padding, cell_padding
+    right, bottom = left + n_cols * cell_width, top + n_rows * cell_height
+    for i in range(n_rows + 1):
+        y = top + i * cell_height
+        draw.line([(left, y), (right, y)], fill="black", width=1)
+    for j in range(n_cols + 1):
+        x = left + j * cell_width
+        draw.line([(x, top), (x, bottom)], fill="black", width=1)
+
+    # 文字（セル中央揃え）
+    for i, row in enumerate(table_data):
+        for j, cell_text in enumerate(row):
+            if not cell_text:
+                continue
+            if i != 0 and j==0 and len(cell_text) > CELL_TEXT_CHARS:
+                path, size = bold_font_path, font_size-2
+            elif i==0 or j==0:
+                path, size = bold_font_path, font_size
+            else:
+                path, size = regular_font_path, font_size
+            x0, y0, x1, y1 = get_text_bbox(path, size, cell_text)
+            # 小さい文字でも余白に収まらなければ，収まる大きさを幅の比から求める
+            if x1 - x0 > cell_width - CELL_PAD_X * 2:
+                size = max(1, size * (cell_width - CELL_PAD_X * 2) // (x1 - x0))
+                x0, y0, x1, y1 = get_text_bbox(path, size, cell_text)
+            cx = left + j * cell_width + cell_width / 2
+            cy = top + i * cell_height + cell_height / 2
+            draw.text((cx - (x0 + x1) / 2, cy - (y0 + y1) / 2), cell_text,
+                      font=get_pil_font(path, size), fill="black")
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+# 行数が多い表をページに分けて描画（各ページにヘッダ行を付ける）
+def create_table_images(table_data, rows_per_page=ROWS_PER_PAGE, max_pages=MAX_PAGES, **kwargs) -> list:
+    header, rows = table_data[0], table_data[1:]
+    pages = []
+    for start in range(0, max(len(rows), 1), rows_per_page):
+        if len(pages) >= max_pages:
+            break
+        pages.append(create_table_image([header] + rows[start:start + rows_per_page], **kwargs))
+    return pages
+
+# 予約表を週ごとのタイルに分けてキャッシュし，変更のあった週だけ描き直す
+class BoardTiles:
+    def __init__(self, rows_per_page=ROWS_PER_PAGE, max_pages=MAX_PAGES):
+        self.rows_per_page = rows_per_page
+        self.max_pages = max_pages
+        self.tiles = {}  # 週の月曜日 -> (行のtuple, Image)
+        self.pages = {}  # ページのファイル名 -> PNGのbytes
+        self.rendered_tiles = 0
+        self._lock = threading.Lock()
+
+    def _tile(self, week: str, rows: tuple) -> Image.Image:
+        cached = self.tiles.get(week)
+        if cached and cached[0] == rows:
+            return cached[1]
+        buf = create_table_image([TABLE_HEADER] + [list(r) for r in rows], font_size=14)
+        img = Image.open(buf).convert("RGB")
+        self.tiles[week] = (rows, img)
+        self.rendered_tiles += 1
+        return img
+
+    # week_rows: [(週の月曜日, 行), ...]（開始日時順）
+    # 戻り値: ([(ファイル名, PNGのbytes), ...], 表示した行数)，ファイル名は内容から決まる
+    #   週の途中ではページを分けないので，表示できる行数は max_pages * rows_per_page より少ないことがある
+    def render_pages(self, week_rows: list) -> tuple:
+        with self._lock:
+            return self._render_pages(week_rows)
+
+    def _render_pages(self, week_rows: list) -> tuple:
+        weeks = {}
+        for week, row in week_rows:
+            weeks.setdefault(week, []).append(tuple(row))
+        if not weeks:
+            weeks[""] = []
+
+        # 予約の無くなった週は捨てる
+        for week in list(self.tiles):
+            if week not in weeks:
+                del self.tiles[week]
+
+        # 1ページの行数を超えない範囲で週をまとめる
+        groups, current, n = [], [], 0
+        for week, rows in weeks.items():
+            if current and n + len(rows) > self.rows_per_page:
+                groups.append(current)
+                current, n = [], 0
+            current.append((week, tuple(rows)))
+            n += len(rows)
+        groups.append(current)
+
+        result = []
+        pages = {}
+        shown = 0
+        for group in groups[:self.max_pages]:
+            shown += sum(len(rows) for _, rows in group)
+            digest = hashlib.sha1(repr(group).encode("utf-8")).hexdigest()[:16]
+            filename = f"board_{digest}.png"
+            data = self.pages.get(filename)
+            if data is None:
+                data = self._compose([self._tile(week, rows) for week, rows in group])
+            pages[filename] = data
+            result.append((filename, data))
+        self.pages = pages
+        return result, shown
+
+    # タイルを縦に並べて1枚にする
+    def _compose(self, images: list) -> bytes:
+        width = max(img.width for img in images)
+        height = sum(img.height for img in images)
+        page = Image.new("RGB", (width, height), "white")
+        y = 0
+        for img in images:
+            page.paste(img, (0, y))
+            y += img.height
+        buf = io.BytesIO()
+        page.save(buf, format="PNG")
+        return buf.getvalue()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger("nlabot.scheduler")
+
+JST = pytz.timezone("Asia/Tokyo")
+
+# 時計の変更やコンテナの一時停止に追従できるよう，長い待機は分割して現在時刻を確認し直す
+MAX_SLEEP_SECONDS = 60
+
+def now_jst() -> datetime:
+    return datetime.now(JST)
+
+# 次回実行時刻の計算（dtより後の最初の時刻を返す）
+def daily_at(hour: int, minute: int = 0):
+    def next_after(dt: datetime) -> datetime:
+        candidate = dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= dt:
+            candidate += timedelta(days=1)
+        return candidate
+    return next_after
+
+# weekday: 月曜=0
+def weekly_at(weekday: int, hour: int, minute: int = 0):
+    def next_after(dt: datetime) -> datetime:
+        candidate = dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        candidate += timedelta(days=(weekday - dt.weekday()) % 7)
+        if candidate <= dt:
+            candidate += timedelta(days=7)
+        return candidate
+    return next_after
+
+def every(seconds: float):
+    def next_after(dt: datetime) -> datetime:
+        return dt + timedelta(seconds=seconds)
+    return next_after
+
+async def sleep_until(when: datetime):
+    while True:
+        remaining = (when - now_jst()).total_seconds()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, MAX_SLEEP_SECONDS))
+
+class ScheduledJob:
+    """
+    run(due, prepared) を next_after で決まる時刻に実行する．
+    prepare(due) があれば実行時刻の lead 前に呼び，その結果を run に渡す．
+    """
+    def __init__(self, name: str, next_after, run, prepare=None, lead: timedelta = timedelta(minutes=5)):
+        self.name = name
+        self.next_after = next_after
+        self.run = run
+        self.prepare = prepare
+        self.lead = lead
+
+# 最終実行時刻をDBに保存し，停止中に逃した実行を1回だけ補う
+class Scheduler:
+    def __init__(self, conn):
+        self.conn = conn
+        self.jobs = []
+        self.tasks = []
+        c = self.conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS job_runs (
+                name TEXT PRIMARY KEY,
+                last_run TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def add(self, job: ScheduledJob):
+        self.jobs.append(job)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._run_job(job)) for job in self.jobs]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def last_run(self, name: str):
+        c = self.conn.cursor()
+        c.execute("SELECT last_run FROM job_runs WHERE name = ?", (name,))
+        row = c.fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def set_last_run(self, name: str, when: datetime):
+        c = self.conn.cursor()
+        c.execute('''
+            INSERT INTO job_runs (name, last_run) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_run = excluded.last_run
+        ''', (name, when.isoformat()))
+        self.conn.commit()
+
+    async def _run_job(self, job: ScheduledJob):
+        last = self.last_run(job.name)
+        if last is None:
+            # 初回は現在時刻から数える
+            last = now_jst()
+            self.set_last_run(job.name, last)
+
+        while True:
+            now = now_jst()
+            due = job.next_after(last)
+
+            if due <= now:
+                # 逃した実行は最新の1回分だけ行う
+                while job.next_after(due) <= now:
+                    due = job.next_after(due)
+                logger.info("%s: %s の実行を補います。", job.name, due.isoformat())
+                await self._fire(job, due, None)
+                last = due
+                continue
+
+            prepared = None
+            if job.prepare is not None and due - job.lead > now:
+                await sleep_until(due - job.lead)
+                try:
+                    prepared = await job.prepare(due)
+                except Exception as e:
+                    logger.exception("%s: 事前準備に失敗しました: %s", job.name, e)
+
+            await sleep_until(due)
+            await self._fire(job, due, prepared)
+            last = due
+
+    async def _fire(self, job: ScheduledJob, due: datetime, prepared):
+        try:
+            await job.run(due, prepared)
+        except Exception as e:
+            logger.exception("%s: 実行に失敗しました: %s", job.name, e)
+        self.set_last_run(job.name, due)
@@ -0,0 +1,36 @@
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger("nlabot.state")
+
+# 停止時に保存し，次の起動時に引き継ぐ状態
+STATE_PATH = os.getenv("STATE_PATH", "bot_state.json")
+
+def load_state(path: str = STATE_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("状態ファイルを読み込めませんでした: %s", e)
+        return {}
+    logger.info("前回の状態を読み込みました (%s)", path)
+    return state
+
+# 書き込み途中で止まっても壊れないよう，一時ファイルに書いてから置き換える
+def save_state(state: dict, path: str = STATE_PATH):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".state-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    logger.info("状態を保存しました (%s)", path)
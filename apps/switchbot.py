@@ -4,53 +4,280 @@ import uuid
 import base64
 import hmac
 import hashlib
+import logging
+import random
+import threading
+from email.utils import parsedate_to_datetime
 import requests
 
 import discord
 from discord import app_commands
 
+logger = logging.getLogger("nlabot.switchbot")
+
 SWITCHBOT_TOKEN = os.getenv("SWITCHBOT_TOKEN")
 SWITCHBOT_SECRET = os.getenv("SWITCHBOT_SECRET")
 SWITCHBOT_DEVICE_ID = os.getenv("SWITCHBOT_DEVICE_ID")
+# ベンチマーク等でローカルのAPIに向けるときに変更
+SWITCHBOT_API_BASE = os.getenv("SWITCHBOT_API_BASE", "https://api.switch-bot.com")
+
+# 署名付きヘッダを使い回す秒数（0なら毎回作り直す）
+SWITCHBOT_SIGN_TTL = float(os.getenv("SWITCHBOT_SIGN_TTL", "30"))
+SWITCHBOT_TIMEOUT = float(os.getenv("SWITCHBOT_TIMEOUT", "10"))
+# 一時的なエラーの再試行回数と待ち時間（秒，失敗ごとに倍）
+SWITCHBOT_RETRIES = int(os.getenv("SWITCHBOT_RETRIES", "2"))
+SWITCHBOT_BACKOFF = float(os.getenv("SWITCHBOT_BACKOFF", "0.5"))
+# 連続でこの回数失敗したら一定時間APIを呼ばない
+SWITCHBOT_BREAKER_THRESHOLD = int(os.getenv("SWITCHBOT_BREAKER_THRESHOLD", "3"))
+SWITCHBOT_BREAKER_COOLDOWN = float(os.getenv("SWITCHBOT_BREAKER_COOLDOWN", "60"))
+SWITCHBOT_BREAKER_MAX_COOLDOWN = 30 * 60
+
+class SwitchBotError(Exception):
+    def __init__(self, message: str, status: int = None, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+# トークン・署名の誤り（HTTP 401/403）
+class SwitchBotAuthError(SwitchBotError):
+    pass
+
+# 呼び出し回数の上限（HTTP 429）
+class SwitchBotRateLimitError(SwitchBotError):
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message, status)
+        self.retry_after = retry_after
+
+# デバイスまたはハブがオフライン（statusCode 161/171）
+class SwitchBotDeviceOfflineError(SwitchBotError):
+    pass
+
+# サーキットブレーカーが開いている間の呼び出し
+class SwitchBotCircuitOpenError(SwitchBotError):
+    def __init__(self, message: str, reopen_at: float):
+        super().__init__(message)
+        self.reopen_at = reopen_at
+
+OFFLINE_STATUS_CODES = {161, 171}
+# 190: デバイス内部のエラー（時間をおけば成功することがある）
+RETRYABLE_STATUS_CODES = {190}
+
+# 連続失敗で開き，待ち時間が過ぎたら1回だけ試す
+class CircuitBreaker:
+    def __init__(self, threshold: int = SWITCHBOT_BREAKER_THRESHOLD,
+                 cooldown: float = SWITCHBOT_BREAKER_COOLDOWN,
+                 max_cooldown: float = SWITCHBOT_BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            now = time.monotonic()
+            if now < self.open_until:
+                raise SwitchBotCircuitOpenError(
+                    f"SwitchBot APIの呼び出しを{self.open_until - now:.0f}秒停止中です。", self.open_until
+                )
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self._open(self.cooldown)
+
+    # 回数に関係なくすぐに開く（waitがなければ既定の待ち時間）
+    def trip(self, wait: float = None):
+        with self.lock:
+            self._open(self.cooldown if wait is None else wait)
+
+    def _open(self, wait: float):
+        self.open_until = time.monotonic() + wait
+        # 開いた後の試行も失敗したら待ち時間を延ばす
+        self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+
+class SwitchBotClient:
+    def __init__(self, token: str, secret: str, api_base: str = SWITCHBOT_API_BASE,
+                 sign_ttl: float = SWITCHBOT_SIGN_TTL, timeout: float = SWITCHBOT_TIMEOUT,
+                 retries: int = SWITCHBOT_RETRIES, backoff: float = SWITCHBOT_BACKOFF,
+                 breaker: CircuitBreaker = None):
+        self.token = token
+        self.api_base = api_base.rstrip("/")
+        self.sign_ttl = sign_ttl
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        # 秘密鍵を読み込んだHMACを作っておき，署名ごとにcopyする
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._token_bytes = token.encode("utf-8")
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        })
+        # サーバーの時計とのずれ（秒）．Dateヘッダから求める
+        self.clock_offset = 0.0
+        self._signed = None
+        self._signed_at = 0.0
+        self.lock = threading.Lock()
+
+    # 署名付きヘッダ（sign_ttl秒の間は使い回す）
+    def auth_headers(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            if self._signed is not None and now - self._signed_at < self.sign_ttl:
+                return self._signed
+            t = str(int((time.time() + self.clock_offset) * 1000))
+            nonce = uuid.uuid4().hex
+            mac = self._mac.copy()
+            mac.update(self._token_bytes + t.encode() + nonce.encode())
+            self._signed = {"sign": base64.b64encode(mac.digest()).decode(), "t": t, "nonce": nonce}
+            self._signed_at = now
+            return self._signed
+
+    def invalidate_signature(self):
+        with self.lock:
+            self._signed = None
+
+    def _update_clock_offset(self, res):
+        date = res.headers.get("Date")
+        if not date:
+            return
+        try:
+            server = parsedate_to_datetime(date).timestamp()
+        except (TypeError, ValueError):
+            return
+        # Dateは秒単位なので1秒未満のずれは無視する
+        offset = server - time.time()
+        self.clock_offset = offset if abs(offset) > 1 else 0.0
+
+    # 1回のリクエスト．エラーは種類ごとの例外にする
+    def _request_once(self, method: str, path: str, **kwargs) -> dict:
+        try:
+            res = self.session.request(method, self.api_base + path, headers=self.auth_headers(),
+                                       timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise SwitchBotError(f"通信エラー: {e}", retryable=True) from e
+        self._update_clock_offset(res)
+
+        if res.status_code in (401, 403):
+            raise SwitchBotAuthError(f"認証エラー (HTTP {res.status_code})", res.status_code)
+        if res.status_code == 429:
+            retry_after = res.headers.get("Retry-After")
+            raise SwitchBotRateLimitError(
+                "API呼び出し回数の上限に達しました。", res.status_code,
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        if res.status_code >= 500:
+            raise SwitchBotError(f"サーバーエラー (HTTP {res.status_code})", res.status_code, retryable=True)
+        try:
+            data = res.json()
+        except ValueError as e:
+            raise SwitchBotError(f"不正な応答 (HTTP {res.status_code})", res.status_code) from e
+
+        code = data.get("statusCode")
+        if code == 100:
+            return data.get("body", {})
+        message = f"{data.get('message')} (statusCode {code})"
+        if code in OFFLINE_STATUS_CODES:
+            raise SwitchBotDeviceOfflineError(message, code)
+        raise SwitchBotError(message, code, retryable=code in RETRYABLE_STATUS_CODES)
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        self.breaker.check()
+        attempt = 0
+        refreshed = False
+        while True:
+            try:
+                body = self._request_once(method, path, **kwargs)
+            except SwitchBotAuthError:
+                # 使い回した署名が古くなった可能性があるので1回だけ作り直す
+                self.invalidate_signature()
+                if not refreshed:
+                    refreshed = True
+                    continue
+                self.breaker.failure()
+                raise
+            except SwitchBotRateLimitError as e:
+                # 上限に達したら指定時間（なければ既定の待ち時間）呼ばない
+                self.breaker.trip(e.retry_after)
+                raise
+            except SwitchBotDeviceOfflineError:
+                # APIは正常なのでブレーカーは開かない
+                self.breaker.success()
+                raise
+            except SwitchBotError as e:
+                if e.retryable and attempt < self.retries:
+                    attempt += 1
+                    logger.info("SwitchBot API 再試行 (%d/%d): %s", attempt, self.retries, e)
+                    time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+                    continue
+                self.breaker.failure()
+                raise
+            self.breaker.success()
+            return body
+
+    def device_status(self, device_id: str) -> dict:
+        return self.request("GET", f"/v1.1/devices/{device_id}/status")
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_config = None
+
+# 環境変数（モジュール変数）の設定でクライアントを作る．設定が変わったら作り直す
+def get_client() -> SwitchBotClient:
+    global _client, _client_config
+    config = (SWITCHBOT_TOKEN, SWITCHBOT_SECRET, SWITCHBOT_API_BASE)
+    if _client is None or config != _client_config:
+        _client = SwitchBotClient(SWITCHBOT_TOKEN, SWITCHBOT_SECRET, SWITCHBOT_API_BASE)
+        _client_config = config
+    return _client
+
+# 設定の再読み込み時に呼ばれる（次の呼び出しでクライアントを作り直す）
+def apply_config(config):
+    global SWITCHBOT_TOKEN, SWITCHBOT_SECRET, SWITCHBOT_DEVICE_ID
+    SWITCHBOT_TOKEN = config.switchbot.token or None
+    SWITCHBOT_SECRET = config.switchbot.secret or None
+    SWITCHBOT_DEVICE_ID = config.switchbot.device_id or None
+
+def close_client():
+    global _client, _client_config
+    if _client is not None:
+        _client.close()
+    _client = _client_config = None
 
 # 署名付きヘッダを作成
 def make_auth_headers(token: str, secret: str) -> dict:
-    t = str(int(time.time() * 1000))
-    nonce = uuid.uuid4().hex
-    string_to_sign = token + t + nonce
-    sign = base64.b64encode(
-        hmac.new(
-            secret.encode("utf-8"),
-            string_to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).digest()
-    ).decode("utf-8")
-    
-    return {
-        "Authorization": f"Bearer {token}",
-        "sign": sign,
-        "t": t,
-        "nonce": nonce,
-        "Content-Type": "application/json"
-    }
+    client = get_client() if (token, secret) == (SWITCHBOT_TOKEN, SWITCHBOT_SECRET) else SwitchBotClient(token, secret)
+    return {**client.session.headers, **client.auth_headers()}
 
 # ステータス情報を取得
 def get_meter_status() -> dict:
     if not (SWITCHBOT_TOKEN and SWITCHBOT_SECRET and SWITCHBOT_DEVICE_ID):
-        print("SwitchBot関連の環境変数が設定されていません。")
+        logger.warning("SwitchBot関連の環境変数が設定されていません。")
         return {}
-    
-    headers = make_auth_headers(SWITCHBOT_TOKEN, SWITCHBOT_SECRET)
-    url = f"https://api.switch-bot.com/v1.1/devices/{SWITCHBOT_DEVICE_ID}/status"
+
     try:
-        res = requests.get(url, headers=headers)
-        data = res.json()
-    except Exception as e:
-        print("SwitchBot API request error:", e)
-        return {}
-    
-    if data.get("statusCode") == 100:
-        return data.get("body", {})
-    else:
-        print("SwitchBot API Error:", data)
-        return {}
+        return get_client().device_status(SWITCHBOT_DEVICE_ID)
+    except SwitchBotCircuitOpenError as e:
+        logger.warning("SwitchBot API: %s", e)
+    except SwitchBotAuthError as e:
+        logger.error("SwitchBot API 認証エラー（トークン・シークレットを確認してください）: %s", e)
+    except SwitchBotRateLimitError as e:
+        logger.warning("SwitchBot API 呼び出し上限: %s", e)
+    except SwitchBotDeviceOfflineError as e:
+        logger.warning("SwitchBot 温湿度計がオフラインです: %s", e)
+    except SwitchBotError as e:
+        logger.warning("SwitchBot API Error: %s", e)
+    return {}
@@ -0,0 +1,214 @@
+"""
+ワーカープロセスとその監視
+
+    WORKER_MODE=1 のとき，ゲートウェイ（bot.py）がメール監視・温湿度計・描画を
+    別プロセスで起動し，Unixソケットのメッセージバス（message_bus.py）でやり取りする．
+    ワーカー単体では `python workers.py <mail|sensor|renderer>` で起動する．
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+
+import message_bus
+from config import ConfigService
+from log_pipeline import setup_logging
+
+logger = logging.getLogger("nlabot.worker")
+
+# 1でメール監視・温湿度計・描画を別プロセスで動かす
+WORKER_MODE = os.getenv("WORKER_MODE", "0") == "1"
+# 描画ワーカーの数（CPUのコア数まで増やせる）
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+# 異常終了したワーカーを再起動するまでの最長の待ち時間（秒）
+WORKER_RESTART_MAX = 60.0
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+# 有効な機能から起動するワーカーを決める
+def worker_names(subsystems) -> list:
+    names = []
+    if "gmail" in subsystems:
+        names.append("mail")
+    if "switchbot" in subsystems:
+        names.append("sensor")
+    names += ["renderer"] * RENDER_WORKERS
+    return names
+
+# ワーカーを子プロセスとして起動し，終了したら間隔を空けて再起動する
+class Supervisor:
+    def __init__(self, names: list, socket_path: str = message_bus.BUS_SOCKET):
+        self.names = names
+        self.socket_path = socket_path
+        self.procs = {}
+        self.tasks = []
+        self.stopping = False
+
+    async def start(self):
+        for i, name in enumerate(self.names):
+            self.tasks.append(asyncio.create_task(self._run(f"{name}-{i}", name)))
+
+    async def _run(self, key: str, role: str):
+        backoff = 1.0
+        env = {**os.environ, "BUS_SOCKET": self.socket_path}
+        while not self.stopping:
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT, role, env=env)
+            self.procs[key] = proc
+            logger.info("ワーカーを起動しました: %s (pid=%d)", key, proc.pid)
+            code = await proc.wait()
+            if self.stopping:
+                break
+            # しばらく動いていたなら待ち時間を戻す
+            if time.monotonic() - started > WORKER_RESTART_MAX:
+                backoff = 1.0
+            logger.warning("ワーカー %s が終了しました (code=%s)。%.0f秒後に再起動します。", key, code, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, WORKER_RESTART_MAX)
+
+    # SIGTERMを送り，timeout秒で終わらなければ強制終了する
+    async def stop(self, timeout: float = 10.0):
+        self.stopping = True
+        running = [proc for proc in self.procs.values() if proc.returncode is None]
+        for proc in running:
+            proc.terminate()
+        if running:
+            await asyncio.wait([asyncio.create_task(p.wait()) for p in running], timeout=timeout)
+            for proc in running:
+                if proc.returncode is None:
+                    logger.warning("ワーカーが時間内に終了しないため強制終了します (pid=%d)", proc.pid)
+                    proc.kill()
+        for task in self.tasks:
+            task.cancel()
+
+# --- ワーカープロセス ---
+
+# メール監視: 認証コードと処理済みのUIDをゲートウェイに送る
+async def run_mail(conn, welcome: dict, stop: asyncio.Event):
+    import gmail_detector
+
+    loop = asyncio.get_running_loop()
+    state = welcome.get("state") or {}
+    gmail_detector.restore_state(state)
+
+    # IMAPのスレッドから呼ばれる．バスが詰まっていれば送れるまで待つ
+    def sink(code: str, expires_at: float, cid: str):
+        asyncio.run_coroutine_threadsafe(
+            conn.send({"type": "code", "code": code, "expires_at": expires_at, "cid": cid}), loop
+        ).result()
+
+    gmail_detector.code_sink = sink
+    # 前回のUIDが無いときはIMAPに接続して調べるのでスレッドで呼ぶ
+    await asyncio.to_thread(gmail_detector.start_gmail_detector, None, 0, state.get("last_uid"))
+
+    # 再起動時に引き継ぐ状態は変わったときだけ送る
+    last = None
+    while True:
+        snapshot = gmail_detector.snapshot_state()
+        if snapshot != last and not conn.closed.is_set():
+            await conn.send({"type": "gmail_state", "state": snapshot})
+            last = snapshot
+        if stop.is_set() or conn.closed.is_set():
+            break
+        try:
+            await asyncio.wait_for(stop.wait(), 5)
+        except asyncio.TimeoutError:
+            pass
+    await asyncio.to_thread(gmail_detector.stop_gmail_detector)
+    if not conn.closed.is_set():
+        await conn.send({"type": "gmail_state", "state": gmail_detector.snapshot_state()})
+
+# 温湿度計: 要求を受けてSwitchBot APIを呼ぶ（再試行の待ちはこのプロセスで吸収する）
+def sensor_handler():
+    import switchbot
+
+    async def handle(conn, msg: dict, blob: bytes):
+        if msg.get("type") == "meter_status":
+            return {"data": await asyncio.to_thread(switchbot.get_meter_status)}, b""
+        raise message_bus.BusError(f"未知の要求です: {msg.get('type')}")
+    return handle
+
+# 描画: 表とグラフのPNGを返す
+def renderer_handler():
+    from meter_history import MeterHistory
+    from reservation_table import create_table_image
+
+    history = MeterHistory()
+
+    async def handle(conn, msg: dict, blob: bytes):
+        kind = msg.get("type")
+        if kind == "table":
+            buf = await asyncio.to_thread(create_table_image, msg["table"])
+            return {}, buf.getvalue()
+        if kind == "history_chart":
+            return {}, await asyncio.to_thread(history.chart, msg["device_id"], msg["period"], msg.get("now"))
+        raise message_bus.BusError(f"未知の要求です: {kind}")
+    return handle
+
+async def _no_events(conn, msg: dict, blob: bytes):
+    logger.warning("想定していない通知です: %s", msg.get("type"))
+
+async def worker_main(role: str) -> int:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # 設定ファイルはワーカーごとに監視する
+    config = ConfigService()
+    if role == "mail":
+        import gmail_detector
+        config.subscribe(gmail_detector.apply_config, "gmail")
+        handler, max_inflight = _no_events, 1
+    elif role == "sensor":
+        import switchbot
+        config.subscribe(switchbot.apply_config, "switchbot")
+        handler, max_inflight = sensor_handler(), 1
+    elif role == "renderer":
+        # matplotlibはスレッドセーフではないので1件ずつ描く
+        handler, max_inflight = renderer_handler(), 1
+    else:
+        logger.error("未知のワーカーです: %s", role)
+        return 2
+    config_task = asyncio.create_task(config.watch())
+
+    try:
+        conn, welcome = await message_bus.connect(role, handler, max_inflight=max_inflight)
+    except message_bus.BusError as e:
+        logger.error("%s", e)
+        return 1
+
+    if role == "mail":
+        await run_mail(conn, welcome, stop)
+    else:
+        closed = asyncio.create_task(conn.closed.wait())
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait([closed, stopped], return_when=asyncio.FIRST_COMPLETED)
+        closed.cancel()
+        stopped.cancel()
+
+    config_task.cancel()
+    if role == "sensor":
+        import switchbot
+        switchbot.close_client()
+    # ゲートウェイが止まったのでなければ異常終了として再起動させる
+    lost = conn.closed.is_set() and not stop.is_set()
+    if not conn.closed.is_set():
+        # 送信待ちを送り切ってから閉じる
+        while not conn.outbox.empty():
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.05)
+        conn.close()
+    return 1 if lost else 0
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("usage: python workers.py <mail|sensor|renderer>")
+    # ログファイルのローテーションはゲートウェイに任せ，ワーカーは標準出力に書く
+    setup_logging(log_file=None)
+    sys.exit(asyncio.run(worker_main(sys.argv[1])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+gatewayイベントの処理にかかるCPU時間とメモリをクライアントの設定ごとに比較する
+
+    python bench/bench_gateway.py --events 5000 --channels 200
+
+チャンネルの更新・メッセージ・入力中・リアクション・プレゼンスが流れ続けるギルドを想定し，
+どちらの設定にも同じイベント列をConnectionStateのパーサに通す．
+  dropped: 有効でないintentのため，実際のgatewayなら送られてこないイベントの数
+  retained_kib / cached_*: イベントを流した後にクライアントのキャッシュが保持しているもの
+"""
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps"))
+
+import discord
+
+from client_profile import client_options
+
+GUILD_ID = "1"
+SUBSYSTEMS = ["gmail", "switchbot", "reservations"]
+
+# イベントを受信するのに必要なintent
+EVENT_INTENTS = {
+    "CHANNEL_UPDATE": "guilds",
+    "MESSAGE_CREATE": "guild_messages",
+    "TYPING_START": "guild_typing",
+    "MESSAGE_REACTION_ADD": "guild_reactions",
+    "PRESENCE_UPDATE": "presences",
+}
+
+# 流すイベントの割合（この並びを繰り返す）
+EVENT_MIX = (
+    "MESSAGE_CREATE", "MESSAGE_CREATE", "TYPING_START", "MESSAGE_REACTION_ADD",
+    "PRESENCE_UPDATE", "PRESENCE_UPDATE", "CHANNEL_UPDATE",
+)
+
+def guild_payload(n_channels: int) -> dict:
+    return {
+        "id": GUILD_ID, "name": "bench", "owner_id": "9", "member_count": 5000,
+        "roles": [{"id": GUILD_ID, "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(100 + i), "type": 0, "name": f"ch{i}", "position": i,
+                      "permission_overwrites": []} for i in range(n_channels)],
+        "members": [], "emojis": [], "stickers": [], "features": [], "voice_states": [],
+        "presences": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+    }
+
+def user_payload(i: int) -> dict:
+    return {"id": str(5000 + i), "username": f"user{i}", "discriminator": "0", "avatar": None}
+
+def member_payload(i: int) -> dict:
+    return {"user": user_payload(i), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0}
+
+def make_events(n: int, n_channels: int, n_users: int = 500) -> list:
+    events = []
+    for i in range(n):
+        channel_id = str(100 + i % n_channels)
+        user = i % n_users
+        kind = EVENT_MIX[i % len(EVENT_MIX)]
+        if kind == "CHANNEL_UPDATE":
+            data = {"id": channel_id, "type": 0, "guild_id": GUILD_ID, "name": f"ch{i}",
+                    "position": i % n_channels, "permission_overwrites": []}
+        elif kind == "PRESENCE_UPDATE":
+            data = {"user": user_payload(user), "guild_id": GUILD_ID, "status": "online",
+                    "activities": [], "client_status": {"desktop": "online"}}
+        elif kind == "MESSAGE_CREATE":
+            data = {
+                "id": str(10**6 + i), "channel_id": channel_id, "guild_id": GUILD_ID,
+                "author": user_payload(user), "member": member_payload(user),
+                "content": "メッセージ本文" * 20, "timestamp": "2024-01-01T00:00:00+00:00",
+                "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+                "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0,
+            }
+        elif kind == "TYPING_START":
+            data = {"channel_id": channel_id, "guild_id": GUILD_ID, "user_id": str(5000 + user),
+                    "timestamp": 1700000000, "member": member_payload(user)}
+        else:
+            data = {"user_id": str(5000 + user), "channel_id": channel_id, "message_id": str(10**6 + i - 1),
+                    "guild_id": GUILD_ID, "emoji": {"id": None, "name": "👍"}, "member": member_payload(user),
+                    "burst": False, "type": 0}
+        events.append((kind, data))
+    return events
+
+# intentで届かなくなるイベントの数
+def count_dropped(intents: discord.Intents, events: list) -> int:
+    return sum(1 for kind, _ in events if not getattr(intents, EVENT_INTENTS[kind]))
+
+def feed(options: dict, guild: dict, events: list) -> discord.Client:
+    client = discord.Client(**options)
+    state = client._connection
+    state._add_guild_from_data(guild)
+    for kind, data in events:
+        state.parsers[kind](data)
+    return client
+
+async def measure(name: str, options: dict, args) -> dict:
+    guild = guild_payload(args.channels)
+    events = make_events(args.events, args.channels)
+
+    gc.collect()
+    t0 = time.process_time()
+    feed(options, guild, events)
+    cpu = time.process_time() - t0
+
+    # 処理後もクライアントが保持しているメモリ
+    gc.collect()
+    tracemalloc.start()
+    client = feed(options, guild, events)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    record = {
+        "bench": f"gateway.{name}",
+        "events": args.events,
+        "dropped": count_dropped(options["intents"], events),
+        "cpu_ms": round(cpu * 1000, 1),
+        "retained_kib": retained // 1024,
+        "peak_kib": peak // 1024,
+        "cached_messages": len(client.cached_messages),
+        "cached_members": sum(len(g.members) for g in client.guilds),
+        "cached_users": len(client.users),
+        "intents": options["intents"].value,
+    }
+    del client
+    return record
+
+async def run(args) -> list:
+    return [
+        await measure("default", client_options(SUBSYSTEMS, lean=False), args),
+        await measure("lean", client_options(SUBSYSTEMS, lean=True), args),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=200)
+    args = parser.parse_args()
+    for record in asyncio.run(run(args)):
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+
+if __name__ == "__main__":
+    main()
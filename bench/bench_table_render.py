@@ -0,0 +1,96 @@
+"""
+表描画バックエンド (matplotlib / Pillow) の速度と出力の比較
+
+    python bench/bench_table_render.py --rows 10 50 200 --repeat 5
+
+結果はJSON Linesで標準出力に出す．
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps"))
+
+from PIL import Image, ImageChops, ImageStat
+
+import reservation_table
+from reservation_table import (
+    TABLE_HEADER,
+    create_table_image_matplotlib,
+    create_table_image_pillow,
+)
+
+BACKENDS = {
+    "matplotlib": create_table_image_matplotlib,
+    "pillow": create_table_image_pillow,
+}
+
+GROUPS = ["IT研究会", "Gamma", "3DP研究会", "ボカロ同好会", "にゃんぱす", "漫研", "VRアート会", "北大なんでも研究同好会"]
+
+def make_table(n_rows: int) -> list:
+    table = [TABLE_HEADER]
+    for i in range(n_rows):
+        day = i % 28 + 1
+        hour = 9 + i % 10
+        table.append([
+            GROUPS[i % len(GROUPS)],
+            f"4月{day}日 ({reservation_table.WEEKDAYS[i % 7]}) ",
+            "大部屋",
+            f"{hour:02d}:00 - {hour + 2:02d}:00",
+        ])
+    return table
+
+def measure(render, table, repeat: int) -> dict:
+    # 1回目はフォント読み込みを含むので別に記録
+    t0 = time.perf_counter()
+    buf = render(table)
+    first = time.perf_counter() - t0
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        render(table)
+        samples.append(time.perf_counter() - t0)
+    return {"first_ms": first * 1000, "median_ms": statistics.median(samples) * 1000,
+            "min_ms": min(samples) * 1000, "image": Image.open(buf).convert("L")}
+
+# 2つの画像を同じ大きさに揃えて画素差を比較
+def compare(a: Image.Image, b: Image.Image) -> dict:
+    b_resized = b.resize(a.size)
+    diff = ImageChops.difference(a, b_resized)
+    ink = lambda img: sum(img.histogram()[:128]) / (img.width * img.height)
+    return {
+        "size_matplotlib": list(a.size),
+        "size_pillow": list(b.size),
+        "mean_abs_diff": ImageStat.Stat(diff).mean[0],
+        "ink_ratio_matplotlib": ink(a),
+        "ink_ratio_pillow": ink(b_resized),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", type=Path, help="描画結果のPNGを保存するディレクトリ")
+    args = parser.parse_args()
+
+    for n_rows in args.rows:
+        table = make_table(n_rows)
+        results = {name: measure(render, table, args.repeat) for name, render in BACKENDS.items()}
+        if args.save:
+            args.save.mkdir(parents=True, exist_ok=True)
+            for name, r in results.items():
+                r["image"].save(args.save / f"{name}_{n_rows}.png")
+
+        record = {"bench": "table_render", "rows": n_rows}
+        for name, r in results.items():
+            record[name] = {k: round(v, 3) for k, v in r.items() if k != "image"}
+        record["speedup"] = round(results["matplotlib"]["median_ms"] / results["pillow"]["median_ms"], 2)
+        record["pixels"] = compare(results["matplotlib"]["image"], results["pillow"]["image"])
+        print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
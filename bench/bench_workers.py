@@ -0,0 +1,119 @@
+"""
+描画をワーカープロセスに出したときのゲートウェイの応答性を比較する
+
+    python bench/bench_workers.py --charts 40 --renderers 2
+
+温湿度の履歴グラフを並行して描きながら，ゲートウェイのイベントループの遅れ（5msごとの
+sleepが予定より何ms遅れたか）と描画のスループットを測る．
+  inprocess: 従来どおり asyncio.to_thread で描く（GILを取り合う）
+  renderersN: Supervisorが起動したN個の描画ワーカーにメッセージバスで依頼する
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps"))
+
+WORKDIR = tempfile.mkdtemp(prefix="nlabot-bench-")
+os.environ["METER_DB_PATH"] = os.path.join(WORKDIR, "meter.db")
+os.environ["BUS_SOCKET"] = os.path.join(WORKDIR, "bus.sock")
+os.environ["CONFIG_PATH"] = os.path.join(WORKDIR, "config.toml")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import numpy as np
+
+from meter_history import HISTORY_RANGES, MeterHistory
+from message_bus import BusServer
+from workers import Supervisor
+
+DEVICE_ID = "BENCH"
+
+def seed_history() -> MeterHistory:
+    history = MeterHistory()
+    now = time.time()
+    ts = now - np.arange(30 * 24 * 60)[::-1] * 60
+    history.record_many(DEVICE_ID, zip(ts, 15 + 5 * np.sin(ts / 86400 * 2 * np.pi),
+                                       50 + 10 * np.cos(ts / 40000), np.full(ts.size, 90.0)))
+    return history
+
+# イベントループの遅れ（ms）を記録する
+async def lag_probe(samples: list, stop: asyncio.Event, interval: float = 0.005):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - t0 - interval) * 1000)
+
+def percentile(values: list, p: float) -> float:
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(len(s) * p / 100))], 2) if s else 0.0
+
+async def measure(name: str, render, n_charts: int, concurrency: int) -> dict:
+    periods = list(HISTORY_RANGES)
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(lag_probe(lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # キャッシュに当たらないよう描画する時刻を1日ずつずらす
+    now = time.time()
+
+    async def one(i: int):
+        async with semaphore:
+            await render(periods[i % len(periods)], now - i * 86400)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_charts)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    return {
+        "bench": f"workers.{name}",
+        "charts": n_charts,
+        "charts_per_s": round(n_charts / elapsed, 2),
+        "loop_lag_p50_ms": percentile(lags, 50),
+        "loop_lag_p99_ms": percentile(lags, 99),
+        "loop_lag_max_ms": round(max(lags), 2) if lags else 0.0,
+    }
+
+async def run(args) -> list:
+    history = seed_history()
+    history.chart(DEVICE_ID, "24h")  # フォント読み込みを除外
+
+    async def inprocess(period: str, now: float):
+        await asyncio.to_thread(history.chart, DEVICE_ID, period, now)
+
+    results = [await measure("inprocess", inprocess, args.charts, args.renderers)]
+
+    bus = BusServer()
+    await bus.start()
+    supervisor = Supervisor(["renderer"] * args.renderers, bus.path)
+    await supervisor.start()
+    while len(bus.workers.get("renderer", [])) < args.renderers:
+        await asyncio.sleep(0.1)
+    # フォント読み込みなど初回の描画を除外
+    for _ in range(args.renderers * 2):
+        await bus.request("renderer", {"type": "history_chart", "device_id": DEVICE_ID, "period": "24h"})
+
+    async def via_workers(period: str, now: float):
+        await bus.request("renderer", {"type": "history_chart", "device_id": DEVICE_ID, "period": period, "now": now})
+
+    results.append(await measure(f"renderers{args.renderers}", via_workers, args.charts, args.renderers))
+    await supervisor.stop()
+    await bus.close()
+    history.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--charts", type=int, default=40)
+    parser.add_argument("--renderers", type=int, default=2)
+    args = parser.parse_args()
+    for record in asyncio.run(run(args)):
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+
+if __name__ == "__main__":
+    main()
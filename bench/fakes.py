@@ -0,0 +1,352 @@
+"""
+ベンチマーク用のローカル代替サーバ・クライアント
+
+- FakeIMAPServer: 合成した「すべてのメール」を返す最小限のIMAP4rev1サーバ
+- FakeSwitchBotAPI: 遅延とエラーを注入できるSwitchBot API
+- FakeClient / RecordingChannel: 送信内容を記録するDiscordクライアントの代役
+- FakeInteraction: 応答までの時間を記録するInteractionの代役
+"""
+import asyncio
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- IMAP ---
+
+# 合成メール: ratioの割合でBambu Labの認証コードメールを混ぜる
+def make_mailbox(size: int, code_ratio: float = 0.05, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    now = time.time()
+    mails = []
+    for uid in range(1, size + 1):
+        msg = EmailMessage()
+        msg["From"] = "noreply@example.com"
+        msg["To"] = "n-lab@example.com"
+        msg["Message-ID"] = make_msgid(domain="bench.local")
+        msg["Date"] = formatdate(now - (size - uid))
+        if rng.random() < code_ratio:
+            code = f"{rng.randrange(1000000):06d}"
+            msg["Subject"] = "[Bambu Lab] Your verification code"
+            msg.set_content(f"<html><body><p>Your verification code is</p><b>{code}</b></body></html>", subtype="html")
+        else:
+            msg["Subject"] = f"Newsletter #{uid}"
+            msg.set_content("lorem ipsum " * rng.randrange(10, 200))
+        mails.append((uid, bytes(msg)))
+    return mails
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    def send_line(self, line: str):
+        self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.send_line("* OK [CAPABILITY IMAP4rev1] fake imap ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if server.latency:
+                time.sleep(server.latency)
+
+            if command == "CAPABILITY":
+                self.send_line("* CAPABILITY IMAP4rev1 AUTH=PLAIN")
+            elif command == "LOGIN":
+                pass
+            elif command in ("SELECT", "EXAMINE"):
+                uids = server.uids()
+                self.send_line("* FLAGS (\\Seen)")
+                self.send_line(f"* {len(uids)} EXISTS")
+                self.send_line("* 0 RECENT")
+                self.send_line("* OK [UIDVALIDITY 1] UIDs valid")
+                self.send_line(f"* OK [UIDNEXT {max(uids, default=0) + 1}] next")
+                self.send_line(f"{tag} OK [READ-WRITE] {command} completed")
+                continue
+            elif command == "UID":
+                sub, _, sub_args = args.partition(" ")
+                sub = sub.upper()
+                if sub == "SEARCH":
+                    self.send_line("* SEARCH " + " ".join(str(u) for u in server.uids()))
+                elif sub == "FETCH":
+                    self._fetch(sub_args)
+                else:
+                    self.send_line(f"{tag} BAD unsupported")
+                    continue
+            elif command == "LOGOUT":
+                self.send_line("* BYE")
+                self.send_line(f"{tag} OK LOGOUT completed")
+                return
+            elif command != "NOOP":
+                self.send_line(f"{tag} BAD unsupported")
+                continue
+            self.send_line(f"{tag} OK {command} completed")
+
+    def _fetch(self, args: str):
+        server = self.server
+        uid_set = args.split(" ", 1)[0]
+        wanted = set()
+        for part in uid_set.split(","):
+            if ":" in part:
+                lo, hi = part.split(":")
+                wanted.update(range(int(lo), int(hi) + 1 if hi != "*" else max(server.uids(), default=0) + 1))
+            else:
+                wanted.add(int(part))
+        for seq, (uid, body) in enumerate(server.mailbox, start=1):
+            if uid in wanted:
+                self.wfile.write(f"* {seq} FETCH (UID {uid} BODY[] {{{len(body)}}}\r\n".encode())
+                self.wfile.write(body)
+                self.wfile.write(b")\r\n")
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: list, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _IMAPHandler)
+        self.mailbox = mailbox
+        self.latency = latency
+
+    def uids(self) -> list:
+        return [uid for uid, _ in self.mailbox]
+
+    def append(self, body: bytes) -> int:
+        uid = max(self.uids(), default=0) + 1
+        self.mailbox.append((uid, body))
+        return uid
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+# --- SwitchBot ---
+
+class _SwitchBotHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        api = self.server
+        api.calls += 1
+        if api.latency:
+            time.sleep(api.latency + api.rng.random() * api.jitter)
+        if not re.fullmatch(r"/v1\.1/devices/[^/]+/status", self.path):
+            self._reply(404, {"message": "not found"})
+            return
+        if api.rng.random() < api.error_rate:
+            status, payload = api.rng.choice([
+                (500, {"message": "Internal Server Error"}),
+                (429, {"message": "Too Many Requests"}),
+                (200, {"statusCode": 161, "message": "device offline", "body": {}}),
+            ])
+            self._reply(status, payload)
+            return
+        self._reply(200, {"statusCode": 100, "message": "success", "body": api.reading()})
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class FakeSwitchBotAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 start_temp: float = 8.0, drift: float = 0.3, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _SwitchBotHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.temp = start_temp
+        self.drift = drift
+        self.calls = 0
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # ランダムウォークする温度
+    def reading(self) -> dict:
+        with self._lock:
+            self.temp += self.rng.uniform(-self.drift, self.drift)
+            return {
+                "deviceId": "BENCH",
+                "deviceType": "Meter",
+                "temperature": round(self.temp, 1),
+                "humidity": self.rng.randrange(30, 70),
+                "battery": 100,
+            }
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+# --- Discord ---
+
+class FakeAttachment:
+    def __init__(self, filename: str):
+        self.filename = filename
+
+class FakeMessage:
+    _ids = iter(range(1, 1 << 62))
+
+    def __init__(self, channel, content=None, attachments=()):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.attachments = list(attachments)
+        self.edits = 0
+
+    async def edit(self, content=None, attachments=None, **kwargs):
+        if content is not None:
+            self.content = content
+        if attachments is not None:
+            self.attachments = [
+                a if isinstance(a, FakeAttachment) else FakeAttachment(a.filename)
+                for a in attachments
+            ]
+        self.edits += 1
+        self.channel.record("edit", self.content, self.attachments)
+        return self
+
+    async def delete(self):
+        pass
+
+class RecordingChannel:
+    def __init__(self, channel_id: int, latency: float = 0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.records = []
+
+    def record(self, kind: str, content, attachments):
+        self.records.append({
+            "t": time.perf_counter(),
+            "kind": kind,
+            "content": content,
+            "files": [a.filename for a in attachments],
+        })
+
+    async def send(self, content=None, *, file=None, files=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        attachments = [FakeAttachment(f.filename) for f in ([file] if file else []) + list(files or [])]
+        self.record("send", content, attachments)
+        return FakeMessage(self, content, attachments)
+
+    async def history(self, limit=None):
+        return
+        yield
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+class FakeClient:
+    def __init__(self, loop: asyncio.AbstractEventLoop = None, latency: float = 0.0):
+        self.loop = loop
+        self.latency = latency
+        self.channels = {}
+        self.user = FakeUser(1)
+
+    def get_channel(self, channel_id: int) -> RecordingChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = RecordingChannel(channel_id, self.latency)
+        return channel
+
+    async def fetch_channel(self, channel_id: int) -> RecordingChannel:
+        return self.get_channel(channel_id)
+
+    def sent(self, channel_id: int = None) -> list:
+        channels = [self.channels[channel_id]] if channel_id is not None else self.channels.values()
+        return [r for ch in channels for r in ch.records]
+
+# 別スレッドでイベントループを回す（IMAPスレッドからcall_soon_threadsafeで投げる先）
+def start_background_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+# --- Interaction ---
+
+# 応答までの時間を記録する interaction.response の代役
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+        self.messages = []
+        self.modal = None
+        self.view = None
+        self.latency = None
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _mark(self):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to before")
+        self._done = True
+        self.latency = time.perf_counter() - self.interaction.created
+
+    async def send_message(self, content=None, *, view=None, ephemeral=False, **kwargs):
+        self._mark()
+        self.messages.append(content)
+        self.view = view
+
+    async def send_modal(self, modal):
+        self._mark()
+        self.modal = modal
+
+    async def defer(self, **kwargs):
+        self._mark()
+
+    async def edit_message(self, **kwargs):
+        self._mark()
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+class FakeInteraction:
+    def __init__(self, client, user_id: int, message: FakeMessage = None):
+        self.client = client
+        self.user = FakeUser(user_id)
+        self.message = message
+        self.created = time.perf_counter()
+        # interactions.interaction_handler が応答時間の計測に使う
+        self.created_at = datetime.now(timezone.utc)
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup()
+
+# Modalの入力欄に値を入れる（discord.pyが受信時に行う処理の代わり）
+def fill_modal(modal, values: list):
+    for item, value in zip(modal.children, values):
+        item._value = value
+
+# Selectで選択された状態にする
+def choose(select, value: str):
+    select._values = [value]
@@ -0,0 +1,284 @@
+"""
+予約操作の負荷試験
+
+    python bench/load_reservations.py --users 300 --concurrency 100
+
+多数のユーザーが同時に予約の追加・編集・削除を行う状況を，
+ReservationModal / ModifyReservationView / ReservationControlView を
+偽のInteractionで直接呼び出して再現する．
+DB操作の待ち時間，予約表の再描画回数，応答までの時間をJSON Linesで出力する．
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "apps"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import FakeClient, FakeInteraction, FakeMessage, choose, fill_modal
+from run_bench import _reservation_module, summarize
+
+# Discordのinteractionは3秒以内に応答しないと失敗する
+INTERACTION_DEADLINE = 3.0
+
+# --- sqlite接続の計測 ---
+
+class TimedCursor:
+    def __init__(self, cursor, conn):
+        self._cursor = cursor
+        self._conn = conn
+
+    def execute(self, *args):
+        with self._conn.timer():
+            self._cursor.execute(*args)
+        return self
+
+    def executemany(self, *args):
+        with self._conn.timer():
+            self._cursor.executemany(*args)
+        return self
+
+    def fetchall(self):
+        with self._conn.timer():
+            return self._cursor.fetchall()
+
+    def fetchone(self):
+        with self._conn.timer():
+            return self._cursor.fetchone()
+
+    def fetchmany(self, *args):
+        with self._conn.timer():
+            return self._cursor.fetchmany(*args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _Timer:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        if self.conn.active:
+            self.conn.overlaps += 1
+        self.conn.active += 1
+
+    def __exit__(self, *exc):
+        self.conn.active -= 1
+        self.conn.samples.append(time.perf_counter() - self.t0)
+
+# 共有のsqlite接続をラップして呼び出し時間と同時利用を数える
+class TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.samples = []
+        self.active = 0
+        self.overlaps = 0
+
+    def timer(self) -> _Timer:
+        return _Timer(self)
+
+    def cursor(self):
+        return TimedCursor(self._conn.cursor(), self)
+
+    def execute(self, *args):
+        with self.timer():
+            return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        with self.timer():
+            return self._conn.executemany(*args)
+
+    def commit(self):
+        with self.timer():
+            self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+# イベントループの遅延（DB操作や描画でループが止まった時間）
+async def monitor_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - t0 - interval))
+
+# --- 操作 ---
+
+def find_button(view, custom_id: str):
+    return next(item for item in view.children if getattr(item, "custom_id", None) == custom_id)
+
+def random_slot(rng: random.Random) -> tuple:
+    today = date.today()
+    # モーダルは現在の年で日付を解釈するので年をまたがないようにする
+    day = min(today + timedelta(days=rng.randrange(1, 60)), date(today.year, 12, 31))
+    hour = rng.randrange(8, 20)
+    return f"{day.month}/{day.day}", f"{hour}:00", f"{hour + 1}:30"
+
+async def op_create(rsv, client, user_id: int, rng: random.Random) -> list:
+    interaction = FakeInteraction(client, user_id)
+    modal = rsv.ReservationModal(mode="create", organization="IT研究会", room_type="大部屋")
+    fill_modal(modal, list(random_slot(rng)))
+    await modal.on_submit(interaction)
+    return [interaction]
+
+async def _select_own_reservation(rsv, client, user_id: int, rng: random.Random, custom_id: str) -> list:
+    interaction = FakeInteraction(client, user_id)
+    await find_button(client.control_view, custom_id).callback(interaction)
+    view = interaction.response.view
+    if view is None:
+        return [interaction], None
+
+    values = [o.value for o in view.select.options if o.value != "none"]
+    if not values:
+        return [interaction], None
+    choose(view.select, rng.choice(values))
+
+    channel = client.get_channel(rsv.BUTTON_CH_ID)
+    selected = FakeInteraction(client, user_id, message=FakeMessage(channel))
+    await view.select_callback(selected)
+    return [interaction, selected], selected
+
+async def op_edit(rsv, client, user_id: int, rng: random.Random) -> list:
+    interactions, selected = await _select_own_reservation(rsv, client, user_id, rng, "btn_edit")
+    if selected is None or selected.response.modal is None:
+        return interactions
+
+    modal = selected.response.modal
+    date_str, start, end = random_slot(rng)
+    # 団体名・部屋は既定値のまま，日付と時刻を変更
+    for item, value in zip(modal.children[2:], [date_str, start, end]):
+        item._value = value
+    submit = FakeInteraction(client, user_id)
+    await modal.on_submit(submit)
+    return interactions + [submit]
+
+async def op_delete(rsv, client, user_id: int, rng: random.Random) -> list:
+    interactions, _ = await _select_own_reservation(rsv, client, user_id, rng, "btn_delete")
+    return interactions
+
+OPERATIONS = {"create": op_create, "edit": op_edit, "delete": op_delete}
+
+# --- 実行 ---
+
+async def run(args, rsv) -> list:
+    from outbound import OutboundQueue
+
+    rng = random.Random(args.seed)
+    client = FakeClient(latency=args.discord_latency)
+    client.outbound = OutboundQueue(client, table_renderer=rsv.create_table_image)
+    client.control_view = rsv.ReservationControlView()
+    client.reservation_message = None
+
+    manager = rsv.reservation_manager
+    conn = manager.conn = TimedConnection(manager.conn)
+
+    # 書き込み回数と予約表の再描画回数
+    stats = {"writes": 0, "board_refreshes": 0}
+    board_samples = []
+    for name in ("add_reservation", "update_reservation", "delete_reservation"):
+        original = getattr(manager, name)
+        def counted(*a, _original=original, **kw):
+            stats["writes"] += 1
+            return _original(*a, **kw)
+        setattr(manager, name, counted)
+
+    update_board = rsv.update_reservation_message
+    async def counted_update(*a, **kw):
+        stats["board_refreshes"] += 1
+        t0 = time.perf_counter()
+        try:
+            await update_board(*a, **kw)
+        finally:
+            board_samples.append(time.perf_counter() - t0)
+    rsv.update_reservation_message = counted_update
+
+    lag_samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    e2e = {name: [] for name in OPERATIONS}
+    responses = []
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    names = list(OPERATIONS)
+    weights = [args.create_weight, args.edit_weight, args.delete_weight]
+
+    async def user(user_id: int):
+        nonlocal errors
+        user_rng = random.Random(rng.random())
+        for _ in range(args.ops_per_user):
+            name = user_rng.choices(names, weights)[0]
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    interactions = await OPERATIONS[name](rsv, client, user_id, user_rng)
+                except Exception as e:
+                    errors += 1
+                    print(f"{name} failed: {e!r}", file=sys.stderr)
+                    continue
+                e2e[name].append(time.perf_counter() - t0)
+                responses.extend(i.response.latency for i in interactions if i.response.latency is not None)
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(user(1000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - t_start
+
+    stop.set()
+    await monitor
+    try:
+        await client.outbound.drain(timeout=args.drain_timeout)
+    except asyncio.TimeoutError:
+        pass
+
+    results = [summarize(f"load.{name}", samples) for name, samples in e2e.items() if samples]
+    results.append(summarize(
+        "load.first_response", responses,
+        over_deadline=sum(1 for r in responses if r > INTERACTION_DEADLINE),
+    ))
+    results.append(summarize(
+        "load.sqlite", conn.samples,
+        total_s=round(sum(conn.samples), 3), overlapping_calls=conn.overlaps,
+    ))
+    results.append(summarize(
+        "load.board_refresh", board_samples,
+        writes=stats["writes"], refreshes=stats["board_refreshes"],
+        amplification=round(stats["board_refreshes"] / stats["writes"], 2) if stats["writes"] else None,
+        tiles_rendered=rsv.board_tiles.rendered_tiles,
+    ))
+    results.append(summarize(
+        "load.loop_lag", lag_samples,
+        users=args.users, concurrency=args.concurrency, elapsed_s=round(elapsed, 3),
+        errors=errors, log_messages_sent=len(client.sent(rsv.LOG_CH_ID)),
+        log_messages_pending=client.outbound.pending(),
+    ))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--ops-per-user", type=int, default=3)
+    parser.add_argument("--create-weight", type=float, default=0.6)
+    parser.add_argument("--edit-weight", type=float, default=0.2)
+    parser.add_argument("--delete-weight", type=float, default=0.2)
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="Discord APIの疑似遅延（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rsv = _reservation_module(tempfile.mkdtemp(prefix="nlabot-load-"))
+    for record in asyncio.run(run(args, rsv)):
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+
+if __name__ == "__main__":
+    main()
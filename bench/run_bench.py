@@ -0,0 +1,439 @@
+"""
+外部サービスに接続せずにBotの主要な処理を計測する
+
+    python bench/run_bench.py                       # 全シナリオ
+    python bench/run_bench.py --only gmail switchbot --iterations 200
+    python bench/run_bench.py --output bench_output.jsonl
+
+シナリオごとに1行のJSON (throughput_per_s, p50_ms, p99_ms など) を出力する．
+コミットごとに出力を残しておけば差分で性能の後退を確認できる．
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "apps"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import (
+    FakeClient,
+    FakeIMAPServer,
+    FakeSwitchBotAPI,
+    make_mailbox,
+    start_background_loop,
+)
+
+BENCH_CHANNEL_ID = 1000
+
+def percentile(sorted_samples: list, p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    k = max(0, min(len(sorted_samples) - 1, round(p / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[k]
+
+def summarize(name: str, samples: list, **extra) -> dict:
+    s = sorted(samples)
+    total = sum(s)
+    return {
+        "bench": name,
+        "n": len(s),
+        "throughput_per_s": round(len(s) / total, 2) if total else None,
+        "p50_ms": round(percentile(s, 50) * 1000, 3),
+        "p99_ms": round(percentile(s, 99) * 1000, 3),
+        "max_ms": round(s[-1] * 1000, 3) if s else 0.0,
+        **extra,
+    }
+
+def timed(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+# --- シナリオ ---
+
+def bench_gmail(args) -> list:
+    from imapclient import IMAPClient
+    import gmail_detector
+
+    mailbox = make_mailbox(args.mailbox_size, code_ratio=args.code_ratio)
+    server = FakeIMAPServer(mailbox, latency=args.imap_latency).start()
+    client = FakeClient(start_background_loop())
+
+    samples = []
+    with IMAPClient("127.0.0.1", port=server.port, ssl=False, use_uid=True) as imap:
+        imap.login("bench", "bench")
+        imap.select_folder("[Gmail]/すべてのメール")
+        for _ in range(args.iterations):
+            # 新着メールがnew_mails件ある状態から処理させる
+            gmail_detector.LAST_PROCESSED_UID = max(0, len(mailbox) - args.new_mails)
+            gmail_detector.notified_codes = gmail_detector.NotifiedCodeCache(gmail_detector.CODE_CACHE_SIZE)
+            t0 = time.perf_counter()
+            gmail_detector.fetch_latest_and_notify(imap, client, BENCH_CHANNEL_ID)
+            samples.append(time.perf_counter() - t0)
+    server.shutdown()
+    return [summarize("gmail.fetch_latest_and_notify", samples,
+                      mailbox_size=args.mailbox_size, new_mails=args.new_mails)]
+
+def bench_switchbot(args) -> list:
+    import switchbot
+
+    api = FakeSwitchBotAPI(latency=args.api_latency, jitter=args.api_latency / 2,
+                           error_rate=args.api_error_rate).start()
+    switchbot.SWITCHBOT_API_BASE = api.base_url
+    switchbot.SWITCHBOT_TOKEN = "bench-token"
+    switchbot.SWITCHBOT_SECRET = "bench-secret"
+    switchbot.SWITCHBOT_DEVICE_ID = "BENCH"
+
+    failures = 0
+    samples = []
+    for _ in range(args.iterations):
+        t0 = time.perf_counter()
+        if not switchbot.get_meter_status():
+            failures += 1
+        samples.append(time.perf_counter() - t0)
+    api.shutdown()
+    return [summarize("switchbot.get_meter_status", samples,
+                      failures=failures, api_calls=api.calls, error_rate=args.api_error_rate)]
+
+def bench_check_temperature(args) -> list:
+    os.environ.setdefault("DISABLE_SWITCHBOT", "0")
+    os.environ.setdefault("METER_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="nlabot-bench-"), "meter.db"))
+    os.environ.setdefault("TEMP_CHANNEL_ID", str(BENCH_CHANNEL_ID))
+    import switchbot
+    import bot as bot_module
+    from outbound import OutboundQueue
+
+    api = FakeSwitchBotAPI(latency=args.api_latency, drift=1.5).start()
+    switchbot.SWITCHBOT_API_BASE = api.base_url
+    switchbot.SWITCHBOT_TOKEN = "bench-token"
+    switchbot.SWITCHBOT_SECRET = "bench-secret"
+    switchbot.SWITCHBOT_DEVICE_ID = "BENCH"
+
+    fake = FakeClient()
+    instance = bot_module.bot
+    instance.get_channel = fake.get_channel
+
+    async def run():
+        instance.outbound = OutboundQueue(fake)
+        samples = []
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            await instance.check_temperature()
+            samples.append(time.perf_counter() - t0)
+        await instance.outbound.drain(timeout=30)
+        return samples
+
+    samples = asyncio.run(run())
+    api.shutdown()
+    return [summarize("bot.check_temperature", samples,
+                      alerts_sent=len(fake.sent()), api_calls=api.calls)]
+
+def bench_polling(args) -> list:
+    from datetime import datetime, timedelta
+
+    import polling
+    from alerts import build_default_engine
+    from scheduler import JST
+
+    # 冷え込む夜を模擬する: 18時から15℃で安定し，0時から1.5℃/時で下がって4℃で止まる
+    def temperature_at(t: datetime) -> float:
+        hours = (t - t.replace(hour=0, minute=0, second=0)).total_seconds() / 3600
+        return 15.0 if t.hour >= 18 else max(4.0, 15.0 - 1.5 * hours)
+
+    start = JST.localize(datetime(2026, 1, 1, 18, 0))
+    clock = [start]
+    original_now = polling.now_jst
+    polling.now_jst = lambda: clock[0]
+    try:
+        poller = polling.AdaptivePolling()
+        engine = build_default_engine(5.0)
+        threshold = engine.rules[0].threshold
+        calls = 0
+        near = []  # 閾値まで1℃未満で下がっているときの間隔
+        intervals = []
+        while clock[0] < start + timedelta(days=1):
+            temp = temperature_at(clock[0])
+            poller.record_call()
+            calls += 1
+            reading = {"temperature": temp}
+            engine.evaluate(reading, clock[0].timestamp())
+            interval = poller.next_interval(engine, reading)
+            intervals.append(interval)
+            if threshold < temp < threshold + 1 and temperature_at(clock[0] + timedelta(minutes=1)) < temp:
+                near.append(interval)
+            clock[0] += timedelta(seconds=interval)
+    finally:
+        polling.now_jst = original_now
+
+    # 閾値に向かって下がっているときは従来の固定間隔（180秒）より細かく見る
+    if not near or max(near) >= 180:
+        raise AssertionError(f"閾値付近の取得間隔が180秒以上です: {near}")
+    intervals.sort()
+    return [{
+        "bench": "polling.cold_night",
+        "api_calls": calls,
+        "daily_budget": poller.daily_budget,
+        "interval_p50_s": round(percentile(intervals, 50), 1),
+        "near_threshold_samples": len(near),
+        "near_threshold_min_interval_s": round(min(near), 1),
+        "near_threshold_max_interval_s": round(max(near), 1),
+    }]
+
+def _reservation_module(workdir: str):
+    # old_reservationはimport時にカレントディレクトリへDBを作る
+    os.chdir(workdir)
+    import old_reservation
+    return old_reservation
+
+def seed_reservations(manager, n: int, users: int = 50, rooms=("大部屋", "小部屋")) -> None:
+    from datetime import datetime, timedelta
+
+    base = datetime.now().replace(day=1, hour=9, minute=0, second=0, microsecond=0)
+    rows = []
+    for i in range(n):
+        start = base + timedelta(days=i // 6, hours=(i % 6) * 2)
+        end = start + timedelta(hours=2)
+        rows.append((
+            str(i % users), f"団体{i % 13}", rooms[i % len(rooms)],
+            start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S"),
+            base.strftime("%Y-%m-%d %H:%M:%S"),
+        ))
+    manager.conn.executemany('''
+        INSERT INTO reservations (user_id, group_name, room_type, start_datetime, end_datetime, created_at, notified)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    ''', rows)
+    manager.conn.commit()
+    # 直接INSERTしたので索引を読み込み直す
+    rows = manager._select_all()
+    manager.index.load(rows)
+    manager.occupancy.load(rows)
+
+def bench_reservations(args) -> list:
+    from datetime import datetime, timedelta
+
+    workdir = tempfile.mkdtemp(prefix="nlabot-bench-")
+    old_reservation = _reservation_module(workdir)
+    manager = old_reservation.ReservationManager(db_path=os.path.join(workdir, "bench.db"))
+    seed_reservations(manager, args.reservations)
+
+    now = datetime.now()
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end_of_time = datetime(9999, 12, 31, 23, 59, 59)
+    week_end = start_of_month + timedelta(days=7)
+
+    cases = {
+        "reservations.get_reservations_in_range(month)":
+            lambda: manager.get_reservations_in_range(start_of_month, end_of_time),
+        "reservations.get_reservations_in_range(week)":
+            lambda: manager.get_reservations_in_range(start_of_month, week_end),
+        "reservations.get_future_reservations(user)":
+            lambda: manager.get_future_reservations(user_id="7"),
+        "reservations.get_board_rows":
+            lambda: manager.get_board_rows(start_of_month, end_of_time),
+    }
+    return [summarize(name, timed(fn, args.iterations), reservations=args.reservations)
+            for name, fn in cases.items()]
+
+def bench_export(args) -> list:
+    import tracemalloc
+    from reservation_export import ExportFilter, export_reservations
+
+    workdir = tempfile.mkdtemp(prefix="nlabot-bench-")
+    old_reservation = _reservation_module(workdir)
+    db_path = os.path.join(workdir, "bench.db")
+    manager = old_reservation.ReservationManager(db_path=db_path)
+    seed_reservations(manager, args.reservations)
+
+    results = []
+    for fmt in ("csv", "jsonl"):
+        def export():
+            buf, _ = export_reservations(db_path, fmt, ExportFilter())
+            buf.close()
+        samples = timed(export, max(1, args.iterations // 20))
+        # 行数によらず一定になるはずのメモリ使用量
+        tracemalloc.start()
+        export()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(summarize(f"export.{fmt}", samples, reservations=args.reservations,
+                                 peak_kib=peak // 1024))
+    return results
+
+def bench_usage(args) -> list:
+    from datetime import datetime, timedelta
+    from occupancy import format_usage
+
+    workdir = tempfile.mkdtemp(prefix="nlabot-bench-")
+    old_reservation = _reservation_module(workdir)
+    manager = old_reservation.ReservationManager(db_path=os.path.join(workdir, "bench.db"))
+    seed_reservations(manager, args.reservations)
+
+    start = datetime.now().date().replace(day=1)
+    occupancy = manager.occupancy
+
+    # 比較用: 行ごとに日時を解析して使用時間を足し合わせる
+    def scan():
+        begin = datetime(start.year, start.month, start.day)
+        end = begin + timedelta(days=31)
+        used = {}
+        for row in manager.conn.execute("SELECT room_type, start_datetime, end_datetime FROM reservations"):
+            s = max(datetime.fromisoformat(row[1]), begin)
+            e = min(datetime.fromisoformat(row[2]), end)
+            if s < e:
+                used[row[0]] = used.get(row[0], 0) + (e - s).total_seconds()
+        return used
+
+    cases = {
+        "usage.scan(month)": scan,
+        "usage.utilization(month)": lambda: [occupancy.utilization(r, start, 31) for r in occupancy.rooms()],
+        "usage.format_usage(month)": lambda: format_usage(occupancy, occupancy.rooms(), start, 31),
+        "usage.free_slots(day)": lambda: occupancy.free_slots("大部屋", start, 60),
+    }
+    return [summarize(name, timed(fn, args.iterations), reservations=args.reservations)
+            for name, fn in cases.items()]
+
+def make_import_csv(n: int, rooms=("大部屋", "小部屋")) -> str:
+    from datetime import datetime, timedelta
+
+    base = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    lines = ["団体名,部屋,日付,開始,終了"]
+    for i in range(n):
+        start = base + timedelta(days=i // 6, hours=(i % 6) * 2)
+        lines.append(f"団体{i % 13},{rooms[i % len(rooms)]},{start:%Y/%m/%d},{start:%H:%M},{start + timedelta(hours=2):%H:%M}")
+    return "\n".join(lines)
+
+def bench_import(args) -> list:
+    from reservation_import import parse_csv, find_overlaps
+
+    workdir = tempfile.mkdtemp(prefix="nlabot-bench-")
+    old_reservation = _reservation_module(workdir)
+    text = make_import_csv(args.import_rows)
+
+    def prepare(i: int):
+        manager = old_reservation.ReservationManager(db_path=os.path.join(workdir, f"import{i}.db"))
+        rows, errors = parse_csv(text)
+        errors += find_overlaps(rows, manager.get_overlapping_reservations)
+        assert not errors, errors[:3]
+        return manager, [
+            ("0", r.group_name, r.room_type,
+             r.start_dt.strftime("%Y-%m-%d %H:%M:%S"), r.end_dt.strftime("%Y-%m-%d %H:%M:%S"))
+            for r in rows
+        ]
+
+    # 1件ずつコミットする従来の書き込みと1トランザクションでの書き込み
+    def one_by_one(manager, rows):
+        for row in rows:
+            manager.add_reservation(*row)
+
+    def bulk(manager, rows):
+        manager.add_reservations_bulk(rows)
+
+    results = []
+    for name, write in (("add_reservation", one_by_one), ("add_reservations_bulk", bulk)):
+        samples = []
+        for i in range(max(1, args.iterations // 20)):
+            t0 = time.perf_counter()
+            manager, rows = prepare(f"{name}{i}")
+            write(manager, rows)
+            samples.append(time.perf_counter() - t0)
+            manager.close()
+        results.append(summarize(f"import.{name}", samples, rows=args.import_rows))
+    return results
+
+def bench_table_render(args) -> list:
+    from reservation_table import create_table_image_matplotlib
+    from bench_table_render import make_table
+
+    results = []
+    for n_rows in args.table_rows:
+        table = make_table(n_rows)
+        create_table_image_matplotlib(table)  # フォント読み込みを除外
+        samples = timed(lambda: create_table_image_matplotlib(table), max(1, args.iterations // 10))
+        results.append(summarize("render.create_table_image_matplotlib", samples, rows=n_rows))
+    return results
+
+def bench_history_chart(args) -> list:
+    import numpy as np
+    from meter_history import HISTORY_RANGES, MeterHistory
+
+    history = MeterHistory(os.path.join(tempfile.mkdtemp(prefix="nlabot-bench-"), "meter.db"))
+    now = time.time()
+    # 30日分の1分ごとの測定値
+    ts = now - np.arange(30 * 24 * 60)[::-1] * 60
+    history.record_many("BENCH", zip(ts, 15 + 5 * np.sin(ts / 86400 * 2 * np.pi),
+                                     50 + 10 * np.cos(ts / 40000), np.full(ts.size, 90.0)))
+    history.chart("BENCH", "24h", now)  # フォント読み込みを除外
+
+    results = []
+    for range_name in HISTORY_RANGES:
+        def render():
+            history.charts.clear()
+            history.chart("BENCH", range_name, now)
+        samples = timed(render, max(1, args.iterations // 10))
+        cached = timed(lambda: history.chart("BENCH", range_name, now), args.iterations)
+        results.append(summarize(f"history.chart({range_name})", samples, readings=int(ts.size)))
+        results.append(summarize(f"history.chart({range_name}, cached)", cached))
+    history.close()
+    return results
+
+SCENARIOS = {
+    "gmail": bench_gmail,
+    "switchbot": bench_switchbot,
+    "check_temperature": bench_check_temperature,
+    "polling": bench_polling,
+    "reservations": bench_reservations,
+    "export": bench_export,
+    "import": bench_import,
+    "usage": bench_usage,
+    "table_render": bench_table_render,
+    "history_chart": bench_history_chart,
+}
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--output", type=Path, help="結果を追記するJSON Linesファイル")
+    parser.add_argument("--mailbox-size", type=int, default=5000)
+    parser.add_argument("--new-mails", type=int, default=10)
+    parser.add_argument("--code-ratio", type=float, default=0.05)
+    parser.add_argument("--imap-latency", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--reservations", type=int, default=2000)
+    parser.add_argument("--import-rows", type=int, default=500)
+    parser.add_argument("--table-rows", type=int, nargs="+", default=[10, 100])
+    args = parser.parse_args()
+
+    meta = {"revision": git_revision(), "timestamp": int(time.time())}
+    out = open(args.output, "a", encoding="utf-8") if args.output else None
+    try:
+        for name in args.only:
+            for record in SCENARIOS[name](args):
+                line = json.dumps({**record, **meta}, ensure_ascii=False)
+                print(line, flush=True)
+                if out:
+                    out.write(line + "\n")
+    finally:
+        if out:
+            out.close()
+
+if __name__ == "__main__":
+    main()